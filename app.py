@@ -14,10 +14,11 @@ from pptx import Presentation
 from io import BytesIO
 import base64
 from pathlib import Path
-from employee_database import EmployeeDatabase
+from employee_database import EmployeeDatabase, DEPARTMENTS
 from query_processor import QueryProcessor
 from rag_query_system import rag_system
 import time
+import uuid
 
 # Custom CSS for branding and layout
 CUSTOM_CSS = """
@@ -1583,6 +1584,9 @@ def load_employee_data():
     progress_placeholder = st.empty()
     progress_bar = progress_placeholder.progress(0)
     
+    # Reconcile profile files, index and vector collections before loading
+    st.session_state.employee_db.check_consistency(vector_store=st.session_state.vector_store)
+
     # Reload employee profiles into the vector store
     employees = st.session_state.employee_db.get_all_employees()
     total_employees = len(employees)
@@ -1767,8 +1771,13 @@ def individual_profile_ui():
                     # Combine with remaining docs to provide context
                     context_chunks = relevant_chunks
                     
-                    # Generate answer
-                    answer = profile_generator.answer_question(context_chunks, st.session_state.user_question)
+                    # Stream the answer as it is generated; the formatted version is shown below
+                    stream_placeholder = st.empty()
+                    with stream_placeholder.container():
+                        answer = st.write_stream(
+                            profile_generator.stream_answer_question(context_chunks, st.session_state.user_question)
+                        )
+                    stream_placeholder.empty()
                     st.session_state.question_answer = answer
         
         # Display the answer if available
@@ -1885,6 +1894,8 @@ def employee_database_ui():
         
         # Search input
         search_query = st.text_input("Enter your search query:", key="employee_search_query")
+        ai_summary = st.checkbox("Add an AI-written summary of the results", value=False,
+                                 help="The summary is written in the background and appears once ready")
         
         # Initialize search_results in session state if not present
         if 'search_results' not in st.session_state:
@@ -1897,29 +1908,24 @@ def employee_database_ui():
         if st.button("Search"):
             if search_query:
                 with st.spinner("Searching employees..."):
-                    # Parse the query
-                    parsed_query = st.session_state.query_processor.parse_query(search_query)
-                    
-                    # Convert to filters
-                    filters = st.session_state.query_processor.convert_to_filters(parsed_query)
-                    
-                    # Execute search
-                    results = vector_store.search_employees(search_query, filters)
+                    # Parse the query and search concurrently, then filter and explain
+                    processed_results = st.session_state.query_processor.search(
+                        search_query, vector_store, enrich_with_llm=ai_summary
+                    )
+                    print(f"DEBUG: Query parsed by {processed_results['parsed_query'].get('parser', 'llm')}, "
+                          f"timings: {processed_results['timings']}, "
+                          f"stats: {st.session_state.query_processor.get_parse_stats()}")
                     
-                    # Process and display results
-                    if results:
-                        processed_results = st.session_state.query_processor.process_search_results(
-                            results, search_query, parsed_query
-                        )
-                        
-                        # Store results in session
+                    # Store results in session
+                    if processed_results["count"] > 0:
                         st.session_state.search_results = processed_results
                     
         # Display search results if available in session state
         if st.session_state.search_results is not None:
             # Display explanation
             st.markdown("### Search Results")
-            st.markdown(f"*{st.session_state.search_results['explanation']}*")
+            explanation_placeholder = st.empty()
+            explanation_placeholder.markdown(f"*{st.session_state.search_results['explanation']}*")
             
             # Display employee cards with expanded functionality
             if st.session_state.search_results["count"] > 0:
@@ -2075,8 +2081,13 @@ def employee_database_ui():
                                         else:
                                             context_chunks = relevant_chunks
                                         
-                                        # Generate answer
-                                        answer = profile_generator.answer_question(context_chunks, employee_question)
+                                        # Stream the answer as it is generated; the formatted version is shown below
+                                        stream_placeholder = st.empty()
+                                        with stream_placeholder.container():
+                                            answer = st.write_stream(
+                                                profile_generator.stream_answer_question(context_chunks, employee_question)
+                                            )
+                                        stream_placeholder.empty()
                                         
                                         # Store answer in the centralized employee_answers dict
                                         st.session_state.employee_answers[employee_id] = answer
@@ -2125,6 +2136,16 @@ def employee_database_ui():
                         st.markdown('</div>', unsafe_allow_html=True)
             else:
                 st.markdown("No matching employees found.")
+
+            # Swap in the AI-written summary once it is ready (the cards are already rendered)
+            explanation_future = st.session_state.search_results.get("explanation_future")
+            if explanation_future is not None:
+                try:
+                    st.session_state.search_results["explanation"] = explanation_future.result(timeout=30)
+                    explanation_placeholder.markdown(f"*{st.session_state.search_results['explanation']}*")
+                except Exception as e:
+                    print(f"DEBUG: AI summary failed, keeping template explanation: {str(e)}")
+                st.session_state.search_results["explanation_future"] = None
         else:
             if search_query:  # Only show this message if user has searched
                 st.markdown("No results found. Try a different query or add more employees to the database.")
@@ -2167,10 +2188,15 @@ def employee_database_ui():
         #         "employee_focus_mode": focus_mode,
         #         "enable_context_tracking": enable_context
         #     }
-        #     rag_system.update_conversation_settings(new_settings)
+        #     rag_system.update_conversation_settings(new_settings, st.session_state.conversation_id)
+
+        # Each browser session has its own conversation in the RAG system
+        if 'conversation_id' not in st.session_state:
+            st.session_state.conversation_id = uuid.uuid4().hex
+        conversation = rag_system.get_conversation(st.session_state.conversation_id)
         
         # === Enhanced Conversation Status Display ===
-        conversation_insights = rag_system.get_conversation_insights()
+        conversation_insights = rag_system.get_conversation_insights(st.session_state.conversation_id)
         
         # Commenting out the status display - HIDDEN BY USER REQUEST
         # if conversation_insights.get("status") != "no_conversation":
@@ -2203,15 +2229,15 @@ def employee_database_ui():
         #     
         #     with col4:
         #         if st.button("🗑️ Clear", help="Start fresh conversation", key="clear_conv"):
-        #             rag_system.clear_conversation_history()
+        #             rag_system.clear_conversation_history(st.session_state.conversation_id)
         #             st.success("Conversation cleared!")
         #             st.rerun()
         
         # === Enhanced Conversation History ===
         if conversation_insights.get("status") != "no_conversation":
             with st.expander(f"💬 Conversation History ({conversation_insights['conversation_length']} exchanges)", expanded=False):
-                if hasattr(rag_system, 'conversation_history') and rag_system.conversation_history:
-                    for i, entry in enumerate(rag_system.conversation_history[-5:], 1):  # Show last 5
+                if conversation.conversation_history:
+                    for i, entry in enumerate(list(conversation.conversation_history)[-5:], 1):  # Show last 5
                         col_q, col_a = st.columns([1, 2])
                         
                         with col_q:
@@ -2239,9 +2265,9 @@ def employee_database_ui():
                         st.markdown(f"• **{emp_name}** ({frequency} mentions)")
                     
                     # Show current context with relevance scores
-                    if hasattr(rag_system, 'context_employees') and rag_system.context_employees:
+                    if conversation.context_employees:
                         st.markdown("**Current context employees:**")
-                        for emp in rag_system.context_employees[:8]:  # Show top 8
+                        for emp in conversation.context_employees.top(8):  # Show top 8
                             if isinstance(emp, dict):
                                 score_bar = "🟩" * int(emp["relevance_score"] * 5) + "⬜" * (5 - int(emp["relevance_score"] * 5))
                                 st.markdown(f"• {emp['name']} {score_bar} ({emp['relevance_score']:.1f})")
@@ -2274,8 +2300,7 @@ def employee_database_ui():
             else:
                 st.markdown("**Smart follow-up suggestions based on your conversation:**")
                 theme = conversation_insights.get("conversation_theme", "general")
-                context_employees = [emp["name"] if isinstance(emp, dict) else emp 
-                                   for emp in rag_system.context_employees[:3]]
+                context_employees = conversation.context_employees.names(3)
                 
                 if context_employees and len(context_employees) >= 2:
                     examples = {
@@ -2314,11 +2339,11 @@ def employee_database_ui():
         st.markdown("**Enter your HR analytics question:**")
         
         # Show context hints
-        if hasattr(rag_system, 'context_employees') and rag_system.context_employees:
-            context_names = [emp["name"] if isinstance(emp, dict) else emp for emp in rag_system.context_employees[:3]]
+        if conversation.context_employees:
+            context_names = conversation.context_employees.names(3)
             hint_text = f"💡 *You can refer to: {', '.join(context_names)}"
-            if len(rag_system.context_employees) > 3:
-                hint_text += f" and {len(rag_system.context_employees) - 3} others"
+            if len(conversation.context_employees) > 3:
+                hint_text += f" and {len(conversation.context_employees) - 3} others"
             hint_text += " using 'them', 'between them', 'those employees', etc.*"
             st.markdown(hint_text)
         
@@ -2375,22 +2400,29 @@ def employee_database_ui():
         
         if st.button("🔍 Analyze", key="intelligent_query_submit", type="primary"):
             if intelligent_query:
-                with st.spinner("🧠 Processing with intelligent context management..."):
-                    try:
+                try:
+                    with st.spinner("🧠 Processing with intelligent context management..."):
                         # Clear the input after submission
                         st.session_state.intelligent_query_input = ""
                         
                         # Use the RAG system for intelligent analysis with automatic query type detection
-                        result = rag_system.process_complex_query(
+                        streamed = rag_system.stream_complex_query(
                             query=intelligent_query,
-                            context_type="general_analysis"  # Let the system auto-detect the appropriate type
+                            context_type="general_analysis",  # Let the system auto-detect the appropriate type
+                            conversation_id=st.session_state.conversation_id
                         )
-                        
-                        st.session_state.intelligent_query_results = result
-                        
-                    except Exception as e:
-                        st.error(f"Analysis failed: {str(e)}")
-                        print(f"RAG query error: {e}")
+
+                    # Show the response as it is generated; the formatted version is shown below
+                    stream_placeholder = st.empty()
+                    with stream_placeholder.container():
+                        st.write_stream(streamed)
+                    stream_placeholder.empty()
+
+                    st.session_state.intelligent_query_results = streamed.result
+
+                except Exception as e:
+                    st.error(f"Analysis failed: {str(e)}")
+                    print(f"RAG query error: {e}")
         
         # === Enhanced Results Display === (HIDDEN BY USER REQUEST)
         # if st.session_state.intelligent_query_results:
@@ -2556,7 +2588,7 @@ def employee_database_ui():
         # Department selection
         department = st.selectbox(
             "Department:", 
-            options=["Engineering", "Marketing", "Sales", "Product", "Design", "HR", "Finance", "Operations", "Other"],
+            options=DEPARTMENTS + ["Other"],
             key="department_select"
         )
         
@@ -0,0 +1,125 @@
+from typing import List, Dict, Any, Optional
+
+# Priority tiers of context chunks, most important first
+TIER_GUIDELINES = "guidelines"  # Interpretation documents
+TIER_QUERY = "query_context"  # Employees the query refers to
+TIER_CONVERSATION = "conversation"  # High-relevance employees from earlier turns
+TIER_SEARCH = "search"  # Employees found by semantic search
+TIER_GENERAL = "general"  # Fallback chunks from the document store
+TIER_STATISTICS = "statistics"  # Workforce statistics (added outside the packing budget)
+
+TIER_WEIGHTS = {
+    TIER_GUIDELINES: 2.0,
+    TIER_QUERY: 3.0,
+    TIER_CONVERSATION: 2.0,
+    TIER_SEARCH: 1.0,
+    TIER_GENERAL: 0.5,
+    TIER_STATISTICS: 3.0
+}
+
+# Relative value of the kinds of section in an employee's context
+SECTION_WEIGHTS = {
+    "profile": 1.0,
+    "enhanced": 0.9,
+    "metadata": 0.6,
+    "document": 0.8,
+    "statistics": 1.0
+}
+
+# Share of the budget a single employee may take while other chunks still fit
+MAX_EMPLOYEE_SHARE = 0.35
+
+class ContextChunk:
+    """A piece of prompt context with what the packer needs to rank it."""
+
+    def __init__(self, text: str, tokens: int, tier: str, section_type: str = "document",
+                 relevance: float = 1.0, employee_id: Optional[str] = None,
+                 section: Optional[str] = None):
+        """
+        Args:
+            text: Text injected into the prompt
+            tokens: Token count of the text
+            tier: Priority tier (one of the TIER_* constants)
+            section_type: Kind of section (a SECTION_WEIGHTS key)
+            relevance: Relevance of the chunk's source, 0..1
+            employee_id: Employee the chunk describes, if any
+            section: Profile section the chunk comes from, if any
+        """
+        self.text = text
+        self.tokens = tokens
+        self.tier = tier
+        self.section_type = section_type
+        self.relevance = relevance
+        self.employee_id = employee_id
+        self.section = section
+
+    @property
+    def value(self) -> float:
+        return self.relevance * TIER_WEIGHTS.get(self.tier, 1.0) * SECTION_WEIGHTS.get(self.section_type, 1.0)
+
+    def __repr__(self) -> str:
+        return (f"ContextChunk({self.tier}, {self.section_type}, employee={self.employee_id}, "
+                f"section={self.section}, tokens={self.tokens})")
+
+def pack_context(chunks: List[ContextChunk], budget: int,
+                 max_employee_share: float = MAX_EMPLOYEE_SHARE) -> List[ContextChunk]:
+    """
+    Choose the chunks that give the most value within a token budget.
+
+    This is a knapsack problem; chunks are taken greedily by value per token,
+    first with each employee limited to max_employee_share of the budget so a
+    single long profile cannot crowd out everyone else, then without the cap
+    to use any budget left over. As in the standard greedy approximation, the
+    single most valuable chunk that fits is used instead if it beats the
+    greedy selection on its own.
+
+    Args:
+        chunks: Candidate chunks in presentation order
+        budget: Maximum total tokens
+        max_employee_share: Per-employee share of the budget in the first pass
+
+    Returns:
+        The selected chunks, in their original order
+    """
+    if sum(chunk.tokens for chunk in chunks) <= budget:
+        return list(chunks)
+
+    ranked = sorted(range(len(chunks)),
+                    key=lambda i: chunks[i].value / max(chunks[i].tokens, 1), reverse=True)
+    employee_cap = max_employee_share * budget
+
+    selected = set()
+    used_tokens = 0
+    employee_tokens: Dict[str, int] = {}
+    for capped in (True, False):
+        for i in ranked:
+            chunk = chunks[i]
+            if i in selected or used_tokens + chunk.tokens > budget:
+                continue
+            if capped and chunk.employee_id is not None:
+                if employee_tokens.get(chunk.employee_id, 0) + chunk.tokens > employee_cap:
+                    continue
+            selected.add(i)
+            used_tokens += chunk.tokens
+            if chunk.employee_id is not None:
+                employee_tokens[chunk.employee_id] = employee_tokens.get(chunk.employee_id, 0) + chunk.tokens
+
+    fitting = [i for i in range(len(chunks)) if chunks[i].tokens <= budget]
+    if fitting:
+        best_single = max(fitting, key=lambda i: chunks[i].value)
+        if chunks[best_single].value > sum(chunks[i].value for i in selected):
+            selected = {best_single}
+
+    return [chunks[i] for i in sorted(selected)]
+
+def summarize_packing(chunks: List[ContextChunk], packed: List[ContextChunk]) -> Dict[str, Any]:
+    """Counts describing what pack_context kept, for debug output."""
+    packed_ids = {id(chunk) for chunk in packed}
+    dropped = [chunk for chunk in chunks if id(chunk) not in packed_ids]
+    return {
+        "kept": len(packed),
+        "dropped": len(dropped),
+        "kept_tokens": sum(chunk.tokens for chunk in packed),
+        "dropped_tokens": sum(chunk.tokens for chunk in dropped),
+        "employees": len({chunk.employee_id for chunk in packed if chunk.employee_id is not None})
+    }
@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable
+from conversation_state import ConversationState
+
+# Target length of a conversation's rolling summary
+SUMMARY_MAX_TOKENS = 300
+
+# Characters of each evicted answer shown to the summarizer
+SUMMARY_ANSWER_CHARS = 1200
+
+class ConversationSummarizer:
+    """
+    Folds turns evicted from a conversation's history into its rolling summary.
+
+    Evicted turns wait in state.pending_summary until a background job has
+    merged them into state.summary, so summarizing never delays a response.
+    At most one job runs per conversation; turns evicted while it runs are
+    picked up by a follow-up job.
+    """
+
+    def __init__(self, client, count_tokens: Callable[[str], int],
+                 model: str = "gpt-4.1-2025-04-14", max_tokens: int = SUMMARY_MAX_TOKENS):
+        """
+        Args:
+            client: OpenAI client
+            count_tokens: Token counter for the summary text
+            model: Model used for summarizing
+            max_tokens: Target summary length
+        """
+        self.client = client
+        self.count_tokens = count_tokens
+        self.model = model
+        self.max_tokens = max_tokens
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-summary")
+
+    def schedule(self, state: ConversationState):
+        """Start a summary job for the conversation's pending turns (call with state.lock held)."""
+        if state.summary_job is not None or not state.pending_summary:
+            return
+        entries = list(state.pending_summary)
+        state.summary_job = self.executor.submit(
+            self._run, state, state.memory_generation, state.summary, entries
+        )
+
+    def _run(self, state: ConversationState, generation: int, previous_summary: str,
+             entries: List[Dict[str, Any]]):
+        try:
+            summary = self.summarize(previous_summary, entries)
+        except Exception as e:
+            print(f"DEBUG: Conversation summary failed, keeping question list instead: {str(e)}")
+            summary = self._fallback_summary(previous_summary, entries)
+
+        with state.lock:
+            if state.memory_generation != generation:
+                # The conversation was cleared while summarizing
+                return
+            state.summary_job = None
+            state.summary = summary
+            state.summary_tokens = self.count_tokens(summary)
+            for _ in entries:
+                state.pending_summary.popleft()
+            self.schedule(state)
+
+    def summarize(self, previous_summary: str, entries: List[Dict[str, Any]]) -> str:
+        """
+        Merge turns into a summary with the LLM.
+
+        Args:
+            previous_summary: Summary of the turns before these ("" for none)
+            entries: Conversation history entries, oldest first
+
+        Returns:
+            The new summary
+        """
+        turns = "\n\n".join(
+            f"Q: {entry['original_query']}\nA: {entry['response'][:SUMMARY_ANSWER_CHARS]}"
+            for entry in entries
+        )
+        prompt = f"""Update the running summary of an HR analytics conversation with the exchanges below.
+
+Keep the employees discussed, the conclusions and recommendations reached, and any open questions. Drop pleasantries and repeated details. Write at most {self.max_tokens} tokens of plain text.
+
+CURRENT SUMMARY:
+{previous_summary or "(none yet)"}
+
+EXCHANGES TO ADD:
+{turns}"""
+
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.2,
+            max_tokens=self.max_tokens
+        )
+        return response.choices[0].message.content.strip()
+
+    def _fallback_summary(self, previous_summary: str, entries: List[Dict[str, Any]]) -> str:
+        """Summary without the LLM: the earlier questions, newest kept within the token target."""
+        lines = [line for line in previous_summary.split("\n") if line]
+        lines.extend(f"- Earlier question: {entry['original_query']}" for entry in entries)
+        while len(lines) > 1 and self.count_tokens("\n".join(lines)) > self.max_tokens:
+            lines.pop(0)
+        return "\n".join(lines)
@@ -0,0 +1,252 @@
+import heapq
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import List, Dict, Any, Optional, Iterator
+
+# Defaults for the user-configurable conversation settings
+DEFAULT_CONVERSATION_SETTINGS = {
+    "enable_context_tracking": True,
+    "max_conversation_memory": "adaptive",  # "adaptive", "short", "medium", "long"
+    "employee_focus_mode": "adaptive",  # "narrow", "adaptive", "broad"
+    "include_conversation_hints": True
+}
+
+# Context employee relevance halves after this long without a mention
+CONTEXT_RELEVANCE_HALF_LIFE_SECONDS = 3600
+
+# Context employees at or below this relevance are dropped
+MIN_CONTEXT_RELEVANCE = 0.15
+
+# Bounds of the conversation store
+MAX_CONVERSATIONS = 500
+IDLE_TIMEOUT_SECONDS = 2 * 3600
+
+class ContextEmployeeStore:
+    """
+    A conversation's context employees with relevance scores.
+
+    Scores decay exponentially with the time since they were last set. The
+    decay is applied lazily: an entry keeps the score it had at `updated_at`,
+    and because every score decays at the same rate, ordering by
+    log(score) + rate * updated_at does not change as time passes. A min-heap
+    on that key finds the least relevant employee in O(log n) (superseded heap
+    items are skipped when they surface), lookups by name are dictionary
+    accesses and top(k) is a partial selection instead of a full sort.
+    """
+
+    def __init__(self, half_life_seconds: float = CONTEXT_RELEVANCE_HALF_LIFE_SECONDS,
+                 min_score: float = MIN_CONTEXT_RELEVANCE):
+        self._rate = math.log(2) / half_life_seconds
+        self.min_score = min_score
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._heap: List[tuple] = []  # (order key, version, name)
+        self._versions = 0
+
+    def _order_key(self, entry: Dict[str, Any]) -> float:
+        return math.log(max(entry["relevance_score"], 1e-12)) + self._rate * entry["updated_at"]
+
+    def _score_at(self, entry: Dict[str, Any], now: float) -> float:
+        return entry["relevance_score"] * math.exp(-self._rate * (now - entry["updated_at"]))
+
+    def _set_score(self, entry: Dict[str, Any], score: float, now: float):
+        entry["relevance_score"] = score
+        entry["updated_at"] = now
+        self._versions += 1
+        entry["version"] = self._versions
+        heapq.heappush(self._heap, (self._order_key(entry), self._versions, entry["name"]))
+
+        # Superseded items only accumulate through updates; rebuild once they dominate
+        if len(self._heap) > 2 * len(self._entries) + 16:
+            self._heap = [(self._order_key(e), e["version"], name) for name, e in self._entries.items()]
+            heapq.heapify(self._heap)
+
+    def _is_current(self, item: tuple) -> bool:
+        entry = self._entries.get(item[2])
+        return entry is not None and entry["version"] == item[1]
+
+    def _pop_least_relevant(self) -> Optional[Dict[str, Any]]:
+        while self._heap:
+            item = heapq.heappop(self._heap)
+            if self._is_current(item):
+                return self._entries.pop(item[2])
+        return None
+
+    def _least_relevant(self) -> Optional[Dict[str, Any]]:
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._entries[self._heap[0][2]] if self._heap else None
+
+    def _prune(self, now: float):
+        """Drop employees whose decayed score reached min_score."""
+        while True:
+            entry = self._least_relevant()
+            if entry is None or self._score_at(entry, now) > self.min_score:
+                return
+            self._pop_least_relevant()
+
+    def _snapshot(self, entry: Dict[str, Any], now: float) -> Dict[str, Any]:
+        return {
+            "name": entry["name"],
+            "relevance_score": self._score_at(entry, now),
+            "source": entry["source"],
+            "first_mentioned": entry["first_mentioned"],
+            "query_types": list(entry["query_types"])
+        }
+
+    def __len__(self) -> int:
+        self._prune(time.time())
+        return len(self._entries)
+
+    def __contains__(self, name: str) -> bool:
+        self._prune(time.time())
+        return name in self._entries
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.top())
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """Current entry for an employee, or None if not in context."""
+        now = time.time()
+        self._prune(now)
+        entry = self._entries.get(name)
+        return self._snapshot(entry, now) if entry else None
+
+    def add(self, name: str, score: float, source: str, first_mentioned: str, query_type: str):
+        """Add an employee not yet in context."""
+        entry = {"name": name, "source": source, "first_mentioned": first_mentioned, "query_types": [query_type]}
+        self._entries[name] = entry
+        self._set_score(entry, score, time.time())
+
+    def boost(self, name: str, amount: float, query_type: str, maximum: float = 1.0):
+        """Raise an employee's current score (capped at maximum) and record the query type."""
+        now = time.time()
+        entry = self._entries[name]
+        self._set_score(entry, min(maximum, self._score_at(entry, now) + amount), now)
+        if query_type not in entry["query_types"]:
+            entry["query_types"].append(query_type)
+
+    def decay(self, name: str, amount: float, floor: float):
+        """Lower an employee's current score (not below floor), dropping it if it falls to min_score."""
+        now = time.time()
+        entry = self._entries.get(name)
+        if entry is not None:
+            self._set_score(entry, max(floor, self._score_at(entry, now) - amount), now)
+        self._prune(now)
+
+    def trim(self, max_count: int):
+        """Keep only the max_count most relevant employees."""
+        self._prune(time.time())
+        while len(self._entries) > max_count:
+            self._pop_least_relevant()
+
+    def top(self, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        The k most relevant employees (all when k is None), most relevant first.
+
+        Returns:
+            Snapshots with "name", the current "relevance_score", "source",
+            "first_mentioned" and "query_types"
+        """
+        now = time.time()
+        self._prune(now)
+        entries = self._entries.values()
+        if k is None:
+            ranked = sorted(entries, key=self._order_key, reverse=True)
+        else:
+            ranked = heapq.nlargest(k, entries, key=self._order_key)
+        return [self._snapshot(entry, now) for entry in ranked]
+
+    def names(self, k: Optional[int] = None) -> List[str]:
+        """Names of the k most relevant employees."""
+        return [entry["name"] for entry in self.top(k)]
+
+class ConversationState:
+    """
+    Everything RAGQuerySystem remembers about one conversation.
+
+    Queries in the same conversation read and update this object under its
+    lock; different conversations never share state.
+    """
+
+    def __init__(self, conversation_id: str):
+        self.conversation_id = conversation_id
+        self.lock = threading.RLock()
+        self.conversation_settings = dict(DEFAULT_CONVERSATION_SETTINGS)
+        self.last_active = time.time()
+        self.memory_generation = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the history, summary and context employees (settings are kept)."""
+        # Recent turns, oldest first; older turns are folded into the rolling summary
+        self.conversation_history: "deque[Dict[str, Any]]" = deque()
+        self.pending_summary: "deque[Dict[str, Any]]" = deque()  # Evicted turns not yet summarized
+        self.summary = ""
+        self.summary_tokens = 0
+        self.summary_job = None  # Future of the running summary job, if any
+        self.memory_generation += 1  # Lets a summary job notice the conversation was cleared
+        self.context_employees = ContextEmployeeStore()  # Current context employees with scores
+        # Running token totals over conversation_history, updated as entries are added and pruned
+        self.history_tokens = 0  # Sum of entry["tokens_used"]
+        self.memory_tokens = 0  # Sum of entry["memory_tokens"]
+        self.conversation_metadata = {
+            "total_tokens_used": 0,
+            "peak_employee_count": 0,
+            "conversation_theme": None
+        }
+
+    def touch(self):
+        """Mark the conversation as active now."""
+        self.last_active = time.time()
+
+class ConversationStore:
+    """
+    Bounded, thread-safe map of conversation_id -> ConversationState.
+
+    Conversations idle for longer than idle_timeout_seconds are evicted, and
+    the least recently used ones are evicted beyond max_conversations.
+    """
+
+    def __init__(self, max_conversations: int = MAX_CONVERSATIONS,
+                 idle_timeout_seconds: float = IDLE_TIMEOUT_SECONDS):
+        self.max_conversations = max_conversations
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self._conversations: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: str) -> ConversationState:
+        """Return the state of a conversation, creating it if needed."""
+        with self._lock:
+            self._evict_idle_locked(time.time())
+
+            state = self._conversations.get(conversation_id)
+            if state is None:
+                state = ConversationState(conversation_id)
+                self._conversations[conversation_id] = state
+            self._conversations.move_to_end(conversation_id)
+            state.touch()
+
+            while len(self._conversations) > self.max_conversations:
+                evicted_id, _ = self._conversations.popitem(last=False)
+                print(f"DEBUG: Evicted conversation {evicted_id} (store full)")
+            return state
+
+    def discard(self, conversation_id: str):
+        """Drop a conversation's state."""
+        with self._lock:
+            self._conversations.pop(conversation_id, None)
+
+    def _evict_idle_locked(self, now: float):
+        # Entries are in least-recently-used order, so stop at the first active one
+        while self._conversations:
+            conversation_id, state = next(iter(self._conversations.items()))
+            if now - state.last_active <= self.idle_timeout_seconds:
+                break
+            del self._conversations[conversation_id]
+            print(f"DEBUG: Evicted idle conversation {conversation_id}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._conversations)
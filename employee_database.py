@@ -1,16 +1,249 @@
 import os
 import json
+import shutil
+import threading
+from contextlib import contextmanager
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import uuid
+from keyword_matcher import KeywordMatcher
+from workforce_stats import WorkforceAggregates
+from profile_storage import (
+    PROFILE_SUFFIX, TEMP_SUFFIX, TRADITIONAL_SECTIONS_KEY, atomic_write, is_profile_file,
+    join_profile, read_profile, read_profile_sections, section_refs, split_profile, write_profile
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+try:
+    import tiktoken
+    TOKEN_ENCODING = tiktoken.encoding_for_model("gpt-4")
+except Exception:  # tiktoken missing, or its encoding files cannot be fetched
+    TOKEN_ENCODING = None
+
+# Vocabularies used to turn free-text profile sections into searchable metadata
+COMMON_TRAITS = [
+    "analytical", "creative", "detail-oriented", "strategic",
+    "collaborative", "independent", "extroverted", "introverted",
+    "adaptable", "resilient", "innovative", "methodical",
+    "persuasive", "communicative", "technical", "visionary"
+]
+
+LEADERSHIP_STYLES = [
+    "directive", "participative", "transformational", "transactional",
+    "servant", "democratic", "authoritative", "coaching", "delegative",
+    "visionary", "pacesetting", "affiliative", "commanding"
+]
+
+# Departments offered when adding an employee (free-text "Other" is also allowed)
+DEPARTMENTS = [
+    "Engineering", "Marketing", "Sales", "Product", "Design",
+    "HR", "Finance", "Operations"
+]
+
+# Other names for departments (name in DEPARTMENTS -> variants)
+DEPARTMENT_SYNONYMS = {
+    "HR": ["human resources", "people team"],
+    "Engineering": ["tech", "technology"],
+    "Finance": ["financial"],
+    "Operations": ["ops"]
+}
+
+# Compiled once and shared by every EmployeeDatabase instance
+TRAIT_MATCHER = KeywordMatcher(COMMON_TRAITS)
+LEADERSHIP_STYLE_MATCHER = KeywordMatcher(LEADERSHIP_STYLES)
+DEPARTMENT_MATCHER = KeywordMatcher({
+    department: [department] + DEPARTMENT_SYNONYMS.get(department, []) for department in DEPARTMENTS
+})
+
+def canonical_department(department: str) -> str:
+    """
+    Map a department name or synonym to its name in DEPARTMENTS.
+
+    Only a name that is a known name or synonym as a whole is mapped; others,
+    such as "Sales Engineering", are distinct departments and kept as given.
+    """
+    found = DEPARTMENT_MATCHER.lookup(department)
+    return found[0] if found else department.strip()
+
+# When to fsync: "always" (profiles and index), "index" (index only) or "never"
+FSYNC_POLICIES = ("always", "index", "never")
+
+ORPHANED_DIR = "orphaned"
+
+# Append-only per-employee version history (one JSON line per version holding
+# only the sections that changed)
+HISTORY_DIR = "history"
+HISTORY_SUFFIX = ".jsonl"
+
+# Lock file shared by every process using the same storage directory. It also
+# holds the generation counter, bumped on every committed change.
+LOCK_FILE = ".lock"
+GENERATION_WIDTH = 20
+
+# Ready-to-inject RAG context per employee (one JSON file each), rebuilt from the
+# profile whenever its version changes
+CONTEXT_BLOCKS_DIR = "context_blocks"
+
+# Enhanced profile sections added to employee context when the query needs them:
+# (required_data name, profile key, context label)
+ENHANCED_CONTEXT_SECTIONS = [
+    ("skills_assessment", "skills_assessment", "Skills Assessment"),
+    ("performance_data", "performance_metrics", "Performance Metrics"),
+    ("team_dynamics", "team_dynamics", "Team Dynamics")
+]
+
+def count_tokens(text: str) -> int:
+    """Count GPT-4 tokens (about 4 characters per token without tiktoken)."""
+    if TOKEN_ENCODING is not None:
+        try:
+            return len(TOKEN_ENCODING.encode(text))
+        except Exception:
+            pass
+    return len(text) // 4
 
 class EmployeeDatabase:
-    def __init__(self, storage_dir="employee_data"):
-        """Initialize employee database with storage directory."""
+    def __init__(self, storage_dir="employee_data", fsync_policy: str = "always",
+                 repair_on_start: bool = True):
+        """
+        Initialize employee database with storage directory.
+
+        Args:
+            storage_dir: Directory holding the index and one file per profile
+            fsync_policy: One of FSYNC_POLICIES; trades durability for write speed
+            repair_on_start: Reconcile profile files and the index on startup
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy must be one of {FSYNC_POLICIES}, got {fsync_policy!r}")
+
         self.storage_dir = storage_dir
+        self.fsync_policy = fsync_policy
         os.makedirs(storage_dir, exist_ok=True)
         self.index_file = os.path.join(storage_dir, "index.json")
+        self.lock_file = os.path.join(storage_dir, LOCK_FILE)
+        self.history_dir = os.path.join(storage_dir, HISTORY_DIR)
+        os.makedirs(self.history_dir, exist_ok=True)
+        self.context_blocks_dir = os.path.join(storage_dir, CONTEXT_BLOCKS_DIR)
+        os.makedirs(self.context_blocks_dir, exist_ok=True)
+
+        # Shared-state bookkeeping: one thread lock per instance plus an flock on
+        # the lock file across processes; the index is reloaded whenever the
+        # on-disk generation differs from the one this instance last saw
+        self._thread_lock = threading.RLock()
+        self._lock_fd = None
+        self._lock_depth = 0
+        self._change_listeners = []
+        self.generation = -1
+        self.profile_index = {}
+        self._context_blocks = {}  # employee_id -> context blocks of the indexed version
+        self.aggregates = WorkforceAggregates(DEPARTMENT_MATCHER)  # Population statistics over the index metadata
+
+        if repair_on_start:
+            self.check_consistency(repair=True)
+        else:
+            self.refresh()
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        """
+        Hold the database lock for the duration of the block.
+
+        Shared locks are for reads, exclusive locks for read-modify-write
+        cycles. Nested use is re-entrant within a thread; callers must take the
+        exclusive lock first if they intend to write.
+        """
+        with self._thread_lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                self._lock_fd = fd
+                self._lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+                    self._lock_fd = None
+            finally:
+                # Closing the descriptor also releases the flock
+                os.close(fd)
+
+    def _read_generation_locked(self) -> int:
+        """Read the shared generation counter (lock must be held)."""
+        os.lseek(self._lock_fd, 0, os.SEEK_SET)
+        raw = os.read(self._lock_fd, GENERATION_WIDTH)
+        try:
+            return int(raw.decode('ascii')) if raw else 0
+        except ValueError:
+            # Torn write from a crashed process: force a reload
+            return -2
+
+    def _refresh_locked(self) -> bool:
+        """Reload the index if another instance or process changed it (lock must be held)."""
+        generation = self._read_generation_locked()
+        if generation == self.generation:
+            return False
+
         self.profile_index = self._load_index()
+        self.aggregates.rebuild(self.profile_index)
+        self.generation = generation
+        self._notify_change_listeners()
+        return True
+
+    def _commit_locked(self):
+        """
+        Persist the index and publish the change (exclusive lock must be held).
+
+        The generation is bumped before the index is replaced: readers cannot
+        observe the gap while the lock is held, and a crash in between only
+        costs other instances one redundant reload.
+        """
+        generation = max(self._read_generation_locked(), self.generation, 0) + 1
+        os.lseek(self._lock_fd, 0, os.SEEK_SET)
+        os.write(self._lock_fd, str(generation).zfill(GENERATION_WIDTH).encode('ascii'))
+        if self.fsync_policy != "never":
+            os.fsync(self._lock_fd)
+
+        self._save_index()
+        self.generation = generation
+        self._notify_change_listeners()
+
+    def _notify_change_listeners(self):
+        for callback in list(self._change_listeners):
+            try:
+                callback(self.generation)
+            except Exception as e:
+                print(f"Error in employee database change listener: {e}")
+
+    def add_change_listener(self, callback):
+        """
+        Register a callback invoked with the new generation whenever this
+        instance writes or observes a change made elsewhere.
+        """
+        self._change_listeners.append(callback)
+
+    def refresh(self) -> bool:
+        """
+        Pick up changes made by other instances or processes.
+
+        Costs one small read of the lock file when nothing changed.
+
+        Returns:
+            bool: True if the in-memory index was reloaded
+        """
+        with self._locked(exclusive=False):
+            return self._refresh_locked()
     
     def _load_index(self) -> Dict[str, Dict[str, Any]]:
         """Load the employee index or create a new one if it doesn't exist."""
@@ -22,9 +255,160 @@ class EmployeeDatabase:
             return {}
     
     def _save_index(self):
-        """Save the employee index to disk."""
-        with open(self.index_file, 'w') as f:
-            json.dump(self.profile_index, f, indent=2)
+        """Save the employee index to disk atomically."""
+        atomic_write(self.index_file, json.dumps(self.profile_index, indent=2),
+                     fsync=self.fsync_policy != "never")
+
+    def _write_profile_file(self, profile_path: str, profile_data: str):
+        """Write a profile file atomically according to the fsync policy."""
+        write_profile(profile_path, profile_data, fsync=self.fsync_policy == "always")
+
+    def _history_path(self, employee_id: str) -> str:
+        return os.path.join(self.history_dir, f"{employee_id}{HISTORY_SUFFIX}")
+
+    def _context_blocks_path(self, employee_id: str) -> str:
+        return os.path.join(self.context_blocks_dir, f"{employee_id}.json")
+
+    @staticmethod
+    def _build_context_blocks(name: str, profile_data: str, metadata: Dict[str, Any],
+                              version: int) -> Dict[str, Any]:
+        """
+        Format an employee's RAG context once, with token counts.
+
+        Returns:
+            {"version", "profile": [{"key", "text", "tokens"}, ...] (classic sections),
+             "enhanced": {profile key: {"text", "tokens"}} (ENHANCED_CONTEXT_SECTIONS only),
+             "metadata": {"text", "tokens"} or None}; raw (non-JSON) profiles get no blocks
+        """
+        def block(text: str) -> Dict[str, Any]:
+            return {"text": text, "tokens": count_tokens(text)}
+
+        blocks = {"version": version, "profile": [], "enhanced": {}, "metadata": None}
+        split = split_profile(profile_data)
+        if split['kind'] == "raw":
+            return blocks
+
+        enhanced_labels = {section_key: label for _, section_key, label in ENHANCED_CONTEXT_SECTIONS}
+        for section in split['sections']:
+            value = section['value']
+            if section['group'] == TRADITIONAL_SECTIONS_KEY:
+                if isinstance(value, dict):
+                    text = f"{name} - {value.get('section', '')}: {value.get('content', '')}"
+                else:
+                    text = f"{name} - {value}"
+                blocks["profile"].append(dict(block(text), key=section['key']))
+            elif section['key'] in enhanced_labels and value:
+                blocks["enhanced"][section['key']] = block(
+                    f"{name} - {enhanced_labels[section['key']]}: {json.dumps(value)}"
+                )
+
+        blocks["metadata"] = block(f"{name} - Metadata: {json.dumps(metadata)}")
+        return blocks
+
+    def _store_context_blocks(self, employee_id: str, profile_data: str) -> Dict[str, Any]:
+        """Build and persist the context blocks of the indexed version (lock must be held)."""
+        entry = self.profile_index[employee_id]
+        blocks = self._build_context_blocks(entry['name'], profile_data, entry['metadata'], entry.get('version', 0))
+        atomic_write(self._context_blocks_path(employee_id), json.dumps(blocks, ensure_ascii=False),
+                     fsync=self.fsync_policy == "always")
+        self._context_blocks[employee_id] = blocks
+        return blocks
+
+    def _write_history_version_locked(self, employee_id: str, previous_sections: Optional[Dict[str, Any]],
+                                      profile_data: str) -> tuple:
+        """
+        Record a new profile version as a section-level delta (exclusive lock must be held).
+
+        Args:
+            employee_id: Unique ID for the employee
+            previous_sections: {"kind", "sections"} of the current version, or None
+                for the first version
+            profile_data: The new profile JSON string
+
+        Returns:
+            tuple: (new version number, committed history size in bytes), to be
+            stored in the index entry by the caller
+        """
+        entry = self.profile_index.get(employee_id, {})
+        version = entry.get('version', 0) + 1
+        history_path = self._history_path(employee_id)
+
+        new_split = split_profile(profile_data)
+        new_refs = section_refs([section['key'] for section in new_split['sections']])
+        new_values = {ref: section['value'] for ref, section in zip(new_refs, new_split['sections'])}
+
+        old_values = {}
+        if previous_sections is not None:
+            old_refs = section_refs([section['key'] for section in previous_sections['sections']])
+            old_values = {ref: section['value'] for ref, section in zip(old_refs, previous_sections['sections'])}
+
+        record = {
+            'version': version,
+            'timestamp': datetime.now().isoformat(),
+            'kind': new_split['kind'],
+            'order': [[section['key'], section['group']] for section in new_split['sections']],
+            'changed': {
+                ref: value for ref, value in new_values.items()
+                if ref not in old_values or old_values[ref] != value
+            },
+            'removed': [ref for ref in old_values if ref not in new_values]
+        }
+
+        # Drop anything past the last committed version (left by a crash before
+        # the index was saved) and append the new delta
+        committed_size = entry.get('history_size', 0) if previous_sections is not None else 0
+        with open(history_path, 'ab') as f:
+            f.truncate(committed_size)
+            f.seek(committed_size)
+            f.write((json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8'))
+            f.flush()
+            if self.fsync_policy == "always":
+                os.fsync(f.fileno())
+            history_size = f.tell()
+
+        return version, history_size
+
+    def _replay_history(self, records: List[Dict[str, Any]], version: int) -> Dict[str, Any]:
+        """
+        Apply the deltas up to a version (1 <= version <= len(records)).
+
+        Returns:
+            {"kind", "sections"} of the profile at that version
+        """
+        values = {}
+        for record in records[:version]:
+            for ref in record['removed']:
+                values.pop(ref, None)
+            values.update(record['changed'])
+
+        target = records[version - 1]
+        sections = [{'key': key, 'group': group} for key, group in target['order']]
+        for ref, section in zip(section_refs([section['key'] for section in sections]), sections):
+            section['value'] = values.get(ref)
+
+        return {'kind': target['kind'], 'sections': sections}
+
+    def _read_history_locked(self, employee_id: str) -> List[Dict[str, Any]]:
+        """Read the committed version records of an employee (lock must be held)."""
+        entry = self.profile_index.get(employee_id)
+        if not entry or not entry.get('version'):
+            return []
+
+        records = []
+        try:
+            with open(self._history_path(employee_id), 'rb') as f:
+                data = f.read(entry.get('history_size'))
+        except FileNotFoundError:
+            return []
+
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn line from an interrupted append
+            if record.get('version', 0) <= entry['version']:
+                records.append(record)
+        return records
     
     def add_employee(self, name: str, profile_data: str, 
                     metadata: Dict[str, Any] = None) -> str:
@@ -57,118 +441,511 @@ class EmployeeDatabase:
         if metadata and 'document_names' in metadata:
             extracted_metadata['document_names'] = metadata['document_names']
         
-        # Save the profile to a file
-        profile_path = os.path.join(self.storage_dir, f"{employee_id}.json")
-        with open(profile_path, 'w') as f:
-            f.write(profile_data)
-        
-        # Add to index
-        self.profile_index[employee_id] = {
-            'name': name,
-            'file_path': profile_path,
-            'metadata': extracted_metadata,
-            'added_date': extracted_metadata['added_date']
-        }
-        
-        # Save updated index
-        self._save_index()
+        with self._locked():
+            self._refresh_locked()
+
+            # Save the profile to a file before it is referenced by the index, so a
+            # crash in between leaves at worst an orphaned file (repaired on startup)
+            profile_path = os.path.join(self.storage_dir, f"{employee_id}{PROFILE_SUFFIX}")
+            self._write_profile_file(profile_path, profile_data)
+
+            # First version of the history is the full set of sections
+            version, history_size = self._write_history_version_locked(employee_id, None, profile_data)
+
+            # Add to index
+            self.profile_index[employee_id] = {
+                'name': name,
+                'file_path': profile_path,
+                'metadata': extracted_metadata,
+                'added_date': extracted_metadata['added_date'],
+                'version': version,
+                'history_size': history_size
+            }
+
+            self._store_context_blocks(employee_id, profile_data)
+            self.aggregates.add(employee_id, extracted_metadata)
+
+            # Save updated index
+            self._commit_locked()
         
         return employee_id
     
     def get_employee(self, employee_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve an employee profile by ID."""
-        if employee_id not in self.profile_index:
+        with self._locked(exclusive=False):
+            self._refresh_locked()
+
+            if employee_id not in self.profile_index:
+                return None
+
+            # Get profile data
+            profile_path = self.profile_index[employee_id]['file_path']
+            try:
+                profile_data = read_profile(profile_path)
+            except FileNotFoundError:
+                print(f"Profile file missing for employee {employee_id}: {profile_path}")
+                return None
+
+            # Return employee data with profile
+            return {
+                'id': employee_id,
+                'name': self.profile_index[employee_id]['name'],
+                'profile': profile_data,
+                'metadata': self.profile_index[employee_id]['metadata'],
+                'version': self.profile_index[employee_id].get('version', 0)
+            }
+
+    def get_employee_sections(self, employee_id: str,
+                              section_names: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve selected profile sections without decoding the whole profile.
+
+        Args:
+            employee_id: Unique ID for the employee
+            section_names: Section names (e.g. "Profile Summary"), enhanced profile
+                keys (e.g. "skills_assessment") or "traditional_sections"; None for all
+
+        Returns:
+            Employee data with 'profile_kind' ("list", "dict" or "raw") and
+            'sections' as a list of {"key", "group", "value"}, or None if not found
+        """
+        with self._locked(exclusive=False):
+            self._refresh_locked()
+
+            if employee_id not in self.profile_index:
+                return None
+
+            profile_path = self.profile_index[employee_id]['file_path']
+            try:
+                split = read_profile_sections(profile_path, section_names)
+            except FileNotFoundError:
+                print(f"Profile file missing for employee {employee_id}: {profile_path}")
+                return None
+
+            return {
+                'id': employee_id,
+                'name': self.profile_index[employee_id]['name'],
+                'profile_kind': split['kind'],
+                'sections': split['sections'],
+                'metadata': self.profile_index[employee_id]['metadata']
+            }
+
+    def get_context_blocks(self, employee_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the precomputed RAG context of an employee (see _build_context_blocks).
+
+        Blocks are written when a profile is added or updated; profiles stored
+        before that (or whose blocks are out of date) get them built on first use.
+
+        Returns:
+            The context blocks, or None if the employee is not found
+        """
+        with self._locked(exclusive=False):
+            self._refresh_locked()
+
+            entry = self.profile_index.get(employee_id)
+            if entry is None:
+                return None
+            version = entry.get('version', 0)
+
+            blocks = self._context_blocks.get(employee_id)
+            if blocks is not None and blocks['version'] == version:
+                return blocks
+
+            try:
+                with open(self._context_blocks_path(employee_id), 'r', encoding='utf-8') as f:
+                    blocks = json.load(f)
+            except (OSError, ValueError):
+                blocks = None
+            if blocks is not None and blocks.get('version') == version:
+                self._context_blocks[employee_id] = blocks
+                return blocks
+
+            # Missing or stale: rebuild from the profile (written atomically, so this is
+            # safe under the shared lock)
+            try:
+                profile_data = read_profile(entry['file_path'])
+            except FileNotFoundError:
+                print(f"Profile file missing for employee {employee_id}: {entry['file_path']}")
+                return None
+            return self._store_context_blocks(employee_id, profile_data)
+
+    def get_employee_versions(self, employee_ids: List[str]) -> Dict[str, Optional[int]]:
+        """
+        Current profile version of each employee.
+
+        Returns:
+            Dictionary of employee_id -> version (None for employees not found)
+        """
+        with self._locked(exclusive=False):
+            self._refresh_locked()
+
+            return {
+                employee_id: self.profile_index[employee_id].get('version', 0) if employee_id in self.profile_index else None
+                for employee_id in employee_ids
+            }
+
+    def get_workforce_summary(self, department: Optional[str] = None) -> str:
+        """
+        Compact statistics over all employees (see WorkforceAggregates.format_summary).
+
+        Args:
+            department: Describe this department instead of the whole organization
+
+        Returns:
+            Summary text, "" if there are no employees (or none in the department)
+        """
+        with self._locked(exclusive=False):
+            self._refresh_locked()
+            return self.aggregates.format_summary(department)
+
+    def find_departments(self, text: str) -> List[str]:
+        """Departments with employees that are named in a text, in order of appearance."""
+        with self._locked(exclusive=False):
+            self._refresh_locked()
+            return self.aggregates.find_departments(text)
+
+    def get_profile_section(self, employee_id: str, section_name: str) -> Optional[Any]:
+        """Get the content of a single profile section (e.g. "Profile Summary")."""
+        employee_data = self.get_employee_sections(employee_id, [section_name])
+        if not employee_data or not employee_data['sections']:
             return None
+        return employee_data['sections'][0]['value']
+
+    def get_profile_history(self, employee_id: str) -> List[Dict[str, Any]]:
+        """
+        List the recorded versions of an employee's profile.
         
-        # Get profile data
-        profile_path = self.profile_index[employee_id]['file_path']
-        with open(profile_path, 'r') as f:
-            profile_data = f.read()
-        
-        # Return employee data with profile
-        return {
-            'id': employee_id,
-            'name': self.profile_index[employee_id]['name'],
-            'profile': profile_data,
-            'metadata': self.profile_index[employee_id]['metadata']
-        }
+        Returns:
+            One entry per version with 'version', 'timestamp', 'changed_sections'
+            and 'removed_sections' (oldest first); empty if the employee is unknown
+        """
+        with self._locked(exclusive=False):
+            self._refresh_locked()
+            return [
+                {
+                    'version': record['version'],
+                    'timestamp': record['timestamp'],
+                    'changed_sections': list(record['changed'].keys()),
+                    'removed_sections': record['removed']
+                }
+                for record in self._read_history_locked(employee_id)
+            ]
+
+    def get_profile_version(self, employee_id: str, version: int) -> Optional[str]:
+        """
+        Rebuild the profile JSON string as it was at a given version.
+
+        Args:
+            employee_id: Unique ID for the employee
+            version: Version number (1 is the profile as first added)
+
+        Returns:
+            The profile JSON string, or None if the employee or version is unknown
+        """
+        with self._locked(exclusive=False):
+            self._refresh_locked()
+            records = self._read_history_locked(employee_id)
+
+        if not 1 <= version <= len(records):
+            return None
+
+        replayed = self._replay_history(records, version)
+        return join_profile(replayed['kind'], replayed['sections'])
+
+    def get_changed_sections(self, employee_id: str, since_version: int) -> Optional[List[str]]:
+        """
+        Names of the sections that changed or were removed after a version.
+
+        Lets callers such as the vector store re-process only what changed.
+
+        Args:
+            employee_id: Unique ID for the employee
+            since_version: Version the caller last processed (0 for everything)
+
+        Returns:
+            Section names in first-changed order, or None if the employee is unknown
+        """
+        with self._locked(exclusive=False):
+            self._refresh_locked()
+            if employee_id not in self.profile_index:
+                return None
+            records = self._read_history_locked(employee_id)
+
+        changed = []
+        for record in records:
+            if record['version'] <= since_version:
+                continue
+            for ref in list(record['changed'].keys()) + record['removed']:
+                if ref not in changed:
+                    changed.append(ref)
+        return changed
     
     def get_all_employees(self) -> List[Dict[str, Any]]:
         """Get a list of all employees with basic info (no profile content)."""
-        return [
-            {
-                'id': emp_id,
-                'name': data['name'],
-                'metadata': data['metadata'],
-                'added_date': data['added_date']
-            }
-            for emp_id, data in self.profile_index.items()
-        ]
+        with self._locked(exclusive=False):
+            self._refresh_locked()
+
+            return [
+                {
+                    'id': emp_id,
+                    'name': data['name'],
+                    'metadata': data['metadata'],
+                    'added_date': data['added_date']
+                }
+                for emp_id, data in self.profile_index.items()
+            ]
     
     def delete_employee(self, employee_id: str) -> bool:
         """Delete an employee profile."""
-        if employee_id not in self.profile_index:
-            return False
-        
-        # Remove the profile file
-        profile_path = self.profile_index[employee_id]['file_path']
-        if os.path.exists(profile_path):
-            os.remove(profile_path)
-        
-        # Remove from index
-        del self.profile_index[employee_id]
-        self._save_index()
+        with self._locked():
+            self._refresh_locked()
+
+            if employee_id not in self.profile_index:
+                return False
+
+            profile_path = self.profile_index[employee_id]['file_path']
+
+            # Remove from index first; a crash before the file is removed leaves an
+            # orphaned file rather than a dangling index entry
+            del self.profile_index[employee_id]
+            self.aggregates.remove(employee_id)
+            self._commit_locked()
+
+            # Remove the profile file and its version history
+            if os.path.exists(profile_path):
+                os.remove(profile_path)
+            history_path = self._history_path(employee_id)
+            if os.path.exists(history_path):
+                os.remove(history_path)
+            blocks_path = self._context_blocks_path(employee_id)
+            if os.path.exists(blocks_path):
+                os.remove(blocks_path)
+            self._context_blocks.pop(employee_id, None)
         
         return True
     
-    def update_employee_profile(self, employee_id: str, profile_data: str) -> bool:
+    def update_employee_profile(self, employee_id: str, profile_data: str, vector_store=None) -> bool:
         """
         Update an existing employee's profile data.
         
         Args:
             employee_id: Unique ID for the employee
             profile_data: The new JSON string containing the updated profile
+            vector_store: Optional VectorStore whose embeddings of the changed
+                sections are refreshed (see VectorStore.update_employee_sections)
             
         Returns:
             bool: True if successful, False if employee not found
         """
-        if employee_id not in self.profile_index:
-            return False
-        
         # Extract new metadata from the updated profile
         extracted_metadata = self._extract_metadata_from_profile(profile_data)
         
-        # Preserve certain existing metadata (like name, added_date, document_names)
-        existing_metadata = self.profile_index[employee_id]['metadata']
-        
-        # Merge metadata, keeping existing important fields
-        updated_metadata = {
-            **extracted_metadata,
-            'name': existing_metadata.get('name'),
-            'added_date': existing_metadata.get('added_date'),
-            'last_updated': datetime.now().isoformat()
-        }
-        
-        # Preserve document names if they exist
-        if 'document_names' in existing_metadata:
-            updated_metadata['document_names'] = existing_metadata['document_names']
+        with self._locked():
+            # Merge against the latest on-disk state so concurrent writers
+            # never overwrite each other's changes
+            self._refresh_locked()
+
+            if employee_id not in self.profile_index:
+                return False
+
+            # Preserve certain existing metadata (like name, added_date, document_names)
+            existing_metadata = self.profile_index[employee_id]['metadata']
+
+            # Merge metadata, keeping existing important fields
+            updated_metadata = {
+                **extracted_metadata,
+                'name': existing_metadata.get('name'),
+                'added_date': existing_metadata.get('added_date'),
+                'last_updated': datetime.now().isoformat()
+            }
+
+            # Preserve document names if they exist
+            if 'document_names' in existing_metadata:
+                updated_metadata['document_names'] = existing_metadata['document_names']
+
+            # Preserve department if it exists
+            if 'department' in existing_metadata:
+                updated_metadata['department'] = existing_metadata['department']
+
+            old_profile_path = self.profile_index[employee_id]['file_path']
+
+            # Diff against the committed version rather than the profile file: a crash
+            # after a profile write but before its index commit leaves the file ahead
+            committed_version = self.profile_index[employee_id].get('version', 0)
+            records = self._read_history_locked(employee_id) if committed_version else []
+            if committed_version and len(records) == committed_version:
+                previous_sections = self._replay_history(records, committed_version)
+            else:
+                previous_sections = read_profile_sections(old_profile_path)
+
+            # Profiles stored before versioning existed get their current
+            # content recorded as the baseline version first
+            if not self.profile_index[employee_id].get('version'):
+                version, history_size = self._write_history_version_locked(
+                    employee_id, None, join_profile(previous_sections['kind'], previous_sections['sections'])
+                )
+                self.profile_index[employee_id]['version'] = version
+                self.profile_index[employee_id]['history_size'] = history_size
+
+            # Append only the sections that changed to the history
+            previous_version = self.profile_index[employee_id]['version']
+            version, history_size = self._write_history_version_locked(
+                employee_id, previous_sections, profile_data
+            )
+
+            # Save the updated profile to file (atomically replaces the old version).
+            # Profiles still in the legacy plain-JSON format move to the container
+            profile_path = os.path.join(self.storage_dir, f"{employee_id}{PROFILE_SUFFIX}")
+            self._write_profile_file(profile_path, profile_data)
+
+            # Update the index
+            self.profile_index[employee_id]['metadata'] = updated_metadata
+            self.profile_index[employee_id]['file_path'] = profile_path
+            self.profile_index[employee_id]['version'] = version
+            self.profile_index[employee_id]['history_size'] = history_size
+
+            self._store_context_blocks(employee_id, profile_data)
+            self.aggregates.add(employee_id, updated_metadata)
+
+            # Save updated index
+            self._commit_locked()
+
+            if old_profile_path != profile_path and os.path.exists(old_profile_path):
+                os.remove(old_profile_path)
+
+        if vector_store is not None:
+            try:
+                profile_sections = json.loads(profile_data)
+            except ValueError:
+                print(f"Profile of employee {employee_id} is not valid JSON, vector store not updated")
+            else:
+                changed_sections = self.get_changed_sections(employee_id, previous_version) or []
+                vector_store.update_employee_sections(employee_id, profile_sections, changed_sections, updated_metadata)
         
-        # Preserve department if it exists
-        if 'department' in existing_metadata:
-            updated_metadata['department'] = existing_metadata['department']
+        return True
+
+    def check_consistency(self, repair: bool = True, vector_store=None) -> Dict[str, List[str]]:
+        """
+        Reconcile profile files, the index and (optionally) the vector collections.
         
-        # Save the updated profile to file
-        profile_path = self.profile_index[employee_id]['file_path']
-        with open(profile_path, 'w') as f:
-            f.write(profile_data)
+        Uses a single directory scan plus set arithmetic, so it is cheap enough
+        to run on every startup.
         
-        # Update the index
-        self.profile_index[employee_id]['metadata'] = updated_metadata
+        Args:
+            repair: Fix the problems found instead of only reporting them
+            vector_store: Optional VectorStore whose employee collections are
+                checked for entries that no longer exist in the index
+
+        Returns:
+            Report with the employee IDs / file names affected by each problem
+        """
+        with self._locked():
+            self._refresh_locked()
+            return self._check_consistency_locked(repair, vector_store)
+
+    def _check_consistency_locked(self, repair: bool, vector_store) -> Dict[str, List[str]]:
+        """Body of check_consistency (exclusive lock must be held)."""
+        report = {
+            'temp_files': [],
+            'orphaned_files': [],
+            'orphaned_history': [],
+            'orphaned_context_blocks': [],
+            'dangling_entries': [],
+            'stale_vector_entries': [],
+            'missing_vector_entries': []
+        }
         
-        # Save updated index
-        self._save_index()
+        # Scan the storage directory once
+        profile_files = set()
+        with os.scandir(self.storage_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(TEMP_SUFFIX):
+                    report['temp_files'].append(entry.name)
+                elif is_profile_file(entry.name) and entry.name != os.path.basename(self.index_file):
+                    profile_files.add(entry.name)
+
+        indexed_files = {
+            os.path.basename(data['file_path']): emp_id
+            for emp_id, data in self.profile_index.items()
+        }
         
-        return True
+        # Files written by an add that never reached the index
+        report['orphaned_files'] = sorted(profile_files - set(indexed_files))
+
+        # Histories of employees that were never committed or already deleted
+        report['orphaned_history'] = sorted(
+            file_name for file_name in os.listdir(self.history_dir)
+            if file_name.endswith(HISTORY_SUFFIX) and file_name[:-len(HISTORY_SUFFIX)] not in self.profile_index
+        )
+
+        # Context blocks of employees that no longer exist, and interrupted block
+        # writes (derived data, safe to delete)
+        report['orphaned_context_blocks'] = sorted(
+            file_name for file_name in os.listdir(self.context_blocks_dir)
+            if file_name.endswith(TEMP_SUFFIX)
+            or (file_name.endswith(".json") and file_name[:-len(".json")] not in self.profile_index)
+        )
+
+        # Index entries whose profile file is gone
+        report['dangling_entries'] = sorted(
+            emp_id for file_name, emp_id in indexed_files.items() if file_name not in profile_files
+        )
+
+        if vector_store is not None:
+            vector_ids = vector_store.get_employee_ids()
+            index_ids = set(self.profile_index) - set(report['dangling_entries'])
+            report['stale_vector_entries'] = sorted(vector_ids - index_ids)
+            report['missing_vector_entries'] = sorted(index_ids - vector_ids)
+
+        if repair:
+            for file_name in report['temp_files']:
+                try:
+                    os.remove(os.path.join(self.storage_dir, file_name))
+                except OSError as e:
+                    print(f"Could not remove temporary file {file_name}: {e}")
+
+            # Quarantine orphans instead of deleting them, they may hold the only copy
+            if report['orphaned_files']:
+                orphan_dir = os.path.join(self.storage_dir, ORPHANED_DIR)
+                os.makedirs(orphan_dir, exist_ok=True)
+                for file_name in report['orphaned_files']:
+                    shutil.move(os.path.join(self.storage_dir, file_name),
+                                os.path.join(orphan_dir, file_name))
+
+            if report['orphaned_history']:
+                orphan_history_dir = os.path.join(self.storage_dir, ORPHANED_DIR, HISTORY_DIR)
+                os.makedirs(orphan_history_dir, exist_ok=True)
+                for file_name in report['orphaned_history']:
+                    shutil.move(os.path.join(self.history_dir, file_name),
+                                os.path.join(orphan_history_dir, file_name))
+
+            for file_name in report['orphaned_context_blocks']:
+                try:
+                    os.remove(os.path.join(self.context_blocks_dir, file_name))
+                except OSError as e:
+                    print(f"Could not remove context blocks {file_name}: {e}")
+
+            if report['dangling_entries']:
+                for emp_id in report['dangling_entries']:
+                    del self.profile_index[emp_id]
+                    self.aggregates.remove(emp_id)
+                self._commit_locked()
+
+            # Missing vector entries are only reported: re-embedding is left to
+            # the regular (batch) profile loading
+            if vector_store is not None:
+                for emp_id in report['stale_vector_entries']:
+                    vector_store.delete_employee_profile(emp_id)
+
+        problems = {key: len(value) for key, value in report.items() if value}
+        if problems:
+            action = "Repaired" if repair else "Found"
+            print(f"{action} employee database inconsistencies: {problems}")
+
+        return report
     
     def _extract_metadata_from_profile(self, profile_json: str) -> Dict[str, Any]:
         """
@@ -223,19 +1000,7 @@ class EmployeeDatabase:
     
     def _extract_traits(self, text: str) -> List[str]:
         """Extract personality traits from profile text."""
-        common_traits = [
-            "analytical", "creative", "detail-oriented", "strategic", 
-            "collaborative", "independent", "extroverted", "introverted",
-            "adaptable", "resilient", "innovative", "methodical",
-            "persuasive", "communicative", "technical", "visionary"
-        ]
-        
-        found_traits = []
-        for trait in common_traits:
-            if trait in text.lower():
-                found_traits.append(trait)
-        
-        return found_traits
+        return TRAIT_MATCHER.find(text)
     
     def _extract_list_items(self, text: str) -> List[str]:
         """Extract numbered list items from text."""
@@ -259,15 +1024,4 @@ class EmployeeDatabase:
     
     def _extract_leadership_style(self, text: str) -> List[str]:
         """Extract leadership style keywords."""
-        leadership_styles = [
-            "directive", "participative", "transformational", "transactional",
-            "servant", "democratic", "authoritative", "coaching", "delegative",
-            "visionary", "pacesetting", "affiliative", "commanding"
-        ]
-        
-        found_styles = []
-        for style in leadership_styles:
-            if style in text.lower():
-                found_styles.append(style)
-        
-        return found_styles 
\ No newline at end of file
+        return LEADERSHIP_STYLE_MATCHER.find(text)
\ No newline at end of file
@@ -4,6 +4,19 @@ from typing import List, Dict, Any
 from openai import OpenAI
 from pathlib import Path
 import re
+from keyword_matcher import KeywordMatcher
+
+# Content cues for each document type, in the order they are reported
+DOCUMENT_TYPE_TERMS = {
+    "Hogan Assessment": ["hogan", "hpi", "hds", "mvpi"],
+    "360° Feedback": ["360"],
+    "CV/Resume": ["cv", "resume", "curriculum vitae"],
+    "IDI Assessment": ["intercultural development"],
+    "Performance Review": ["performance review", "annual review"],
+    "Interview Notes": ["interview", "interviews"]
+}
+
+DOCUMENT_TYPE_MATCHER = KeywordMatcher(DOCUMENT_TYPE_TERMS)
 
 class EnhancedProfileGenerator:
     def __init__(self):
@@ -162,24 +175,8 @@ Return only the JSON, no additional commentary."""
 
     def _identify_document_types(self, document_chunks: List[str]) -> List[str]:
         """Identify document types from content"""
-        context = " ".join(document_chunks).lower()
-        doc_types = []
-        
-        # Check for various document types
-        if any(term in context for term in ["hogan", "hpi", "hds", "mvpi"]):
-            doc_types.append("Hogan Assessment")
-        if "360" in context:
-            doc_types.append("360° Feedback")
-        if any(term in context for term in ["cv", "resume", "curriculum vitae"]):
-            doc_types.append("CV/Resume")
-        if "intercultural development" in context:
-            doc_types.append("IDI Assessment")
-        if any(term in context for term in ["performance review", "annual review"]):
-            doc_types.append("Performance Review")
-        if "interview" in context:
-            doc_types.append("Interview Notes")
-            
-        return doc_types
+        # Single pass over the joined chunks instead of one lowercase/scan per term
+        return DOCUMENT_TYPE_MATCHER.find(" ".join(document_chunks))
 
     def _clean_profile_sources(self, profile_content: str) -> str:
         """Clean up temporary filenames and improve source citations"""
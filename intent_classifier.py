@@ -0,0 +1,336 @@
+import os
+import re
+import json
+import math
+import time
+import zlib
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+from keyword_matcher import KeywordMatcher
+from employee_database import DEPARTMENTS, DEPARTMENT_SYNONYMS
+
+INTENT_EXAMPLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_examples.json")
+
+# Classifications below this confidence are left to the LLM
+CONFIDENCE_THRESHOLD = 0.6
+
+# Scope is predicted less reliably, so its confidence must be higher
+SCOPE_CONFIDENCE_THRESHOLD = 0.7
+
+# Size of the hashed bag-of-words embedding
+EMBEDDING_DIMENSIONS = 4096
+
+# Score added to a label for a keyword rule hit (centroid similarities are 0..1)
+RULE_BONUS = 0.3
+
+# Softmax temperature turning label scores into a confidence
+SOFTMAX_TEMPERATURE = 0.08
+
+# Keyword rules, labelled "<field>:<value>" like the query vocabulary matcher
+QUERY_TYPE_RULES = {
+    "individual_profile": ["tell me about", "overview of", "profile of", "profile summary", "describe",
+                           "strengths of", "key strengths", "what kind of"],
+    "team_analysis": ["team dynamics", "work together", "team members", "collective", "task force",
+                      "team composition", "personality mix", "group dynamics", "complement each other"],
+    "cross_comparison": ["compare", "compared", "comparison", "versus", "vs", "contrast", "difference between",
+                         "differences between", "side by side", "rank", "better suited", "which of them",
+                         "which one of", "similar are"],
+    "succession_planning": ["succession", "successor", "successors", "succeed", "ready for promotion",
+                            "promotion", "pipeline", "high potential", "bench strength", "next in line",
+                            "take over", "step into", "groomed", "internal candidate"],
+    "risk_assessment": ["risk", "risks", "flight risk", "burnout", "derailment", "red flags", "attrition",
+                        "retention", "turnover", "disengagement", "go wrong", "dangers", "exposed"],
+    "general_guidance": ["how should i", "how do i", "how can i", "tips", "best practices", "interpret",
+                         "explain", "what does", "advice", "coaching"]
+}
+
+# Titles held by one person. A department named in a title ("head of engineering",
+# "sales director") is about that role, not a department-wide question
+ROLE_TITLE_WORDS = ["head", "director", "vp", "vice president", "chief", "lead", "manager"]
+EXECUTIVE_TITLES = ["ceo", "cfo", "cto", "coo", "cio", "cmo", "chro"]
+
+def _role_titles() -> List[str]:
+    department_names = [department.lower() for department in DEPARTMENTS]
+    department_names += [synonym for synonyms in DEPARTMENT_SYNONYMS.values() for synonym in synonyms]
+    titles = list(EXECUTIVE_TITLES)
+    for role in ROLE_TITLE_WORDS:
+        for department in department_names:
+            titles += [f"{role} of {department}", f"{role} of the {department}", f"{department} {role}"]
+    return titles
+
+SCOPE_RULES = {
+    "single_employee": ["he", "she", "him", "his", "this person", "this employee"] + _role_titles(),
+    "multiple_employees": ["them", "these", "both", "two", "three", "candidates", "finalists", "each other"],
+    "organization-wide": ["organization", "organisation", "company", "company-wide", "across", "everyone",
+                          "all employees", "whole org", "our leaders", "our executives"],
+    "department": ["department", "dept", "division"] + [department for department in DEPARTMENTS]
+                  + [synonym for synonyms in DEPARTMENT_SYNONYMS.values() for synonym in synonyms]
+}
+
+REQUIRED_DATA_RULES = {
+    "personality_scores": ["personality", "hogan", "hpi", "hds", "mvpi", "traits", "assessment", "scores", "scale"],
+    "performance_data": ["performance", "results", "metrics", "kpi", "kpis", "targets", "ratings"],
+    "career_history": ["career", "experience", "background", "history", "cv", "resume", "previous roles"],
+    "skills_assessment": ["skills", "skill", "skill gaps", "competencies", "capabilities"],
+    "leadership_style": ["leadership", "leader", "leaders", "manager", "managers", "management style", "leading"],
+    "team_dynamics": ["team", "teams", "collaboration", "collaborative", "work together", "dynamics", "conflict", "conflicts"]
+}
+
+ANALYSIS_DEPTH_RULES = {
+    "strategic_recommendations": ["recommend", "should", "plan", "strategy", "what would it take", "suggest",
+                                  "advice", "next steps", "improve"],
+    "surface_level": ["quick", "quickly", "brief", "briefly", "list", "just", "in short", "one line"]
+}
+
+# Capitalised words that do not name a person (assessments, departments)
+NON_NAME_WORDS = {"i", "hogan", "hpi", "hds", "mvpi", "idi", "disc", "mbti"}
+NON_NAME_WORDS |= {department.lower() for department in DEPARTMENTS}
+NON_NAME_WORDS |= {word for synonyms in DEPARTMENT_SYNONYMS.values() for synonym in synonyms for word in synonym.split()}
+
+def mentioned_names(query: str) -> List[str]:
+    """
+    Capitalised words that are likely people's names, adjacent ones joined
+    ("Maria Lopez"). The first word of a sentence and all-caps words
+    (CEO, HPI) are skipped.
+    """
+    names = []
+    current = []
+    previous_end = None
+    for match in re.finditer(r"[A-Za-z][\w'’-]*", query):
+        word = re.sub(r"['’]s$", "", match.group(0))
+        gap = query[previous_end:match.start()] if previous_end is not None else None
+        sentence_start = gap is None or re.search(r"[.?!:;]", gap) is not None
+        is_name = (not sentence_start and word[0].isupper() and not word.isupper()
+                   and word.lower() not in NON_NAME_WORDS)
+        if is_name and current and not gap.strip():
+            current.append(word)
+        else:
+            if current:
+                names.append(" ".join(current))
+            current = [word] if is_name else []
+        previous_end = match.end()
+    if current:
+        names.append(" ".join(current))
+    return list(dict.fromkeys(names))
+
+def _build_rule_matcher() -> KeywordMatcher:
+    groups = {}
+    for field, rules in (("query_type", QUERY_TYPE_RULES), ("scope", SCOPE_RULES),
+                         ("required_data", REQUIRED_DATA_RULES), ("analysis_depth", ANALYSIS_DEPTH_RULES)):
+        for value, terms in rules.items():
+            groups[f"{field}:{value}"] = terms
+    return KeywordMatcher(groups)
+
+RULE_MATCHER = _build_rule_matcher()
+
+def _tokenize(text: str) -> List[str]:
+    """Lowercased word tokens with possessives and plural "s" stripped."""
+    tokens = []
+    for token in re.findall(r"[a-z0-9']+", text.lower()):
+        token = token.replace("'s", "").strip("'")
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        if token:
+            tokens.append(token)
+    return tokens
+
+def embed(text: str) -> Dict[int, float]:
+    """
+    Hashed bag-of-words embedding (unigrams and bigrams), L2-normalised.
+
+    Returns:
+        Sparse vector as {dimension: value}
+    """
+    tokens = _tokenize(text)
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    vector: Counter = Counter(zlib.crc32(feature.encode('utf-8')) % EMBEDDING_DIMENSIONS for feature in features)
+    return _normalise(vector)
+
+def _normalise(vector: Dict[int, float]) -> Dict[int, float]:
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {index: value / norm for index, value in vector.items()} if norm else {}
+
+def _dot(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(index, 0.0) for index, value in a.items())
+
+def _softmax_confidence(scores: Dict[str, float]) -> Tuple[str, float]:
+    """Return the best label and its softmax probability."""
+    best = max(scores, key=scores.get)
+    exps = {label: math.exp((score - scores[best]) / SOFTMAX_TEMPERATURE) for label, score in scores.items()}
+    return best, exps[best] / sum(exps.values())
+
+class IntentClassifier:
+    """
+    Local classifier for the query analysis normally produced by the LLM.
+
+    query_type and scope are scored by keyword rules plus a nearest-centroid
+    model over hashed bag-of-words embeddings of labelled example queries
+    (intent_examples.json). required_data and analysis_depth come from keyword
+    rules only. The confidence lets callers defer unsure cases to the LLM.
+    """
+
+    def __init__(self, examples_path: str = INTENT_EXAMPLES_PATH,
+                 confidence_threshold: float = CONFIDENCE_THRESHOLD,
+                 scope_confidence_threshold: float = SCOPE_CONFIDENCE_THRESHOLD):
+        """
+        Train the centroids from the example file.
+
+        Args:
+            examples_path: JSON list of {"query", "query_type", "scope"}
+            confidence_threshold: Minimum query type confidence for is_confident
+            scope_confidence_threshold: Minimum scope confidence for is_confident
+        """
+        self.confidence_threshold = confidence_threshold
+        self.scope_confidence_threshold = scope_confidence_threshold
+        self.examples: List[Dict[str, Any]] = []
+        if os.path.exists(examples_path):
+            with open(examples_path, 'r', encoding='utf-8') as f:
+                self.examples = json.load(f)
+        else:
+            print(f"Warning: Intent examples not found at {examples_path}, using keyword rules only")
+
+        self._vectors = [embed(example["query"]) for example in self.examples]
+        self._sums = {"query_type": {}, "scope": {}}
+        for example, vector in zip(self.examples, self._vectors):
+            for field in self._sums:
+                total = self._sums[field].setdefault(example[field], Counter())
+                total.update(vector)
+        self.centroids = {
+            field: {label: _normalise(total) for label, total in sums.items()}
+            for field, sums in self._sums.items()
+        }
+
+    def _score(self, field: str, vector: Dict[int, float], rule_hits: Dict[str, int],
+               labels: List[str], centroids: Optional[Dict[str, Dict[int, float]]] = None) -> Dict[str, float]:
+        centroids = centroids if centroids is not None else self.centroids[field]
+        scores = {}
+        for label in labels:
+            score = _dot(vector, centroids[label]) if label in centroids else 0.0
+            if rule_hits.get(f"{field}:{label}"):
+                score += RULE_BONUS
+            scores[label] = score
+        return scores
+
+    def classify(self, query: str, context_employees: Optional[List[str]] = None,
+                 _centroids: Optional[Dict[str, Dict[str, Dict[int, float]]]] = None) -> Dict[str, Any]:
+        """
+        Classify a query into the analysis format of RAGQuerySystem._analyze_query_intent.
+
+        Args:
+            query: The (resolved) user query
+            context_employees: Employees the query refers to, if known
+
+        Returns:
+            Analysis dictionary plus "confidence" (query type), "scope_confidence"
+            and "classifier": "local"
+        """
+        context_employees = context_employees or []
+        # People named in the query count like employees known from the conversation
+        named_people = list(dict.fromkeys(list(context_employees) + mentioned_names(query)))
+        centroids = _centroids or self.centroids
+        vector = embed(query)
+        rule_hits = RULE_MATCHER.find_all(query)
+
+        type_labels = list(QUERY_TYPE_RULES.keys())
+        type_scores = self._score("query_type", vector, rule_hits, type_labels, centroids["query_type"])
+        query_type, confidence = _softmax_confidence(type_scores)
+
+        # Named employees are strong scope evidence
+        scope_labels = ["single_employee", "multiple_employees", "department", "organization-wide"]
+        scope_scores = self._score("scope", vector, rule_hits, scope_labels, centroids["scope"])
+        if len(named_people) == 1 and query_type != "cross_comparison":
+            scope_scores["single_employee"] += RULE_BONUS
+        elif len(named_people) > 1:
+            scope_scores["multiple_employees"] += RULE_BONUS
+        scope, scope_confidence = _softmax_confidence(scope_scores)
+
+        required_data = [
+            value for value in REQUIRED_DATA_RULES if rule_hits.get(f"required_data:{value}")
+        ] or ["general"]
+
+        analysis_depth = "detailed_analysis"
+        for value in ANALYSIS_DEPTH_RULES:
+            if rule_hits.get(f"analysis_depth:{value}"):
+                analysis_depth = value
+                break
+
+        return {
+            "query_type": query_type,
+            "scope": scope,
+            "required_data": required_data,
+            "analysis_depth": analysis_depth,
+            "key_entities": context_employees,
+            "specific_request": query,
+            "confidence": confidence,
+            "scope_confidence": scope_confidence,
+            "classifier": "local"
+        }
+
+    def is_confident(self, classification: Dict[str, Any]) -> bool:
+        """Check whether a classification can be used without asking the LLM."""
+        # The query type drives the response, and scope drives employee limits,
+        # retrieval and workforce statistics, so both must be confident
+        return (classification["confidence"] >= self.confidence_threshold
+                and classification["scope_confidence"] >= self.scope_confidence_threshold)
+
+    def evaluate(self) -> Dict[str, Any]:
+        """
+        Benchmark accuracy and latency with leave-one-out over the examples.
+
+        Each example is classified by centroids trained on all other examples.
+
+        Returns:
+            Dictionary with overall accuracy, coverage (share of queries
+            confident enough to skip the LLM), query type and scope accuracy
+            on that share and classification latency percentiles in milliseconds
+        """
+        type_correct = scope_correct = confident = confident_correct = confident_scope_correct = 0
+        latencies = []
+
+        for example, vector in zip(self.examples, self._vectors):
+            # Centroids without this example
+            centroids = {}
+            for field, sums in self._sums.items():
+                centroids[field] = {}
+                for label, total in sums.items():
+                    if label == example[field]:
+                        total = Counter({index: value - vector.get(index, 0.0) for index, value in total.items()})
+                    centroids[field][label] = _normalise({i: v for i, v in total.items() if v > 1e-9})
+
+            start_time = time.perf_counter()
+            result = self.classify(example["query"], _centroids=centroids)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+            type_ok = result["query_type"] == example["query_type"]
+            scope_ok = result["scope"] == example["scope"]
+            type_correct += type_ok
+            scope_correct += scope_ok
+            if self.is_confident(result):
+                confident += 1
+                confident_correct += type_ok
+                confident_scope_correct += scope_ok
+
+        total = len(self.examples)
+        latencies.sort()
+        return {
+            "examples": total,
+            "query_type_accuracy": type_correct / total if total else 0.0,
+            "scope_accuracy": scope_correct / total if total else 0.0,
+            "coverage": confident / total if total else 0.0,
+            "confident_accuracy": confident_correct / confident if confident else 0.0,
+            "confident_scope_accuracy": confident_scope_correct / confident if confident else 0.0,
+            "p50_ms": latencies[len(latencies) // 2] if latencies else 0.0,
+            "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+        }
+
+if __name__ == "__main__":
+    results = IntentClassifier().evaluate()
+    print(f"Examples:             {results['examples']}")
+    print(f"Query type accuracy:  {results['query_type_accuracy']:.1%}")
+    print(f"Scope accuracy:       {results['scope_accuracy']:.1%}")
+    print(f"Coverage (no LLM):    {results['coverage']:.1%} at thresholds {CONFIDENCE_THRESHOLD} "
+          f"(scope {SCOPE_CONFIDENCE_THRESHOLD})")
+    print(f"Accuracy when local:  {results['confident_accuracy']:.1%} (scope {results['confident_scope_accuracy']:.1%})")
+    print(f"Latency p50 / p95:    {results['p50_ms']:.3f} ms / {results['p95_ms']:.3f} ms")
@@ -0,0 +1,140 @@
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+
+class KeywordMatcher:
+    """
+    Compiled multi-pattern keyword matcher.
+
+    All keywords are folded into a single trie-shaped regular expression, so a
+    text is scanned once regardless of how many keywords are registered.
+    Matches respect word boundaries (a keyword never matches inside a longer
+    word) and, by default, ignore case without lowercasing the input.
+
+    Keywords can be grouped under a label, e.g.
+    {"Hogan Assessment": ["hogan", "hpi", "hds"]}; hits are then reported per
+    label. A keyword may belong to several labels.
+    """
+
+    def __init__(self, keywords: Union[Iterable[str], Dict[str, Iterable[str]]],
+                 case_sensitive: bool = False):
+        """
+        Build the matcher.
+
+        Args:
+            keywords: Either a flat iterable of keywords (each keyword is its own
+                label) or a mapping of label -> keywords
+            case_sensitive: Match case exactly instead of case-insensitively
+        """
+        if isinstance(keywords, dict):
+            groups = keywords
+        else:
+            groups = {keyword: [keyword] for keyword in keywords}
+
+        self.case_sensitive = case_sensitive
+        self.labels: List[str] = list(groups.keys())
+
+        # Map each normalised keyword to the label(s) it reports
+        self._term_labels: Dict[str, List[str]] = {}
+        for label, terms in groups.items():
+            for term in terms:
+                if not term:
+                    continue
+                key = self._normalise(term)
+                labels = self._term_labels.setdefault(key, [])
+                if label not in labels:
+                    labels.append(label)
+
+        self._pattern = self._compile(self._term_labels.keys())
+
+    def _normalise(self, text: str) -> str:
+        return text if self.case_sensitive else text.lower()
+
+    def _compile(self, terms: Iterable[str]):
+        """Compile the keywords into one regex shaped like a character trie."""
+        trie: Dict[str, Any] = {}
+        for term in terms:
+            node = trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[""] = True  # End-of-keyword marker
+
+        if not trie:
+            return None
+
+        flags = 0 if self.case_sensitive else re.IGNORECASE
+        body = self._trie_to_regex(trie)
+        return re.compile(rf"(?<!\w)(?:{body})(?!\w)", flags)
+
+    def _trie_to_regex(self, node: Dict[str, Any]) -> str:
+        """Convert a trie node into a regex fragment (longer keywords are preferred)."""
+        is_terminal = "" in node
+        branches = []
+        for char in sorted(k for k in node if k):
+            branches.append(re.escape(char) + self._trie_to_regex(node[char]))
+
+        if not branches:
+            return ""
+
+        if len(branches) == 1:
+            fragment = branches[0]
+            if is_terminal:
+                # Single continuation that may also stop here
+                return f"(?:{fragment})?"
+            return fragment
+
+        fragment = "(?:" + "|".join(branches) + ")"
+        if is_terminal:
+            fragment += "?"
+        return fragment
+
+    def find_all(self, text: str) -> Dict[str, int]:
+        """
+        Scan the text once and count hits per label.
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            Dictionary of label -> number of hits (labels without hits are omitted)
+        """
+        counts: Counter = Counter()
+        if not text or self._pattern is None:
+            return {}
+
+        for match in self._pattern.finditer(text):
+            for label in self._term_labels.get(self._normalise(match.group(0)), []):
+                counts[label] += 1
+
+        return dict(counts)
+
+    def find_spans(self, text: str) -> List[Tuple[int, int, List[str]]]:
+        """
+        Scan the text once and report every hit with its position.
+
+        Returns:
+            List of (start, end, labels) tuples in text order
+        """
+        if not text or self._pattern is None:
+            return []
+
+        return [
+            (match.start(), match.end(), self._term_labels.get(self._normalise(match.group(0)), []))
+            for match in self._pattern.finditer(text)
+        ]
+
+    def lookup(self, text: str) -> List[str]:
+        """Return the labels of the keyword the whole text is (surrounding whitespace ignored)."""
+        return list(self._term_labels.get(self._normalise(" ".join(text.split())), []))
+
+    def find(self, text: str) -> List[str]:
+        """Return the labels found in the text, in the order they were registered."""
+        hits = self.find_all(text)
+        return [label for label in self.labels if label in hits]
+
+    def contains_any(self, text: str) -> bool:
+        """Check whether the text contains at least one keyword."""
+        if not text or self._pattern is None:
+            return False
+        return self._pattern.search(text) is not None
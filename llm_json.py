@@ -0,0 +1,208 @@
+import json
+import re
+from typing import List, Dict, Any, Optional
+
+# Default number of follow-up requests asking the model to fix invalid output
+REPAIR_ATTEMPTS = 1
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None)
+}
+
+_CODE_FENCE = re.compile(r"```(?:json)?\s*([\s\S]*?)```", re.IGNORECASE)
+
+class StructuredOutputError(ValueError):
+    """Raised when an LLM response cannot be turned into JSON matching the schema."""
+
+    def __init__(self, message: str, raw_text: str = "", errors: Optional[List[str]] = None):
+        super().__init__(message)
+        self.raw_text = raw_text
+        self.errors = errors or []
+
+def _is_type(value: Any, type_name: str) -> bool:
+    if type_name == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if type_name == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, _JSON_TYPES[type_name])
+
+def validate_schema(value: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """
+    Validate a value against a small subset of JSON Schema.
+
+    Supported keywords: type (name or list of names), properties, required,
+    additionalProperties (boolean), items, enum and minItems.
+
+    Args:
+        value: Decoded JSON value
+        schema: Schema dictionary
+        path: Location of the value, used in error messages
+
+    Returns:
+        List of human-readable errors (empty when the value is valid)
+    """
+    errors = []
+
+    expected = schema.get("type")
+    if expected:
+        type_names = expected if isinstance(expected, list) else [expected]
+        if not any(_is_type(value, type_name) for type_name in type_names):
+            return [f"{path}: expected {' or '.join(type_names)}, got {type(value).__name__}"]
+
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing required property '{key}'")
+        for key, item in value.items():
+            if key in properties:
+                errors.extend(validate_schema(item, properties[key], f"{path}.{key}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}: unexpected property '{key}'")
+
+    if isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            errors.append(f"{path}: expected at least {schema['minItems']} items, got {len(value)}")
+        if "items" in schema:
+            for i, item in enumerate(value):
+                errors.extend(validate_schema(item, schema["items"], f"{path}[{i}]"))
+
+    return errors
+
+def extract_json(text: str, expected_type: Optional[str] = None) -> Any:
+    """
+    Extract the first JSON value from model output.
+
+    Handles bare JSON, JSON inside ```json code fences and JSON surrounded by
+    prose. Unlike a greedy regex, each candidate is decoded with
+    JSONDecoder.raw_decode, so trailing text containing braces is ignored.
+
+    Args:
+        text: Raw model output
+        expected_type: "object" or "array" to skip values of the other kind
+
+    Returns:
+        The decoded value
+
+    Raises:
+        StructuredOutputError: If no JSON value (of the expected type) is found
+    """
+    if not text:
+        raise StructuredOutputError("Empty response", text or "")
+
+    decoder = json.JSONDecoder()
+    candidates = [match.group(1) for match in _CODE_FENCE.finditer(text)] + [text]
+    openers = {"object": "{", "array": "["}.get(expected_type, "{[")
+
+    for candidate in candidates:
+        candidate = candidate.strip()
+        for i, char in enumerate(candidate):
+            if char not in openers:
+                continue
+            try:
+                value, _ = decoder.raw_decode(candidate, i)
+            except ValueError:
+                continue
+            if expected_type is None or _is_type(value, expected_type):
+                return value
+
+    raise StructuredOutputError(f"No JSON {expected_type or 'value'} found in response", text)
+
+def _field(value: Any, name: str) -> Any:
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
+
+def usage_counts(usage: Any) -> Dict[str, int]:
+    """
+    Token counts of a chat completion's usage.
+
+    Usage arrives as an object on regular responses but as a plain dict on the
+    final chunk of a stream (the pinned openai client does not model it), so
+    both shapes are read, including the nested prompt_tokens_details.
+
+    Returns:
+        Dictionary with prompt_tokens, cached_tokens, uncached_tokens and
+        completion_tokens
+    """
+    prompt_tokens = _field(usage, "prompt_tokens") or 0
+    details = _field(usage, "prompt_tokens_details")
+    cached_tokens = (_field(details, "cached_tokens") if details is not None else 0) or 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "uncached_tokens": prompt_tokens - cached_tokens,
+        "completion_tokens": _field(usage, "completion_tokens") or 0
+    }
+
+def request_json(client, messages: List[Dict[str, str]], schema: Dict[str, Any],
+                 model: str = "gpt-4.1-2025-04-14", temperature: float = 0.2,
+                 max_tokens: int = 500, repair_attempts: int = REPAIR_ATTEMPTS) -> Any:
+    """
+    Ask the model for JSON and validate it against a schema.
+
+    Object schemas use the API's JSON mode so the response is always
+    syntactically valid JSON. If the response still does not parse or
+    validate, the model is shown the errors and asked for a corrected answer,
+    at most `repair_attempts` times.
+
+    Args:
+        client: OpenAI client
+        messages: Chat messages (must mention JSON for JSON mode)
+        schema: Schema the response has to satisfy (see validate_schema)
+        model: Model name
+        temperature: Sampling temperature
+        max_tokens: Maximum tokens per response
+        repair_attempts: Number of repair requests after a failed parse
+
+    Returns:
+        The decoded, validated JSON value
+
+    Raises:
+        StructuredOutputError: If no valid response was obtained
+    """
+    expected_type = schema.get("type") if schema.get("type") in ("object", "array") else None
+    request_args = {}
+    # JSON mode only guarantees a top-level object
+    if expected_type == "object":
+        request_args["response_format"] = {"type": "json_object"}
+
+    conversation = list(messages)
+    for attempt in range(repair_attempts + 1):
+        response = client.chat.completions.create(
+            model=model,
+            messages=conversation,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **request_args
+        )
+        text = response.choices[0].message.content or ""
+
+        try:
+            value = extract_json(text, expected_type)
+            errors = validate_schema(value, schema)
+        except StructuredOutputError as e:
+            errors = [str(e)]
+
+        if not errors:
+            return value
+
+        print(f"DEBUG: Invalid structured output (attempt {attempt + 1}): {errors[:5]}")
+        if attempt < repair_attempts:
+            conversation = conversation + [
+                {"role": "assistant", "content": text},
+                {"role": "user", "content": (
+                    "Your previous answer was not valid JSON for the requested format:\n"
+                    + "\n".join(f"- {error}" for error in errors[:10])
+                    + "\n\nReturn only the corrected JSON, with no extra commentary."
+                )}
+            ]
+
+    raise StructuredOutputError("Model did not return valid JSON", text, errors)
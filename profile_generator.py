@@ -1,8 +1,39 @@
 import os
 from openai import OpenAI
-from typing import List
+from typing import List, Iterator
 from dotenv import load_dotenv
 import re
+import json
+from keyword_matcher import KeywordMatcher
+from llm_json import request_json, StructuredOutputError
+
+# Content cues for each assessment/document type, in the order they are reported
+DOCUMENT_TYPE_TERMS = {
+    "Hogan Assessment": ["hogan", "hpi", "hds", "mvpi", "motives values preferences", "personality inventory", "development survey"],
+    "360° Feedback": ["360", "360-degree"],
+    "CV/Resume": ["cv", "resume", "résumé", "curriculum vitae", "work history", "professional experience", "education:"],
+    "Intercultural Development Assessment": ["intercultural development inventory", "intercultural sensitivity", "cultural competence"],
+    "Individual Directions Inventory": ["individual directions inventory", "idi report", "directions inventory"],
+    "Performance Review": ["performance review", "annual review", "performance assessment", "performance rating"],
+    "Interview Notes": ["interview notes", "interview summary", "candidate interview"]
+}
+
+DOCUMENT_TYPE_MATCHER = KeywordMatcher(DOCUMENT_TYPE_TERMS)
+
+# Shape of a generated profile: a list of sections
+PROFILE_SCHEMA = {
+    "type": "array",
+    "minItems": 1,
+    "items": {
+        "type": "object",
+        "properties": {
+            "section": {"type": "string"},
+            "content": {"type": "string"},
+            "sources": {"type": "string"}
+        },
+        "required": ["section", "content"]
+    }
+}
 
 # Load environment variables
 load_dotenv()
@@ -27,49 +58,8 @@ class ProfileGenerator:
         # Create a mapping of document types for cleaning up sources later
         doc_type_map = {}
         
-        # Identify the types of documents based on content
-        assessment_types = []
-        
-        # Check for Hogan assessment content
-        hogan_terms = ["hogan", "hpi", "hds", "mvpi", "motives values preferences", "personality inventory", "development survey"]
-        has_hogan = any(term in " ".join(document_chunks).lower() for term in hogan_terms)
-        if has_hogan:
-            assessment_types.append("Hogan Assessment")
-            
-        # Check for 360 content
-        has_360 = "360" in " ".join(document_chunks) or "360-degree" in " ".join(document_chunks).lower()
-        if has_360:
-            assessment_types.append("360° Feedback")
-            
-        # Check for CV/Resume content
-        cv_terms = ["cv", "resume", "résumé", "curriculum vitae", "work history", "professional experience", "education:"]
-        has_cv = any(term in " ".join(document_chunks).lower() for term in cv_terms)
-        if has_cv:
-            assessment_types.append("CV/Resume")
-            
-        # Check for Intercultural Development Inventory
-        intercultural_terms = ["intercultural development inventory", "intercultural sensitivity", "cultural competence"]
-        has_intercultural = any(term in " ".join(document_chunks).lower() for term in intercultural_terms)
-        if has_intercultural:
-            assessment_types.append("Intercultural Development Assessment")
-        
-        # Check for Individual Directions Inventory
-        individual_directions_terms = ["individual directions inventory", "idi report", "directions inventory"]
-        has_directions = any(term in " ".join(document_chunks).lower() for term in individual_directions_terms)
-        if has_directions:
-            assessment_types.append("Individual Directions Inventory")
-        
-        # Check for performance reviews
-        perf_terms = ["performance review", "annual review", "performance assessment", "performance rating"]
-        has_perf = any(term in " ".join(document_chunks).lower() for term in perf_terms)
-        if has_perf:
-            assessment_types.append("Performance Review")
-        
-        # Check for interview notes
-        interview_terms = ["interview notes", "interview summary", "candidate interview"]
-        has_interview = any(term in " ".join(document_chunks).lower() for term in interview_terms)
-        if has_interview:
-            assessment_types.append("Interview Notes")
+        # Identify the types of documents based on content (single pass over all chunks)
+        assessment_types = DOCUMENT_TYPE_MATCHER.find(" ".join(document_chunks))
 
         if metadata:
             for meta in metadata:
@@ -166,23 +156,26 @@ class ProfileGenerator:
             "Remember to format 'Key Strengths', 'Potential Derailers', 'Roles That Would Fit', and 'Roles That Would Not Fit' as numbered lists with proper line breaks between items."
         )
 
-        response = client.chat.completions.create(
-            model="gpt-4.1-2025-04-14",
-            messages=[
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.4,
-            max_tokens=2000
-        )
+        try:
+            profile_json = request_json(
+                client,
+                [
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                PROFILE_SCHEMA,
+                temperature=0.4,
+                max_tokens=2000
+            )
+        except StructuredOutputError as e:
+            # Hand back what the model produced; callers already handle invalid JSON
+            print(f"Error generating structured profile: {e} {e.errors[:3]}")
+            return e.raw_text
 
-        profile_content = response.choices[0].message.content
+        profile_content = json.dumps(profile_json, ensure_ascii=False)
         
         # Clean up sources in the profile content
         try:
-            import json
-            profile_json = json.loads(profile_content)
-            
             for section in profile_json:
                 if "sources" in section:
                     sources = section["sources"]
@@ -224,51 +217,33 @@ class ProfileGenerator:
 
     def answer_question(self, document_chunks: List[str], question: str) -> str:
         """Answer a user question based on the document context."""
+        response = client.chat.completions.create(
+            model="gpt-4.1-2025-04-14",
+            messages=self._build_answer_messages(document_chunks, question),
+            temperature=0.4,
+            max_tokens=4000
+        )
+        return response.choices[0].message.content
+
+    def stream_answer_question(self, document_chunks: List[str], question: str) -> Iterator[str]:
+        """Streaming variant of answer_question, yielding the answer text as it arrives."""
+        stream = client.chat.completions.create(
+            model="gpt-4.1-2025-04-14",
+            messages=self._build_answer_messages(document_chunks, question),
+            temperature=0.4,
+            max_tokens=4000,
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def _build_answer_messages(self, document_chunks: List[str], question: str) -> List[dict]:
+        """Build the chat messages for answer_question / stream_answer_question."""
         context = "\n\n".join(document_chunks)
         
         # Identify the types of documents based on content - same as in generate_profile
-        assessment_types = []
-        
-        # Check for Hogan assessment content
-        hogan_terms = ["hogan", "hpi", "hds", "mvpi", "motives values preferences", "personality inventory", "development survey"]
-        has_hogan = any(term in context.lower() for term in hogan_terms)
-        if has_hogan:
-            assessment_types.append("Hogan Assessment")
-            
-        # Check for 360 content
-        has_360 = "360" in context or "360-degree" in context.lower()
-        if has_360:
-            assessment_types.append("360° Feedback")
-            
-        # Check for CV/Resume content
-        cv_terms = ["cv", "resume", "résumé", "curriculum vitae", "work history", "professional experience", "education:"]
-        has_cv = any(term in context.lower() for term in cv_terms)
-        if has_cv:
-            assessment_types.append("CV/Resume")
-            
-        # Check for Intercultural Development Inventory
-        intercultural_terms = ["intercultural development inventory", "intercultural sensitivity", "cultural competence"]
-        has_intercultural = any(term in context.lower() for term in intercultural_terms)
-        if has_intercultural:
-            assessment_types.append("Intercultural Development Assessment")
-        
-        # Check for Individual Directions Inventory
-        individual_directions_terms = ["individual directions inventory", "idi report", "directions inventory"]
-        has_directions = any(term in context.lower() for term in individual_directions_terms)
-        if has_directions:
-            assessment_types.append("Individual Directions Inventory")
-        
-        # Check for performance reviews
-        perf_terms = ["performance review", "annual review", "performance assessment", "performance rating"]
-        has_perf = any(term in context.lower() for term in perf_terms)
-        if has_perf:
-            assessment_types.append("Performance Review")
-        
-        # Check for interview notes
-        interview_terms = ["interview notes", "interview summary", "candidate interview"]
-        has_interview = any(term in context.lower() for term in interview_terms)
-        if has_interview:
-            assessment_types.append("Interview Notes")
+        assessment_types = DOCUMENT_TYPE_MATCHER.find(context)
             
         # Combine detected document types
         detected_doc_types = ", ".join(assessment_types) if assessment_types else "Submitted Documents"
@@ -311,15 +286,9 @@ End your response with a "References" section that lists all the documents you c
 
 Remember: Only make claims that are directly supported by the documents. Include parenthetical citations for each major claim."""
 
-        response = client.chat.completions.create(
-            model="gpt-4.1-2025-04-14",
-            messages=[
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.4,
-            max_tokens=4000
-        )
-        return response.choices[0].message.content
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": prompt}
+        ]
 
 
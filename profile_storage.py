@@ -0,0 +1,227 @@
+import os
+import json
+import struct
+import tempfile
+import zlib
+from typing import List, Dict, Any, Optional, Union
+
+# Sectioned profile container:
+#   MAGIC | uint32 header length | header JSON | compressed section blobs
+# The header lists every section with its offset/length into the blob area, so
+# a single section can be read and decompressed without touching the others.
+MAGIC = b"KPF1"
+PROFILE_SUFFIX = ".kpf"
+LEGACY_PROFILE_SUFFIX = ".json"
+COMPRESSION_LEVEL = 6
+
+# Group of the classic leadership sections ("Profile Summary", "Key Strengths",
+# ...): the whole list for traditional profiles, the "traditional_sections" list
+# for enhanced ones. Each entry is stored separately so it can be fetched by name
+TRADITIONAL_SECTIONS_KEY = "traditional_sections"
+
+# Key used when a profile is not valid JSON and is stored verbatim
+RAW_SECTION_KEY = "__raw__"
+
+TEMP_SUFFIX = ".tmp"
+
+def _fsync_directory(directory: str):
+    """Flush a directory entry so a completed rename survives a crash (POSIX only)."""
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+def atomic_write(path: str, data: Union[str, bytes], fsync: bool = True):
+    """
+    Write a file so readers only ever see the old or the new content.
+
+    The data is written to a temporary file in the same directory and then
+    renamed over the target, which is atomic on POSIX and Windows.
+
+    Args:
+        path: Destination file path
+        data: Text or bytes to write
+        fsync: Flush the file and its directory entry to disk before returning
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=TEMP_SUFFIX)
+    try:
+        mode = 'wb' if isinstance(data, bytes) else 'w'
+        with os.fdopen(fd, mode, **({} if mode == 'wb' else {'encoding': 'utf-8'})) as f:
+            f.write(data)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if fsync:
+        _fsync_directory(directory)
+
+def is_profile_file(file_name: str) -> bool:
+    """Check whether a file name looks like a stored profile (new or legacy format)."""
+    return file_name.endswith(PROFILE_SUFFIX) or file_name.endswith(LEGACY_PROFILE_SUFFIX)
+
+def list_section_key(entry: Any, position: int) -> str:
+    """Key of a classic section entry: its "section" name, or "#<position>" without one."""
+    key = entry.get('section') if isinstance(entry, dict) else None
+    return key or f"#{position}"
+
+def section_refs(keys: List[str]) -> List[str]:
+    """Stable, unique names for profile sections (repeated keys get a counter)."""
+    refs = []
+    seen = {}
+    for key in keys:
+        seen[key] = seen.get(key, 0) + 1
+        refs.append(key if seen[key] == 1 else f"{key} ({seen[key]})")
+    return refs
+
+def split_profile(profile_json: str) -> Dict[str, Any]:
+    """
+    Split a profile JSON string into addressable sections.
+
+    Traditional profiles (a list of {"section", "content", ...}) become one
+    section per entry, keyed by section name. Enhanced profiles (a dict) become
+    one section per top-level key, except that the entries of
+    "traditional_sections" are stored individually. In both cases the classic
+    sections carry the group "traditional_sections".
+
+    Returns:
+        {"kind": "list"|"dict"|"raw", "sections": [{"key", "group", "value"}, ...]}
+    """
+    try:
+        profile_data = json.loads(profile_json)
+    except (TypeError, ValueError):
+        profile_data = None
+
+    sections = []
+    if isinstance(profile_data, list):
+        kind = "list"
+        for i, entry in enumerate(profile_data):
+            sections.append({"key": list_section_key(entry, i), "group": TRADITIONAL_SECTIONS_KEY, "value": entry})
+    elif isinstance(profile_data, dict):
+        kind = "dict"
+        for key, value in profile_data.items():
+            if key == TRADITIONAL_SECTIONS_KEY and isinstance(value, list) and value:
+                for i, entry in enumerate(value):
+                    sections.append({"key": list_section_key(entry, i), "group": key, "value": entry})
+            else:
+                sections.append({"key": key, "group": None, "value": value})
+    else:
+        kind = "raw"
+        sections.append({"key": RAW_SECTION_KEY, "group": None, "value": profile_json})
+
+    return {"kind": kind, "sections": sections}
+
+def join_profile(kind: str, sections: List[Dict[str, Any]]) -> str:
+    """Inverse of split_profile: rebuild the profile JSON string."""
+    if kind == "raw":
+        return sections[0]["value"] if sections else ""
+
+    if kind == "list":
+        return json.dumps([section["value"] for section in sections], ensure_ascii=False)
+
+    profile_data = {}
+    for section in sections:
+        if section["group"]:
+            profile_data.setdefault(section["group"], []).append(section["value"])
+        else:
+            profile_data[section["key"]] = section["value"]
+    return json.dumps(profile_data, ensure_ascii=False)
+
+def encode_profile(profile_json: str) -> bytes:
+    """Encode a profile JSON string into the compressed sectioned container."""
+    split = split_profile(profile_json)
+
+    entries = []
+    blobs = []
+    offset = 0
+    for section in split["sections"]:
+        if split["kind"] == "raw":
+            payload = section["value"].encode('utf-8')
+        else:
+            payload = json.dumps(section["value"], ensure_ascii=False).encode('utf-8')
+        blob = zlib.compress(payload, COMPRESSION_LEVEL)
+        entries.append({
+            "key": section["key"],
+            "group": section["group"],
+            "offset": offset,
+            "length": len(blob)
+        })
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = json.dumps({"kind": split["kind"], "codec": "zlib", "sections": entries},
+                        ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return MAGIC + struct.pack(">I", len(header)) + header + b"".join(blobs)
+
+def _read_header(f) -> Dict[str, Any]:
+    """Read the container header and remember where the blob area starts."""
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a sectioned profile container")
+    (header_length,) = struct.unpack(">I", f.read(4))
+    header = json.loads(f.read(header_length).decode('utf-8'))
+    header["data_start"] = len(MAGIC) + 4 + header_length
+    return header
+
+def _decode_section(f, header: Dict[str, Any], entry: Dict[str, Any]) -> Any:
+    f.seek(header["data_start"] + entry["offset"])
+    payload = zlib.decompress(f.read(entry["length"])).decode('utf-8')
+    return payload if header["kind"] == "raw" else json.loads(payload)
+
+def _matches(entry: Dict[str, Any], section_names: Optional[List[str]]) -> bool:
+    return section_names is None or entry["key"] in section_names or entry["group"] in section_names
+
+def read_profile_sections(path: str, section_names: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Read selected sections of a stored profile.
+
+    Only the requested sections are decompressed and parsed. Legacy plain JSON
+    files are supported but have to be parsed in full.
+
+    Args:
+        path: Profile file path (.kpf or legacy .json)
+        section_names: Section keys and/or group names to return; None for all
+
+    Returns:
+        {"kind": "list"|"dict"|"raw", "sections": [{"key", "group", "value"}, ...]}
+    """
+    if not path.endswith(PROFILE_SUFFIX):
+        with open(path, 'r') as f:
+            split = split_profile(f.read())
+        split["sections"] = [s for s in split["sections"] if _matches(s, section_names)]
+        return split
+
+    with open(path, 'rb') as f:
+        header = _read_header(f)
+        sections = [
+            {"key": entry["key"], "group": entry["group"], "value": _decode_section(f, header, entry)}
+            for entry in header["sections"]
+            if _matches(entry, section_names)
+        ]
+    return {"kind": header["kind"], "sections": sections}
+
+def read_profile(path: str) -> str:
+    """Read a stored profile back as a JSON string (any storage format)."""
+    if not path.endswith(PROFILE_SUFFIX):
+        with open(path, 'r') as f:
+            return f.read()
+
+    split = read_profile_sections(path)
+    return join_profile(split["kind"], split["sections"])
+
+def write_profile(path: str, profile_json: str, fsync: bool = True):
+    """Atomically write a profile, using the container format for .kpf paths."""
+    if path.endswith(PROFILE_SUFFIX):
+        atomic_write(path, encode_profile(profile_json), fsync=fsync)
+    else:
+        atomic_write(path, profile_json, fsync=fsync)
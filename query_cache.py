@@ -0,0 +1,230 @@
+import os
+import json
+import math
+import atexit
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+from profile_storage import atomic_write
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are merged but not serialised across processes
+    fcntl = None
+
+# Persisted caches write changes at most this often (set() only schedules a save)
+SAVE_INTERVAL_SECONDS = 5.0
+
+# Persisted caches with unsaved changes are flushed at interpreter exit
+_PERSISTED_CACHES: "weakref.WeakSet" = weakref.WeakSet()
+
+@atexit.register
+def _save_all():
+    for cache in list(_PERSISTED_CACHES):
+        cache.save()
+
+class QueryCache:
+    """
+    Small LRU cache with time-to-live and optional persistence to a JSON file.
+
+    Entries may carry an embedding so that near-identical (paraphrased) keys can
+    be matched by cosine similarity in addition to exact key lookups.
+
+    Several instances (one per session, or in other processes) may share a
+    file: saves are batched, and each save merges the entries on disk into
+    this instance before writing, so no instance drops another's entries.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 500,
+                 ttl_seconds: float = 7 * 24 * 3600,
+                 save_interval_seconds: float = SAVE_INTERVAL_SECONDS):
+        """
+        Initialize the cache, loading persisted entries if a path is given.
+
+        Args:
+            path: JSON file used to persist entries across restarts (None for memory only)
+            max_entries: Least recently used entries are evicted beyond this size
+            ttl_seconds: Entries older than this are treated as missing
+            save_interval_seconds: Delay before changes are written to the file
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.save_interval_seconds = save_interval_seconds
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False  # Changes not written to the file yet
+        self._cleared = False  # Next save replaces the file instead of merging
+        self._save_timer: Optional[threading.Timer] = None
+        self.hits = 0
+        self.misses = 0
+
+        if path:
+            with self._lock:
+                self._merge_locked(self._read_file())
+            _PERSISTED_CACHES.add(self)
+
+    def _read_file(self) -> List[list]:
+        """Persisted [key, entry] pairs ([] if there is no readable file)."""
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not load query cache {self.path}: {e}")
+            return []
+
+    def _merge_locked(self, stored: List[list]):
+        """
+        Add persisted entries that are newer than (or missing from) this
+        instance's, skipping expired ones. Entries only seen on disk count as
+        least recently used here.
+        """
+        now = time.time()
+        for key, entry in stored:
+            if self._is_expired(entry, now):
+                continue
+            current = self._entries.get(key)
+            if current is None:
+                self._entries[key] = entry
+                self._entries.move_to_end(key, last=False)
+            elif entry["created"] > current["created"]:
+                self._entries[key] = entry
+        self._evict_locked()
+
+    @contextmanager
+    def _file_locked(self):
+        """Serialise read-merge-write cycles on the file across processes."""
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # Closing the descriptor also releases the flock
+            os.close(fd)
+
+    def save(self):
+        """Write unsaved changes now (no-op for memory-only caches)."""
+        if not self.path:
+            return
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if not self._dirty:
+                return
+            replace = self._cleared
+            self._dirty = self._cleared = False
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with self._file_locked():
+                stored = [] if replace else self._read_file()
+                with self._lock:
+                    self._merge_locked(stored)
+                    snapshot = list(self._entries.items())
+                atomic_write(self.path, json.dumps(snapshot, ensure_ascii=False), fsync=False)
+        except OSError as e:
+            print(f"Warning: Could not save query cache {self.path}: {e}")
+            with self._lock:
+                self._dirty = True
+                self._cleared = self._cleared or replace
+
+    def _schedule_save_locked(self):
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(self.save_interval_seconds, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _is_expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return now - entry["created"] > self.ttl_seconds
+
+    def _evict_locked(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for a key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._is_expired(entry, time.time()):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["value"]
+
+    def find_similar(self, embedding: List[float], threshold: float) -> Optional[Any]:
+        """
+        Return the value of the most similar entry whose stored embedding has a
+        cosine similarity of at least `threshold`, or None.
+        """
+        now = time.time()
+        best_key = None
+        best_score = threshold
+        with self._lock:
+            for key, entry in self._entries.items():
+                stored = entry.get("embedding")
+                if not stored or self._is_expired(entry, now):
+                    continue
+                score = _cosine_similarity(embedding, stored)
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key]["value"]
+
+    def set(self, key: str, value: Any, embedding: Optional[List[float]] = None, persist: bool = True):
+        """
+        Store a value (must be JSON-serialisable when the cache is persisted).
+
+        Args:
+            key: Cache key
+            value: Value to store
+            embedding: Optional embedding of the key for similarity lookups
+            persist: Include the entry in the next (batched) save to disk
+        """
+        with self._lock:
+            self._entries[key] = {"value": value, "created": time.time(), "embedding": embedding}
+            self._entries.move_to_end(key)
+            self._evict_locked()
+            if persist and self.path:
+                self._dirty = True
+                self._schedule_save_locked()
+
+    def clear(self):
+        """Remove every entry (and the persisted copy)."""
+        with self._lock:
+            self._entries.clear()
+            self._dirty = self._cleared = True
+        self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+def _cosine_similarity(a: List[float], b: List[float]) -> float:
+    if len(a) != len(b):
+        return 0.0
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
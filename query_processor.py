@@ -1,12 +1,163 @@
 import os
 from openai import OpenAI
 import re
-from typing import Dict, Any, List, Tuple
-import json
+import math
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from keyword_matcher import KeywordMatcher
+from query_cache import QueryCache
+from llm_json import request_json, StructuredOutputError
+from employee_database import (
+    COMMON_TRAITS, LEADERSHIP_STYLES, DEPARTMENTS, DEPARTMENT_SYNONYMS, canonical_department
+)
+from vector_store import native_where
+
+# Extra surface forms for the trait vocabulary (canonical trait -> variants)
+TRAIT_SYNONYMS = {
+    "analytical": ["analytic", "analytically minded"],
+    "creative": ["creatives"],
+    "detail-oriented": ["detail oriented", "detail focused", "detail-focused"],
+    "strategic": ["strategic thinker", "strategic thinkers"],
+    "collaborative": ["collaborator", "collaborators", "team player", "team players"],
+    "extroverted": ["extrovert", "extroverts", "extraverted", "extravert", "extraverts", "outgoing"],
+    "introverted": ["introvert", "introverts"],
+    "adaptable": ["flexible"],
+    "innovative": ["innovator", "innovators"],
+    "communicative": ["communicator", "communicators", "communication", "communication skills"],
+    "visionary": ["visionaries"]
+}
+
+# Role nouns recognised locally (canonical role -> surface forms)
+ROLE_TERMS = {
+    "engineer": ["engineer", "engineers"],
+    "developer": ["developer", "developers"],
+    "manager": ["manager", "managers"],
+    "director": ["director", "directors"],
+    "executive": ["executive", "executives", "exec", "execs"],
+    "leader": ["leader", "leaders"],
+    "analyst": ["analyst", "analysts"],
+    "designer": ["designer", "designers"],
+    "consultant": ["consultant", "consultants"],
+    "specialist": ["specialist", "specialists"],
+    "scientist": ["scientist", "scientists"],
+    "architect": ["architect", "architects"],
+    "marketer": ["marketer", "marketers"],
+    "salesperson": ["salesperson", "salespeople", "account executive", "account executives"],
+    "product manager": ["product manager", "product managers", "pm", "pms"],
+    "recruiter": ["recruiter", "recruiters"],
+    "accountant": ["accountant", "accountants"]
+}
+
+# Words that carry no search criteria; ignored when scoring local coverage
+QUERY_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "in", "on", "at", "to", "for", "from", "with",
+    "who", "whom", "which", "what", "are", "is", "be", "who's", "whos", "that", "have", "has",
+    "find", "show", "list", "get", "give", "search", "me", "us", "i", "we", "our", "my",
+    "all", "any", "some", "most", "more", "very", "highly", "really", "good", "great", "strong",
+    "people", "person", "employees", "employee", "staff", "team", "members", "member",
+    "someone", "somebody", "anyone", "folks", "individuals", "colleagues",
+    "department", "dept", "looking", "need", "want", "please", "also", "both", "style", "leadership"
+}
+
+# Negations ("not creative", "non-technical", "isn't") invert a criterion, which the
+# vocabulary match cannot express; such queries are left to the LLM
+NEGATION_PATTERN = re.compile(r"\b(?:not|no|without|except|excluding)\b|\bnon-|n['’]t\b", re.IGNORECASE)
+
+def _build_vocabulary_matcher() -> KeywordMatcher:
+    """One matcher over every known vocabulary, labelled "<field>:<canonical value>"."""
+    groups = {}
+    for trait in COMMON_TRAITS:
+        groups[f"traits:{trait}"] = [trait] + TRAIT_SYNONYMS.get(trait, [])
+    for style in LEADERSHIP_STYLES:
+        groups.setdefault(f"leadership_style:{style}", []).append(style)
+    for role, terms in ROLE_TERMS.items():
+        groups[f"roles:{role}"] = terms
+    for department in DEPARTMENTS:
+        groups[f"departments:{department}"] = [department] + DEPARTMENT_SYNONYMS.get(department, [])
+    return KeywordMatcher(groups)
+
+VOCABULARY_MATCHER = _build_vocabulary_matcher()
+
+# Relative weight of each field when ranking filtered search results
+FILTER_FIELD_WEIGHTS = {
+    "traits": 1.0,
+    "leadership_style": 1.0,
+    "roles": 1.0,
+    "departments": 1.0
+}
+
+# Shape of an LLM query parse (extra keys such as "experience" are allowed)
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+PARSED_QUERY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "traits": _STRING_LIST,
+        "leadership_style": _STRING_LIST,
+        "roles": _STRING_LIST,
+        "departments": _STRING_LIST,
+        "explanation": {"type": "string"}
+    },
+    "required": ["explanation"]
+}
+
+# Confidence below which parse_query falls back to the LLM
+LOCAL_PARSE_THRESHOLD = 0.75
+
+# Persistent caches for LLM parses and result explanations
+CACHE_DIR = "query_cache"
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+CACHE_MAX_ENTRIES = 1000
+
+# Paraphrase matching for the parse cache (off by default: it costs an
+# embedding call on every cache miss)
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_MATCH_THRESHOLD = 0.95
+
+# Filtered results needed from the speculative search in QueryProcessor.search
+# before it skips the follow-up filtered vector search
+SPECULATIVE_MIN_RESULTS = 3
+
+def normalise_query(query: str) -> str:
+    """Canonical form of a query used as cache key (case, spacing and punctuation folded)."""
+    words = re.findall(r"[\w'-]+", query.lower())
+    return " ".join(words)
+
+def describe_criteria(parsed_query: Dict[str, Any]) -> str:
+    """Short noun phrase for the parsed search criteria, e.g. "strategic engineers in Sales"."""
+    subject = " ".join(dict.fromkeys(parsed_query.get("traits", []) + parsed_query.get("leadership_style", [])))
+    roles = ", ".join(f"{role}s" for role in parsed_query.get("roles", [])) or "employees"
+    description = f"{subject + ' ' if subject else ''}{roles}"
+    if parsed_query.get("departments"):
+        description += f" in {', '.join(parsed_query['departments'])}"
+    return description
+
+def _join_names(names: List[str]) -> str:
+    """Join names as "A", "A and B" or "A, B and C"."""
+    if len(names) <= 1:
+        return "".join(names)
+    return f"{', '.join(names[:-1])} and {names[-1]}"
+
+def _percentile(values: List[float], percentile: float) -> float:
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(percentile / 100 * len(ordered)) - 1)
+    return ordered[rank]
 
 class QueryProcessor:
-    def __init__(self):
-        """Initialize the query processor with OpenAI client."""
+    def __init__(self, cache_dir: Optional[str] = CACHE_DIR, semantic_cache: bool = False):
+        """
+        Initialize the query processor with OpenAI client.
+
+        Args:
+            cache_dir: Directory for the persistent parse/explanation caches
+                (None keeps them in memory only)
+            semantic_cache: Also match paraphrased queries in the parse cache by
+                embedding similarity
+        """
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is not set.")
@@ -43,6 +194,101 @@ Output: {
   "explanation": "Looking for analytical people in the marketing department"
 }
 """
+
+        # Queries built only from known vocabulary are parsed locally
+        self.local_parse_threshold = LOCAL_PARSE_THRESHOLD
+
+        # Recent parse latencies per path (seconds), for get_parse_stats
+        self.parse_latencies = {
+            "local": deque(maxlen=1000),
+            "cache": deque(maxlen=1000),
+            "llm": deque(maxlen=1000)
+        }
+
+        # LLM results are pure functions of their inputs, so cache them
+        self.semantic_cache = semantic_cache
+        self.parse_cache = QueryCache(
+            os.path.join(cache_dir, "parsed_queries.json") if cache_dir else None,
+            max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS
+        )
+        self.explanation_cache = QueryCache(
+            os.path.join(cache_dir, "explanations.json") if cache_dir else None,
+            max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS
+        )
+
+        # Background LLM work (optional explanation enrichment)
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="query-processor")
+
+    def _parse_query_locally(self, query: str) -> Tuple[Dict[str, Any], float]:
+        """
+        Parse a query using the known vocabularies only.
+
+        Confidence is the share of the query's content words (everything but
+        stopwords) covered by recognised terms, and 0 for negated queries.
+
+        Args:
+            query: Natural language query from the user
+
+        Returns:
+            tuple: (parsed query in the same shape as the LLM output, confidence 0-1)
+        """
+        parsed = {}
+        covered = set()
+
+        for start, end, labels in VOCABULARY_MATCHER.find_spans(query):
+            covered.update(range(start, end))
+            for label in labels:
+                field, value = label.split(":", 1)
+                values = parsed.setdefault(field, [])
+                if value not in values:
+                    values.append(value)
+
+        content_words = [
+            match for match in re.finditer(r"[\w'-]+", query)
+            if match.group(0).lower() not in QUERY_STOPWORDS
+        ]
+        if not parsed or not content_words or NEGATION_PATTERN.search(query):
+            return parsed, 0.0
+
+        covered_words = sum(1 for match in content_words if match.start() in covered)
+        confidence = covered_words / len(content_words)
+
+        # Template explanation, mirroring the LLM's phrasing
+        parsed["explanation"] = f"Looking for {describe_criteria(parsed)}"
+
+        return parsed, confidence
+
+    def get_parse_stats(self) -> Dict[str, Any]:
+        """
+        Report how many recent queries were parsed locally and the latency of each path.
+
+        Returns:
+            Dictionary with 'total', 'local_fraction' and per-path 'count',
+            'p50_ms' and 'p95_ms'
+        """
+        stats = {}
+        for path, latencies in self.parse_latencies.items():
+            values = list(latencies)
+            stats[path] = {
+                "count": len(values),
+                "p50_ms": _percentile(values, 50) * 1000,
+                "p95_ms": _percentile(values, 95) * 1000
+            }
+        total = sum(stats[path]["count"] for path in self.parse_latencies)
+        stats["total"] = total
+        stats["local_fraction"] = stats["local"]["count"] / total if total else 0.0
+        stats["parse_cache"] = self.parse_cache.stats()
+        stats["explanation_cache"] = self.explanation_cache.stats()
+        return stats
+
+    def _embed(self, text: str) -> Optional[List[float]]:
+        """Embed text for paraphrase matching; None if the call fails."""
+        try:
+            response = self.client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+            return response.data[0].embedding
+        except Exception as e:
+            print(f"Error embedding query for cache lookup: {e}")
+            return None
     
     def parse_query(self, query: str) -> Dict[str, Any]:
         """
@@ -54,91 +300,257 @@ Output: {
         Returns:
             Dictionary of extracted search parameters
         """
-        prompt = f"Parse the following query about employees and extract structured search parameters:\n\n{query}"
+        # Fast path: deterministic parse when the query only uses known vocabulary
+        start_time = time.perf_counter()
+        local_parse, confidence = self._parse_query_locally(query)
+        if confidence >= self.local_parse_threshold:
+            local_parse["parser"] = "local"
+            local_parse["confidence"] = confidence
+            self.parse_latencies["local"].append(time.perf_counter() - start_time)
+            return local_parse
         
-        response = self.client.chat.completions.create(
-            model="gpt-4.1-2025-04-14",
-            messages=[
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-            max_tokens=500
-        )
+        # Previously parsed by the LLM (exact, then optionally paraphrased match)
+        cache_key = normalise_query(query)
+        cached = self.parse_cache.get(cache_key)
+        embedding = None
+        if cached is None and self.semantic_cache:
+            embedding = self._embed(cache_key)
+            if embedding is not None:
+                cached = self.parse_cache.find_similar(embedding, SEMANTIC_MATCH_THRESHOLD)
+        if cached is not None:
+            self.parse_latencies["cache"].append(time.perf_counter() - start_time)
+            return dict(cached, cached=True)
+
+        parsed_query = self._parse_query_with_llm(query)
+        self.parse_latencies["llm"].append(time.perf_counter() - start_time)
+
+        # Failed parses are not cached so the next attempt can succeed
+        if "error" not in parsed_query:
+            self.parse_cache.set(cache_key, parsed_query, embedding=embedding)
+        return parsed_query
+
+    def search(self, query: str, vector_store, n_results: int = 10,
+               enrich_with_llm: bool = False) -> Dict[str, Any]:
+        """
+        Parse, search and explain a query as one pipeline.
         
-        parsed_text = response.choices[0].message.content
+        The query is parsed in the background while an unfiltered vector search
+        runs speculatively; the filters are applied to its results when the
+        parse arrives. A filtered search is only issued afterwards if fewer than
+        SPECULATIVE_MIN_RESULTS candidates survive and the filters contain conditions
+        the vector store can push down (otherwise it would return the same
+        chunks). The optional LLM explanation runs while results render.
+
+        Args:
+            query: Natural language query from the user
+            vector_store: VectorStore to search
+            n_results: Maximum number of results to return
+            enrich_with_llm: Start an LLM-written explanation in the background
+
+        Returns:
+            Processed search results (see process_search_results) plus
+            "timings" in seconds for the parse, vector and total stages
+        """
+        start_time = time.perf_counter()
+        timings = {}
+
+        def timed_parse():
+            parse_start = time.perf_counter()
+            parsed = self.parse_query(query)
+            timings["parse"] = time.perf_counter() - parse_start
+            return parsed
+
+        parse_future = self.executor.submit(timed_parse)
+
+        # Speculative unfiltered search while the parse is in flight
+        vector_start = time.perf_counter()
+        candidates = vector_store.search_employees(query, n_results=n_results)
+        timings["vector"] = time.perf_counter() - vector_start
+
+        parsed_query = parse_future.result()
+        filters = self.convert_to_filters(parsed_query)
+        results = vector_store.filter_search_results(candidates, filters)
+
+        if filters and len(results) < min(SPECULATIVE_MIN_RESULTS, n_results) and native_where(filters):
+            print(f"DEBUG: Speculative search kept {len(results)} results, running filtered search")
+            fallback_start = time.perf_counter()
+            results = vector_store.search_employees(query, filters, n_results=n_results)
+            timings["fallback"] = time.perf_counter() - fallback_start
+
+        processed_results = self.process_search_results(
+            results, query, parsed_query, enrich_with_llm=enrich_with_llm
+        )
+        timings["total"] = time.perf_counter() - start_time
+        processed_results["timings"] = timings
+        return processed_results
+
+    def _parse_query_with_llm(self, query: str) -> Dict[str, Any]:
+        """Parse a query with the LLM (slow path for queries the local parser is unsure about)."""
+        prompt = f"Parse the following query about employees and extract structured search parameters:\n\n{query}"
         
-        # Extract JSON from the response
         try:
-            # Look for JSON pattern in the response
-            json_match = re.search(r'({[\s\S]*})', parsed_text)
-            if json_match:
-                parsed_json = json.loads(json_match.group(1))
-                return parsed_json
-            else:
-                # If no JSON format is found, return empty dict with error
-                return {
-                    "error": "Failed to parse query into structured format",
-                    "raw_query": query
-                }
-        except Exception as e:
+            parsed_json = request_json(
+                self.client,
+                [
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                PARSED_QUERY_SCHEMA,
+                temperature=0.2,
+                max_tokens=500
+            )
+            parsed_json["parser"] = "llm"
+            return parsed_json
+        except StructuredOutputError as e:
             return {
-                "error": f"Error parsing query: {str(e)}",
+                "error": f"Failed to parse query into structured format: {str(e)}",
                 "raw_query": query
             }
     
-    def convert_to_filters(self, parsed_query: Dict[str, Any]) -> Dict[str, Any]:
+    def convert_to_filters(self, parsed_query: Dict[str, Any],
+                           weights: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
         """
-        Convert parsed query parameters to vector store filters.
+        Convert parsed query parameters to a boolean vector store filter tree.
+
+        Every value of a field is kept: values of the same field are OR-ed and
+        the fields are AND-ed, e.g. "strategic or visionary engineers in Sales":
+
+            {"$and": [
+                {"$or": [{"traits": {"$regex": ".*strategic.*"}},
+                         {"traits": {"$regex": ".*visionary.*"}}]},
+                {"roles": {"$regex": ".*engineer.*"}},
+                {"department": {"$in": ["Sales"]}}
+            ]}
+
+        A term parsed into several fields ("visionary" is both a trait and a
+        leadership style) is a single requirement, so the fields sharing a term
+        are OR-ed in one clause instead of each being required.
         
         Args:
             parsed_query: Dictionary of parsed query parameters
+            weights: Optional field -> weight used to rank matches (fields not
+                listed weigh 1.0); see FILTER_FIELD_WEIGHTS
             
         Returns:
-            Filters dictionary for vector store query
-        """
-        filters = {}
-        
-        # Process traits
-        if "traits" in parsed_query and parsed_query["traits"]:
-            traits = parsed_query["traits"]
-            # For simplicity, just use the first trait as a filter
-            # Our custom filtering in vector_store will handle multiple traits
-            if traits:
-                trait_filter = f".*{traits[0]}.*"
-                filters["traits"] = {"$regex": trait_filter}
-        
-        # Process roles
-        if "roles" in parsed_query and parsed_query["roles"]:
-            roles = parsed_query["roles"]
-            # For simplicity, just use the first role as a filter
-            # Our custom filtering in vector_store will handle multiple roles
-            if roles:
-                role_filter = f".*{roles[0]}.*"
-                filters["roles"] = {"$regex": role_filter}
-        
-        # Process departments
-        if "departments" in parsed_query and parsed_query["departments"]:
-            departments = parsed_query["departments"]
-            if len(departments) > 0:
-                filters["department"] = departments[0]
-        
-        return filters
+            Filter tree for VectorStore.search_employees ({} when there is nothing to filter on)
+        """
+        weights = {**FILTER_FIELD_WEIGHTS, **(weights or {})}
+        clauses = []
+
+        # Traits, leadership styles and roles are comma-joined strings in the
+        # chunk metadata, so each value becomes a case-insensitive substring match
+        field_values = {}
+        for field in ("traits", "leadership_style", "roles"):
+            values = [str(value).strip() for value in parsed_query.get(field) or [] if str(value).strip()]
+            if values:
+                field_values[field] = list(dict.fromkeys(values))
+
+        # Group the fields that share a term (in field order)
+        field_groups: List[List[str]] = []
+        for field, values in field_values.items():
+            lowered = {value.lower() for value in values}
+            linked = [
+                group for group in field_groups
+                if any(lowered & {value.lower() for value in field_values[other]} for other in group)
+            ]
+            field_groups = [group for group in field_groups if group not in linked]
+            field_groups.append([other for group in linked for other in group] + [field])
+        field_groups.sort(key=lambda group: list(field_values).index(group[0]))
+
+        for group in field_groups:
+            alternatives = []
+            for field in group:
+                terms = [{field: {"$regex": f".*{re.escape(value)}.*"}} for value in field_values[field]]
+                if weights.get(field, 1.0) != 1.0:
+                    part = terms[0] if len(terms) == 1 else {"$or": terms}
+                    alternatives.append({"$and": [part], "$weight": weights[field]})
+                else:
+                    alternatives.extend(terms)
+            clauses.append(alternatives[0] if len(alternatives) == 1 else {"$or": alternatives})
+
+        # Departments are stored verbatim, so they can be matched exactly (and
+        # pushed down to the vector store) once mapped to the canonical names
+        departments = [
+            canonical_department(str(department))
+            for department in parsed_query.get("departments") or []
+            if str(department).strip()
+        ]
+        if departments:
+            clause = {"department": {"$in": list(dict.fromkeys(departments))}}
+            if weights.get("departments", 1.0) != 1.0:
+                clause = {"$and": [clause], "$weight": weights["departments"]}
+            clauses.append(clause)
+
+        if not clauses:
+            return {}
+        if len(clauses) == 1:
+            return clauses[0]
+        return {"$and": clauses}
     
     def generate_explanation(self, results: List[Dict[str, Any]], 
                             original_query: str, 
-                            parsed_query: Dict[str, Any]) -> str:
+                            parsed_query: Dict[str, Any],
+                            use_llm: bool = False) -> str:
         """
         Generate a natural language explanation of the search results.
         
+        The default is a local template, which needs no model round trip. The
+        LLM-written version is available with use_llm=True, or in the
+        background with explain_async.
+
         Args:
             results: List of search results
             original_query: The original user query
             parsed_query: The parsed query parameters
+            use_llm: Have the LLM write the explanation
             
         Returns:
             Natural language explanation
         """
+        if use_llm:
+            return self._generate_llm_explanation(results, original_query, parsed_query)
+
+        result_count = len(results)
+        names = [r["metadata"].get("name", "Unknown") for r in results[:5]]
+
+        has_criteria = any(parsed_query.get(field) for field in ("traits", "leadership_style", "roles", "departments"))
+        target = describe_criteria(parsed_query) if has_criteria else f'"{original_query}"'
+
+        if result_count == 0:
+            return f"No matches found for {target}."
+
+        noun = "match" if result_count == 1 else "matches"
+        explanation = f"Found {result_count} {noun} for {target}"
+        # Mirror the LLM prompt: only name everyone when there are 3 or fewer
+        if result_count <= 3:
+            explanation += f": {_join_names(names)}."
+        else:
+            explanation += f". Top matches: {_join_names(names[:3])}."
+        return explanation
+
+    def explain_async(self, results: List[Dict[str, Any]],
+                      original_query: str,
+                      parsed_query: Dict[str, Any]) -> Future:
+        """
+        Start an LLM-written explanation in the background.
+
+        Returns:
+            Future resolving to the explanation text
+        """
+        return self.executor.submit(self._generate_llm_explanation, results, original_query, parsed_query)
+
+    def _generate_llm_explanation(self, results: List[Dict[str, Any]],
+                                  original_query: str,
+                                  parsed_query: Dict[str, Any]) -> str:
+        """Have the LLM write the explanation (cached per query and result set)."""
+        # The explanation only depends on the query and which employees were found
+        cache_key = normalise_query(original_query) + "|" + ",".join(
+            str(r.get("employee_id")) for r in results
+        )
+        cached = self.explanation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         # Prepare context for the explanation
         result_count = len(results)
         
@@ -175,11 +587,14 @@ Keep it concise (1-2 sentences). Don't list all employees by name unless there a
             max_tokens=200
         )
         
-        return response.choices[0].message.content
+        explanation = response.choices[0].message.content
+        self.explanation_cache.set(cache_key, explanation)
+        return explanation
     
     def process_search_results(self, results: List[Dict[str, Any]], 
                               original_query: str, 
-                              parsed_query: Dict[str, Any]) -> Dict[str, Any]:
+                              parsed_query: Dict[str, Any],
+                              enrich_with_llm: bool = False) -> Dict[str, Any]:
         """
         Process and format search results with explanations.
         
@@ -187,6 +602,9 @@ Keep it concise (1-2 sentences). Don't list all employees by name unless there a
             results: Raw search results from vector store
             original_query: Original natural language query
             parsed_query: Parsed query parameters
+            enrich_with_llm: Also start an LLM-written explanation in the
+                background; its future is returned as "explanation_future" and
+                can replace the template explanation once it completes
             
         Returns:
             Processed search results with explanation
@@ -199,6 +617,7 @@ Keep it concise (1-2 sentences). Don't list all employees by name unless there a
             "original_query": original_query,
             "parsed_query": parsed_query,
             "explanation": explanation,
+            "explanation_future": self.explain_async(results, original_query, parsed_query) if enrich_with_llm else None,
             "count": len(results),
             "employees": []
         }
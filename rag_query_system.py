@@ -1,10 +1,158 @@
 import os
 import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import tiktoken
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Callable
 from openai import OpenAI
-from vector_store import VectorStore
-from employee_database import EmployeeDatabase
+from vector_store import VectorStore, SEARCH_CHUNKS_PER_RESULT
+from employee_database import EmployeeDatabase, ENHANCED_CONTEXT_SECTIONS
+from llm_json import request_json, usage_counts, StructuredOutputError
+from query_cache import QueryCache
+from keyword_matcher import KeywordMatcher
+from intent_classifier import IntentClassifier
+from conversation_state import ConversationState, ConversationStore
+from conversation_memory import ConversationSummarizer
+from context_packer import (
+    ContextChunk, pack_context, summarize_packing,
+    TIER_GUIDELINES, TIER_QUERY, TIER_CONVERSATION, TIER_SEARCH, TIER_GENERAL, TIER_STATISTICS
+)
+
+# Employees whose chunks the speculative semantic search in process_complex_query
+# fetches; smaller searches are ranked from a prefix of it (with the same result
+# as a search of their own size) and larger ones fall back to a fresh search
+SPECULATIVE_SEARCH_RESULTS = 25
+
+# Relevance of the n-th semantic search result is 1 / (1 + SEARCH_RANK_DECAY * n)
+SEARCH_RANK_DECAY = 0.1
+
+# Most recent exchanges shown to the model with their full answers; older
+# retained exchanges are shortened and evicted ones live on in the rolling summary
+RECENT_VERBATIM_TURNS = 2
+
+# A first name or surname shared by more employees than this is too ambiguous
+# to count as a mention on its own
+AMBIGUOUS_NAME_PART_LIMIT = 3
+
+# Name parts that are also common words and never count as a mention on their own
+NAME_PART_STOPWORDS = {'the', 'and', 'for', 'are', 'but', 'not', 'you', 'all', 'can', 'her', 'was', 'one', 'our', 'out', 'day', 'get', 'use', 'man', 'new', 'now', 'way', 'may', 'say'}
+
+# Query scopes answered with statistics over all employees, since only a sample of
+# profiles fits the context budget
+WORKFORCE_STATISTICS_SCOPES = ["department", "organization-wide"]
+
+# Departments named in one question that get their own statistics
+MAX_STATISTICS_DEPARTMENTS = 2
+
+# Intelligent Query responses reused for the same question and evidence, and memoised intent analyses
+RESPONSE_CACHE_SIZE = 200
+RESPONSE_CACHE_TTL_SECONDS = 24 * 3600
+INTENT_CACHE_SIZE = 1000
+
+# Token counts memoised by _count_tokens, keyed by a hash of the text
+TOKEN_CACHE_SIZE = 5000
+
+# Shape of the query analysis returned by _analyze_query_intent
+QUERY_TYPES = ["individual_profile", "team_analysis", "cross_comparison",
+               "succession_planning", "risk_assessment", "general_guidance"]
+QUERY_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "query_type": {"type": "string", "enum": QUERY_TYPES},
+        "scope": {"type": "string", "enum": ["single_employee", "multiple_employees", "department", "organization-wide"]},
+        "required_data": {"type": "array", "items": {"type": "string"}},
+        "analysis_depth": {"type": "string", "enum": ["surface_level", "detailed_analysis", "strategic_recommendations"]},
+        "key_entities": {"type": "array", "items": {"type": "string"}},
+        "specific_request": {"type": "string"}
+    },
+    "required": ["query_type", "scope", "required_data", "analysis_depth"]
+}
+
+# Analysis focus per query type (others get GENERAL_ANALYSIS_PROMPT)
+SPECIALIZED_PROMPTS = {
+    "succession_planning": """You are providing succession planning analysis. Focus on:
+- Leadership readiness and potential assessments
+- Development needs, timelines, and specific action plans
+- Risk factors, derailers, and comprehensive mitigation strategies
+- Detailed comparison of candidates with specific strengths/weaknesses
+- Strategic recommendations with clear rationale and implementation steps
+- Consideration of organizational culture and future needs""",
+
+    "team_analysis": """You are analyzing team dynamics and composition. Focus on:
+- Complementary strengths, skills, and working style compatibility
+- Potential conflict areas, communication gaps, and collaboration challenges
+- Team effectiveness patterns and performance optimization
+- Role optimization and talent deployment recommendations
+- Leadership dynamics and influence patterns within the team
+- Specific recommendations for team development and conflict resolution""",
+
+    "risk_assessment": """You are conducting comprehensive talent risk assessment. Focus on:
+- Flight risk indicators, retention strategies, and engagement factors
+- Performance concerns, improvement plans, and capability gaps
+- Leadership derailers, behavioral risks, and mitigation approaches
+- Succession vulnerabilities and critical role coverage
+- Market competitiveness and external threats to talent retention
+- Actionable risk mitigation with timelines and success metrics""",
+
+    "cross_comparison": """You are providing detailed employee comparison analysis. Focus on:
+- Side-by-side capability assessment across multiple dimensions
+- Strengths and development areas with specific examples
+- Cultural fit and values alignment comparison
+- Performance trajectory and potential analysis
+- Specific recommendations for role assignments or development
+- Objective scoring or ranking with clear criteria"""
+}
+
+GENERAL_ANALYSIS_PROMPT = """You are providing comprehensive talent management insights. Focus on:
+- Evidence-based analysis using available assessment and performance data
+- Practical recommendations with clear rationale and implementation guidance
+- Pattern identification across individuals, teams, or organizational levels
+- Strategic implications for talent development and organizational effectiveness
+- Data-driven insights that support decision-making"""
+
+DEPTH_GUIDANCE = {
+    "strategic_recommendations": "Provide strategic-level insights with long-term implications and organizational impact.",
+    "detailed_analysis": "Provide detailed analysis with specific examples and actionable recommendations."
+}
+SURFACE_DEPTH_GUIDANCE = "Provide clear, concise insights that directly address the question."
+
+# Instructions shared by every Intelligent Query response
+RESPONSE_INSTRUCTIONS = """IMPORTANT: You are having an ongoing conversation with intelligent context management. Reference previous discussions naturally when relevant.
+
+Response Instructions:
+1. Directly address the current question with specific, actionable insights
+2. Reference conversation history naturally (e.g., "Building on our previous discussion about...")
+3. Cite specific evidence from profiles, assessments, and data (use format: Source - Employee Name)
+4. For comparisons, provide structured analysis with clear criteria
+5. Identify patterns, trends, or concerning signals in the data
+6. Offer practical recommendations with implementation guidance
+7. Note any data limitations or areas requiring additional information
+8. Maintain professional HR analytics perspective throughout
+
+Ensure your response is comprehensive yet focused, providing value that justifies the conversation context."""
+
+class StreamedQuery:
+    """
+    Response of RAGQuerySystem.stream_complex_query.
+
+    Iterating yields the response text as it is generated; once the stream is
+    exhausted the conversation is updated and `result` holds the same
+    dictionary process_complex_query returns.
+    """
+
+    def __init__(self, chunks: Iterator[str], finish: Callable[[str], Dict[str, Any]]):
+        self._chunks = chunks
+        self._finish = finish
+        self.result: Optional[Dict[str, Any]] = None
+
+    def __iter__(self) -> Iterator[str]:
+        parts = []
+        for chunk in self._chunks:
+            parts.append(chunk)
+            yield chunk
+        self.result = self._finish("".join(parts))
 
 class RAGQuerySystem:
     def __init__(self):
@@ -16,8 +164,27 @@ class RAGQuerySystem:
         self.vector_store = VectorStore()
         self.employee_db = EmployeeDatabase()
         
+        # Employee-name matcher for response mentions, rebuilt after database changes
+        self._name_matcher: Optional[KeywordMatcher] = None
+        self._name_matcher_invalidations = 0
+        self._name_matcher_lock = threading.Lock()
+        self.employee_db.add_change_listener(self._invalidate_name_matcher)
+        self.intent_classifier = IntentClassifier()
+
         # Initialize token encoder for GPT-4
         self.encoding = tiktoken.encoding_for_model("gpt-4")
+        self.token_cache = QueryCache(max_entries=TOKEN_CACHE_SIZE)
+
+        # Repeated questions (e.g. the example query buttons) skip both LLM calls
+        self.intent_cache = QueryCache(max_entries=INTENT_CACHE_SIZE)
+        self.response_cache = QueryCache(max_entries=RESPONSE_CACHE_SIZE, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS)
+
+        # Input-token accounting of response generations (see _record_prompt_usage)
+        self.prompt_usage = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "uncached_tokens": 0}
+        self._prompt_usage_lock = threading.Lock()
+
+        # Summarizes evicted conversation turns in the background
+        self.summarizer = ConversationSummarizer(self.client, self._count_tokens)
         
         # Intelligent conversation management settings
         self.max_context_tokens = 6000  # Leave room for response tokens in 8K context
@@ -35,25 +202,12 @@ class RAGQuerySystem:
             "general_guidance": {"max": 10, "priority": 5}
         }
         
-        # User-configurable settings
-        self.conversation_settings = {
-            "enable_context_tracking": True,
-            "max_conversation_memory": "adaptive",  # "adaptive", "short", "medium", "long"
-            "employee_focus_mode": "adaptive",  # "narrow", "adaptive", "broad"
-            "include_conversation_hints": True
-        }
-        
         # Load interpretation guidelines
         self.interpretation_docs = self._load_interpretation_docs()
         
-        # Enhanced conversation tracking
-        self.conversation_history = []
-        self.context_employees = []  # Current context employees with scores
-        self.conversation_metadata = {
-            "total_tokens_used": 0,
-            "peak_employee_count": 0,
-            "conversation_theme": None
-        }
+        # Per-conversation state (history, context employees, settings), keyed by conversation_id;
+        # the client, vector store, database and encoder above are shared
+        self.conversations = ConversationStore()
         
         self.system_prompt = """You are an advanced HR Analytics AI with deep expertise in leadership psychology, organizational behavior, and talent management. You have access to a comprehensive database of employee profiles, assessment results, and interpretation guidelines.
 
@@ -68,38 +222,43 @@ Your capabilities include:
 Always provide evidence-based responses with specific citations. When making recommendations, consider both individual data and organizational context. You adapt your analysis scope based on the complexity and type of query."""
 
     def _count_tokens(self, text: str) -> int:
-        """Count tokens in text using GPT-4 tokenizer"""
-        try:
-            return len(self.encoding.encode(text))
-        except:
-            # Fallback estimation: ~4 characters per token
-            return len(text) // 4
+        """Count tokens in text using GPT-4 tokenizer (memoised by text hash)"""
+        key = hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest()
+        token_count = self.token_cache.get(key)
+        if token_count is None:
+            try:
+                token_count = len(self.encoding.encode(text))
+            except:
+                # Fallback estimation: ~4 characters per token
+                token_count = len(text) // 4
+            self.token_cache.set(key, token_count, persist=False)
+        return token_count
 
-    def _get_conversation_token_limit(self) -> int:
+    def _get_conversation_token_limit(self, state: ConversationState) -> int:
         """Get adaptive conversation token limit based on settings"""
-        if self.conversation_settings["max_conversation_memory"] == "short":
+        if state.conversation_settings["max_conversation_memory"] == "short":
             return 800
-        elif self.conversation_settings["max_conversation_memory"] == "medium":
+        elif state.conversation_settings["max_conversation_memory"] == "medium":
             return 1500
-        elif self.conversation_settings["max_conversation_memory"] == "long":
+        elif state.conversation_settings["max_conversation_memory"] == "long":
             return 2500
         else:  # adaptive
             # Adjust based on conversation complexity
-            if len(self.context_employees) > 10:
+            if len(state.context_employees) > 10:
                 return 1200  # Reduce history for complex employee contexts
-            elif len(self.context_employees) > 5:
+            elif len(state.context_employees) > 5:
                 return 1800
             else:
                 return 2000
 
-    def _get_employee_limit_for_query(self, query_type: str, scope: str) -> Dict[str, int]:
+    def _get_employee_limit_for_query(self, state: ConversationState, query_type: str, scope: str) -> Dict[str, int]:
         """Get intelligent employee limits based on query type and scope"""
         base_limits = self.employee_limits.get(query_type, self.employee_limits["general_guidance"])
         
         # Adjust based on user settings
-        if self.conversation_settings["employee_focus_mode"] == "narrow":
+        if state.conversation_settings["employee_focus_mode"] == "narrow":
             return {"max": min(base_limits["max"], 8), "priority": min(base_limits["priority"], 5)}
-        elif self.conversation_settings["employee_focus_mode"] == "broad":
+        elif state.conversation_settings["employee_focus_mode"] == "broad":
             return {"max": base_limits["max"] + 10, "priority": base_limits["priority"] + 5}
         else:  # adaptive
             # Adjust based on scope
@@ -112,37 +271,46 @@ Always provide evidence-based responses with specific citations. When making rec
             else:
                 return base_limits
 
-    def update_conversation_settings(self, settings: Dict[str, Any]):
+    def get_conversation(self, conversation_id: str = "default") -> ConversationState:
+        """Get the state of a conversation (history, context employees, settings)"""
+        return self.conversations.get(conversation_id)
+
+    def update_conversation_settings(self, settings: Dict[str, Any], conversation_id: str = "default"):
         """Update user-configurable conversation settings"""
-        for key, value in settings.items():
-            if key in self.conversation_settings:
-                self.conversation_settings[key] = value
+        state = self.get_conversation(conversation_id)
+        with state.lock:
+            for key, value in settings.items():
+                if key in state.conversation_settings:
+                    state.conversation_settings[key] = value
 
-    def get_conversation_status(self) -> Dict[str, Any]:
+    def get_conversation_status(self, conversation_id: str = "default") -> Dict[str, Any]:
         """Get current conversation status and statistics"""
+        state = self.get_conversation(conversation_id)
+        with state.lock:
+            return self._get_conversation_status(state)
+
+    def _get_conversation_status(self, state: ConversationState) -> Dict[str, Any]:
         return {
-            "conversation_length": len(self.conversation_history),
-            "context_employees_count": len(self.context_employees),
-            "total_tokens_used": self.conversation_metadata["total_tokens_used"],
-            "conversation_theme": self.conversation_metadata["conversation_theme"],
-            "settings": self.conversation_settings.copy(),
-            "memory_status": self._get_memory_status()
+            "conversation_length": len(state.conversation_history),
+            "context_employees_count": len(state.context_employees),
+            "total_tokens_used": state.conversation_metadata["total_tokens_used"],
+            "conversation_theme": state.conversation_metadata["conversation_theme"],
+            "settings": state.conversation_settings.copy(),
+            "memory_status": self._get_memory_status(state)
         }
 
-    def _get_memory_status(self) -> Dict[str, Any]:
+    def _get_memory_status(self, state: ConversationState) -> Dict[str, Any]:
         """Get current memory usage status"""
-        total_conversation_tokens = sum(
-            self._count_tokens(entry["original_query"] + entry["response"]) 
-            for entry in self.conversation_history
-        )
+        # Kept up to date by _update_conversation_history and _manage_conversation_memory
+        total_conversation_tokens = state.memory_tokens + state.summary_tokens
         
-        limit = self._get_conversation_token_limit()
+        limit = self._get_conversation_token_limit(state)
         
         return {
             "conversation_tokens": total_conversation_tokens,
             "token_limit": limit,
             "usage_percentage": (total_conversation_tokens / limit) * 100,
-            "context_employees": [emp["name"] for emp in self.context_employees]
+            "context_employees": state.context_employees.names()
         }
 
     def _load_interpretation_docs(self) -> List[str]:
@@ -177,50 +345,261 @@ Always provide evidence-based responses with specific citations. When making rec
             conversation_id: Unique identifier for this conversation thread
         """
         
+        prepared = self._prepare_complex_query(query, conversation_id)
+
+        # Step 5: Generate intelligent response with conversation awareness (unless cached)
+        response = prepared["cached_response"]
+        if response is None:
+            response = self._timed(
+                prepared["stage_timings"], "generation", self._generate_intelligent_response,
+                prepared["messages"], prepared["token_usage"]
+            )
+
+        return self._finish_complex_query(prepared, response)
+
+    def stream_complex_query(self, query: str, context_type: str = "general",
+                             conversation_id: str = "default") -> "StreamedQuery":
+        """
+        Streaming variant of process_complex_query.
+
+        Context gathering (steps 1-4) runs before this returns; the response is
+        then generated while the returned object is iterated, and the
+        conversation bookkeeping runs once the stream completes.
+
+        Returns:
+            StreamedQuery yielding response text chunks; its `result` holds the
+            process_complex_query dictionary after iteration
+        """
+        prepared = self._prepare_complex_query(query, conversation_id)
+        stage_timings = prepared["stage_timings"]
+
+        def chunks():
+            if prepared["cached_response"] is not None:
+                yield prepared["cached_response"]
+                return
+            generation_start = time.perf_counter()
+            for chunk in self._stream_intelligent_response(prepared["messages"], prepared["token_usage"]):
+                stage_timings.setdefault("first_token", time.perf_counter() - generation_start)
+                yield chunk
+            stage_timings["generation"] = time.perf_counter() - generation_start
+
+        return StreamedQuery(chunks(), lambda response: self._finish_complex_query(prepared, response))
+
+    def _prepare_complex_query(self, query: str, conversation_id: str) -> Dict[str, Any]:
+        """
+        Steps 1-4 of process_complex_query: resolve, analyze and gather context.
+
+        The conversation state is only read here and only written in
+        _finish_complex_query, each under the conversation's lock, so the lock
+        is never held while the response is generated or streamed.
+        """
+        state = self.get_conversation(conversation_id)
+        with state.lock:
+            return self._prepare_complex_query_locked(state, query)
+
+    def _prepare_complex_query_locked(self, state: ConversationState, query: str) -> Dict[str, Any]:
+        stage_timings = {}
+        start_time = time.perf_counter()
+
         # Step 1: Resolve contextual references in the query
-        resolved_query, context_employees = self._resolve_contextual_query(query)
-        
-        # Step 2: Analyze the resolved query to understand what type of response is needed
-        query_analysis = self._analyze_query_intent(resolved_query, context_employees)
+        resolved_query, context_employees = self._timed(stage_timings, "resolve", self._resolve_contextual_query, state, query)
+
+        # Step 2: Run the stages that only need the resolved query, so they overlap:
+        #   intent analysis (LLM) | semantic search | name resolution -> profile loading
+        # The pool belongs to this query, so concurrent sessions never queue behind
+        # each other's stages; each query uses two extra threads while it runs.
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="rag-query") as executor:
+            intent_future = executor.submit(
+                self._timed, stage_timings, "intent", self._analyze_query_intent, resolved_query, context_employees
+            )
+            search_future = executor.submit(
+                self._timed, stage_timings, "semantic_search", self.vector_store.search_employee_chunks,
+                resolved_query, SPECULATIVE_SEARCH_RESULTS * SEARCH_CHUNKS_PER_RESULT
+            )
+            prefetched = self._prefetch_employee_context(state, context_employees, stage_timings)
+            query_analysis = intent_future.result()
+            prefetched["search_chunks"] = search_future.result()
+        prefetched["search_n_chunks"] = SPECULATIVE_SEARCH_RESULTS * SEARCH_CHUNKS_PER_RESULT
         
         # Step 3: Get intelligent limits for this query type
         employee_limits = self._get_employee_limit_for_query(
+            state,
             query_analysis.get("query_type", "general_guidance"),
             query_analysis.get("scope", "single_employee")
         )
         
-        # Step 4: Gather relevant context with intelligent limits
-        context_chunks = self._gather_relevant_context(
-            resolved_query, query_analysis, context_employees, employee_limits
+        # Step 4: Gather relevant context with intelligent limits (reusing the prefetched data)
+        context_chunks = self._timed(
+            stage_timings, "context_assembly", self._gather_relevant_context,
+            state, resolved_query, query_analysis, context_employees, employee_limits, prefetched
         )
         
-        # Step 5: Generate intelligent response with conversation awareness
-        response = self._generate_intelligent_response(
-            resolved_query, context_chunks, query_analysis, query
-        )
+        # The prompt includes the conversation history, so it is built while the state is locked
+        messages = self._build_response_messages(state, resolved_query, context_chunks, query_analysis, query)
         
-        # Step 6: Update conversation tracking with token management
-        self._update_conversation_history(query, resolved_query, response, context_employees, query_analysis)
+        # Same question, query type, evidence and profile versions as an earlier answer: reuse it.
+        # Follow-ups resolved against the conversation ("between them") are never cached.
+        response_cache_key = None
+        if not context_employees:
+            response_cache_key = self._response_cache_key(resolved_query, query_analysis, context_chunks)
+        cached_response = self._get_cached_response(response_cache_key)
+
+        return {
+            "state": state,
+            "messages": messages,
+            "query": query,
+            "resolved_query": resolved_query,
+            "context_employees": context_employees,
+            "analysis": query_analysis,
+            "employee_limits": employee_limits,
+            "context_chunks": context_chunks,
+            "response_cache_key": response_cache_key,
+            "cached_response": cached_response,
+            "token_usage": {},
+            "stage_timings": stage_timings,
+            "start_time": start_time
+        }
+
+    def _finish_complex_query(self, prepared: Dict[str, Any], response: str) -> Dict[str, Any]:
+        """Steps 6-8 of process_complex_query, run once the full response is known."""
+        state = prepared["state"]
+        with state.lock:
+            return self._finish_complex_query_locked(state, prepared, response)
+
+    def _finish_complex_query_locked(self, state: ConversationState, prepared: Dict[str, Any],
+                                     response: str) -> Dict[str, Any]:
+        query = prepared["query"]
+        resolved_query = prepared["resolved_query"]
+        context_employees = prepared["context_employees"]
+        query_analysis = prepared["analysis"]
+        stage_timings = prepared["stage_timings"]
+
+        bookkeeping_start = time.perf_counter()
+
+        if prepared["cached_response"] is None:
+            self._cache_response(prepared["response_cache_key"], response)
+
+        # Step 6: Update conversation tracking with token management (cached answers included)
+        self._update_conversation_history(state, query, resolved_query, response, context_employees, query_analysis)
         
         # Step 7: Update context employees with intelligent scoring
-        self._update_context_employees(response, context_employees, query_analysis)
+        self._update_context_employees(state, response, context_employees, query_analysis)
         
         # Step 8: Manage memory based on token limits
-        self._manage_conversation_memory()
+        self._manage_conversation_memory(state)
+
+        stage_timings["bookkeeping"] = time.perf_counter() - bookkeeping_start
+        stage_timings["total"] = time.perf_counter() - prepared["start_time"]
+        print(f"DEBUG: Stage timings: { {stage: round(seconds, 3) for stage, seconds in stage_timings.items()} }")
         
         return {
             "query": query,
             "resolved_query": resolved_query,
             "analysis": query_analysis,
             "response": response,
-            "context_sources": len(context_chunks),
-            "context_employees": [emp["name"] if isinstance(emp, dict) else emp for emp in self.context_employees],
-            "employee_limits": employee_limits,
-            "conversation_status": self.get_conversation_status(),
-            "conversation_id": conversation_id
+            "context_sources": len(prepared["context_chunks"]),
+            "cached": prepared["cached_response"] is not None,
+            "token_usage": prepared["token_usage"],
+            "stage_timings": stage_timings,
+            "context_employees": state.context_employees.names(),
+            "employee_limits": prepared["employee_limits"],
+            "conversation_status": self._get_conversation_status(state),
+            "conversation_id": state.conversation_id
         }
 
-    def _update_conversation_history(self, original_query: str, resolved_query: str, 
+    def _response_cache_key(self, resolved_query: str, analysis: Dict[str, Any],
+                            context_chunks: List[ContextChunk]) -> str:
+        """
+        Cache key of a response: the resolved query, the query type, a hash of the
+        evidence and the profile versions of the employees in it
+
+        The conversation history is deliberately left out, so asking the same
+        question again (e.g. clicking an example query button twice in a session)
+        reuses the answer; callers skip the cache for queries resolved against
+        the history instead. A profile update changes the key, so answers based
+        on an old version are never served.
+        """
+        evidence = hashlib.sha1()
+        # The conversation's recent employees come first in the context, so the
+        # same evidence can arrive in another order; it is hashed as a set
+        for chunk in sorted(context_chunks, key=lambda chunk: chunk.text):
+            evidence.update(chunk.text.encode('utf-8', 'surrogatepass'))
+            evidence.update(b"\0")
+        employee_ids = list(dict.fromkeys(chunk.employee_id for chunk in context_chunks if chunk.employee_id))
+        return json.dumps([
+            " ".join(resolved_query.lower().split()),
+            analysis.get("query_type", "general_guidance"),
+            evidence.hexdigest(),
+            sorted(self.employee_db.get_employee_versions(employee_ids).items())
+        ])
+
+    def _get_cached_response(self, cache_key: Optional[str]) -> Optional[str]:
+        """Cached response for the key (None when the query is not cacheable)"""
+        if cache_key is None:
+            return None
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            print("DEBUG: Reusing cached response")
+        return cached
+
+    def _cache_response(self, cache_key: Optional[str], response: str):
+        """Remember a response under its key"""
+        if cache_key is None or not response:
+            return
+        self.response_cache.set(cache_key, response, persist=False)
+
+    def _timed(self, stage_timings: Dict[str, float], stage: str, func, *args, **kwargs):
+        """Run func and record its wall-clock duration in stage_timings[stage]."""
+        stage_start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stage_timings[stage] = time.perf_counter() - stage_start
+
+    def _match_employee(self, name: str, employees: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """First employee whose name contains, or is contained in, the given name."""
+        for emp in employees:
+            if name.lower() in emp['name'].lower() or emp['name'].lower() in name.lower():
+                return emp
+        return None
+
+    def _prefetch_employee_context(self, state: ConversationState, context_employees: List[str],
+                                   stage_timings: Dict[str, float]) -> Dict[str, Any]:
+        """
+        Resolve the names _gather_relevant_context will look up and load their
+        context blocks. This needs no query analysis, so it runs alongside it;
+        the blocks hold every section, so the required data need not be known yet.
+
+        Returns:
+            Dictionary with "employees" (all employees) and "profiles"
+            (employee_id -> get_context_blocks result)
+        """
+        name_start = time.perf_counter()
+        employees = self.employee_db.get_all_employees()
+
+        # PRIORITY 1 names and PRIORITY 2 high-relevance names, as _gather_relevant_context matches them
+        names = list(context_employees) + [
+            emp["name"] for emp in state.context_employees.top()
+            if emp["relevance_score"] > 0.7
+        ]
+        employee_ids = []
+        for name in names:
+            emp = self._match_employee(name, employees)
+            if emp and emp['id'] not in employee_ids:
+                employee_ids.append(emp['id'])
+        stage_timings["name_resolution"] = time.perf_counter() - name_start
+
+        profile_start = time.perf_counter()
+        profiles = {}
+        for employee_id in employee_ids:
+            blocks = self.employee_db.get_context_blocks(employee_id)
+            if blocks:
+                profiles[employee_id] = blocks
+        stage_timings["profile_loading"] = time.perf_counter() - profile_start
+
+        return {"employees": employees, "profiles": profiles}
+
+    def _update_conversation_history(self, state: ConversationState, original_query: str, resolved_query: str,
                                    response: str, context_employees: List[str], 
                                    query_analysis: Dict[str, Any]):
         """Update conversation history with metadata"""
@@ -233,88 +612,66 @@ Always provide evidence-based responses with specific citations. When making rec
             "context_employees": context_employees,
             "query_type": query_analysis.get("query_type", "general"),
             "tokens_used": tokens_used,
+            # Counted once here so memory status and prompt building never re-tokenize history
+            "memory_tokens": self._count_tokens(original_query + response),
+            "prompt_tokens": self._count_tokens(self._history_prompt_text(original_query, response)),
             "timestamp": self._get_timestamp()
         }
         
-        self.conversation_history.append(conversation_entry)
-        self.conversation_metadata["total_tokens_used"] += tokens_used
+        state.conversation_history.append(conversation_entry)
+        state.history_tokens += tokens_used
+        state.memory_tokens += conversation_entry["memory_tokens"]
+        state.conversation_metadata["total_tokens_used"] += tokens_used
         
         # Update conversation theme if not set
-        if not self.conversation_metadata["conversation_theme"]:
-            self.conversation_metadata["conversation_theme"] = query_analysis.get("query_type", "general")
+        if not state.conversation_metadata["conversation_theme"]:
+            state.conversation_metadata["conversation_theme"] = query_analysis.get("query_type", "general")
 
-    def _update_context_employees(self, response: str, context_employees: List[str], 
+    def _update_context_employees(self, state: ConversationState, response: str, context_employees: List[str],
                                 query_analysis: Dict[str, Any]):
         """Update context employees with intelligent scoring and relevance tracking"""
         
         # Extract employees mentioned in response
         response_employees = self._extract_employee_names_from_response(response)
+        query_type = query_analysis.get("query_type", "general")
         
-        # Create new context employee entries with scores
-        new_context_employees = []
-        
-        # Add context employees from query (highest priority)
-        for emp_name in context_employees:
-            employee_entry = {
-                "name": emp_name,
-                "relevance_score": 1.0,  # Highest relevance
-                "source": "query_context",
-                "first_mentioned": self._get_timestamp(),
-                "query_types": [query_analysis.get("query_type", "general")]
-            }
-            new_context_employees.append(employee_entry)
-        
-        # Add employees from response (medium priority)
-        for emp_name in response_employees:
-            if not any(emp["name"] == emp_name for emp in new_context_employees):
-                employee_entry = {
-                    "name": emp_name,
-                    "relevance_score": 0.8,
-                    "source": "response_mention",
-                    "first_mentioned": self._get_timestamp(),
-                    "query_types": [query_analysis.get("query_type", "general")]
-                }
-                new_context_employees.append(employee_entry)
+        # Context employees from query (highest priority), then employees from response (medium priority)
+        new_context_employees = [(emp_name, 1.0, "query_context") for emp_name in context_employees]
+        new_context_employees += [
+            (emp_name, 0.8, "response_mention") for emp_name in response_employees
+            if emp_name not in context_employees
+        ]
         
         # Merge with existing context employees, updating scores
-        for new_emp in new_context_employees:
-            existing_emp = next((emp for emp in self.context_employees 
-                               if emp.get("name") == new_emp["name"]), None)
-            
-            if existing_emp:
+        for emp_name, relevance_score, source in new_context_employees:
+            if emp_name in state.context_employees:
                 # Update existing employee - boost score and add query type
-                existing_emp["relevance_score"] = min(1.0, existing_emp["relevance_score"] + 0.2)
-                if new_emp["query_types"][0] not in existing_emp["query_types"]:
-                    existing_emp["query_types"].append(new_emp["query_types"][0])
+                state.context_employees.boost(emp_name, 0.2, query_type)
             else:
                 # Add new employee
-                self.context_employees.append(new_emp)
+                state.context_employees.add(emp_name, relevance_score, source, self._get_timestamp(), query_type)
         
-        # Sort by relevance score and limit based on settings
-        self.context_employees.sort(key=lambda x: x["relevance_score"], reverse=True)
-        
-        # Apply intelligent limits
-        max_employees = self._get_max_context_employees()
-        if len(self.context_employees) > max_employees:
-            self.context_employees = self.context_employees[:max_employees]
+        # Apply intelligent limits (drops the least relevant employees)
+        max_employees = self._get_max_context_employees(state)
+        state.context_employees.trim(max_employees)
         
         # Update peak count
-        self.conversation_metadata["peak_employee_count"] = max(
-            self.conversation_metadata["peak_employee_count"],
-            len(self.context_employees)
+        state.conversation_metadata["peak_employee_count"] = max(
+            state.conversation_metadata["peak_employee_count"],
+            len(state.context_employees)
         )
 
-    def _get_max_context_employees(self) -> int:
+    def _get_max_context_employees(self, state: ConversationState) -> int:
         """Get maximum context employees based on conversation complexity and settings"""
         base_limit = 15  # Default
         
-        if self.conversation_settings["employee_focus_mode"] == "narrow":
+        if state.conversation_settings["employee_focus_mode"] == "narrow":
             base_limit = 8
-        elif self.conversation_settings["employee_focus_mode"] == "broad":
+        elif state.conversation_settings["employee_focus_mode"] == "broad":
             base_limit = 25
         
         # Adjust based on conversation theme
-        theme = self.conversation_metadata.get("conversation_theme", "general")
+        theme = state.conversation_metadata.get("conversation_theme", "general")
         if theme in ["succession_planning", "department_analysis"]:
             base_limit = min(base_limit + 10, 30)
         elif theme == "individual_profile":
@@ -322,47 +679,48 @@ Always provide evidence-based responses with specific citations. When making rec
         
         return base_limit
 
-    def _manage_conversation_memory(self):
+    def _manage_conversation_memory(self, state: ConversationState):
         """Intelligent conversation memory management based on token limits"""
-        if not self.conversation_history:
+        if not state.conversation_history:
             return
         
-        # Calculate total conversation tokens
-        total_tokens = sum(entry["tokens_used"] for entry in self.conversation_history)
-        token_limit = self._get_conversation_token_limit()
+        # Running total of tokens_used over the history
+        total_tokens = state.history_tokens
+        token_limit = self._get_conversation_token_limit(state)
         
         # If we're under the limit, no need to prune
         if total_tokens <= token_limit:
             return
         
         # Keep minimum exchanges regardless of token count
-        if len(self.conversation_history) <= self.min_conversation_exchanges:
+        if len(state.conversation_history) <= self.min_conversation_exchanges:
             return
         
-        # Prune oldest conversations while staying above minimum
-        while (len(self.conversation_history) > self.min_conversation_exchanges and 
-               sum(entry["tokens_used"] for entry in self.conversation_history) > token_limit):
+        # Evict oldest exchanges while staying above minimum; each step is O(1)
+        while (len(state.conversation_history) > self.min_conversation_exchanges and
+               state.history_tokens > token_limit):
+
+            removed_entry = state.conversation_history.popleft()
+            state.history_tokens -= removed_entry["tokens_used"]
+            state.memory_tokens -= removed_entry["memory_tokens"]
             
-            removed_entry = self.conversation_history.pop(0)
+            # Evicted exchanges are folded into the rolling summary off the critical path
+            state.pending_summary.append(removed_entry)
             
             # Update employee relevance scores when removing old context
-            self._decay_employee_relevance_scores(removed_entry)
+            self._decay_employee_relevance_scores(state, removed_entry)
+
+        self.summarizer.schedule(state)
 
-    def _decay_employee_relevance_scores(self, removed_entry: Dict[str, Any]):
+    def _decay_employee_relevance_scores(self, state: ConversationState, removed_entry: Dict[str, Any]):
         """Decay relevance scores for employees from removed conversation entries"""
         removed_employees = removed_entry.get("context_employees", [])
         
+        # Employees whose score falls to the store's minimum (0.15) are removed
         for emp_name in removed_employees:
-            emp_entry = next((emp for emp in self.context_employees 
-                            if emp.get("name") == emp_name), None)
-            if emp_entry:
-                emp_entry["relevance_score"] = max(0.1, emp_entry["relevance_score"] - 0.3)
-        
-        # Remove employees with very low relevance scores
-        self.context_employees = [emp for emp in self.context_employees 
-                                 if emp["relevance_score"] > 0.15]
+            state.context_employees.decay(emp_name, 0.3, floor=0.1)
 
-    def _resolve_contextual_query(self, query: str) -> tuple[str, List[str]]:
+    def _resolve_contextual_query(self, state: ConversationState, query: str) -> tuple[str, List[str]]:
         """
         Resolve contextual references in queries with intelligent employee context
         
@@ -384,10 +742,9 @@ Always provide evidence-based responses with specific citations. When making rec
         query_lower = query.lower()
         has_contextual_reference = any(indicator in query_lower for indicator in contextual_indicators)
         
-        if has_contextual_reference and self.context_employees:
+        if has_contextual_reference and state.context_employees:
             # Get employee names from context, prioritizing by relevance score
-            employee_names = [emp["name"] if isinstance(emp, dict) else emp 
-                            for emp in self.context_employees[:8]]  # Top 8 most relevant
+            employee_names = state.context_employees.names(8)  # Top 8 most relevant
             context_employees = employee_names.copy()
             
             # Create a more specific query
@@ -431,24 +788,45 @@ Always provide evidence-based responses with specific citations. When making rec
         
         return resolved_query, context_employees
 
+    def _history_prompt_text(self, original_query: str, response: str) -> str:
+        """Text used to budget a history entry in the response prompt"""
+        return f"Q: {original_query}\nA: {response[:300]}...\n\n"
+
     def _get_timestamp(self) -> str:
         """Get current timestamp for conversation tracking"""
         import time
         return time.strftime('%Y-%m-%d %H:%M:%S')
     
-    def clear_conversation_history(self):
+    def clear_conversation_history(self, conversation_id: str = "default"):
         """Clear conversation history and reset all tracking variables for a fresh start"""
-        self.conversation_history = []
-        self.context_employees = []
-        self.conversation_metadata = {
-            "total_tokens_used": 0,
-            "peak_employee_count": 0,
-            "conversation_theme": None
-        }
+        state = self.get_conversation(conversation_id)
+        with state.lock:
+            state.reset()
         print("Conversation history cleared. Starting fresh conversation context.")
 
     def _analyze_query_intent(self, query: str, context_employees: List[str] = []) -> Dict[str, Any]:
-        """Analyze what type of query this is and what information is needed"""
+        """Analyze what type of query this is and what information is needed (memoised)"""
+        cache_key = json.dumps([" ".join(query.lower().split()), sorted(context_employees)])
+        cached = self.intent_cache.get(cache_key)
+        if cached is not None:
+            print(f"DEBUG: Reusing query analysis ({cached['query_type']})")
+            return dict(cached, key_entities=list(context_employees))
+
+        analysis = self._classify_query_intent(query, context_employees)
+        # The general_guidance fallback after a failed LLM call is not worth remembering
+        if analysis.get("classifier"):
+            self.intent_cache.set(cache_key, dict(analysis), persist=False)
+        return analysis
+
+    def _classify_query_intent(self, query: str, context_employees: List[str]) -> Dict[str, Any]:
+        """Classify a query locally, or with the LLM when the local classifier is unsure of its type or scope"""
+
+        # Common patterns are classified locally; the LLM only sees unsure cases
+        classification = self.intent_classifier.classify(query, context_employees)
+        if self.intent_classifier.is_confident(classification):
+            print(f"DEBUG: Query classified locally as {classification['query_type']}, {classification['scope']} "
+                  f"(confidence {classification['confidence']:.2f}, scope {classification['scope_confidence']:.2f})")
+            return classification
         
         analysis_prompt = f"""Analyze this HR/talent management query to understand the intent and required information:
 
@@ -471,21 +849,20 @@ Return as JSON:
   "specific_request": "brief description of what user wants"
 }}"""
 
-        response = self.client.chat.completions.create(
-            model="gpt-4.1-2025-04-14",
-            messages=[
-                {"role": "user", "content": analysis_prompt}
-            ],
-            temperature=0.2,
-            max_tokens=500
-        )
-        
         try:
-            analysis = json.loads(response.choices[0].message.content)
+            analysis = request_json(
+                self.client,
+                [{"role": "user", "content": analysis_prompt}],
+                QUERY_ANALYSIS_SCHEMA,
+                temperature=0.2,
+                max_tokens=500
+            )
             analysis["key_entities"] = context_employees
+            analysis["classifier"] = "llm"
             return analysis
-        except:
-            # Fallback if JSON parsing fails
+        except StructuredOutputError as e:
+            # Fallback if no valid analysis could be obtained
+            print(f"DEBUG: Query analysis failed, using general_guidance fallback: {str(e)} {e.errors[:3]}")
             return {
                 "query_type": "general_guidance",
                 "scope": "single_employee",
@@ -495,11 +872,49 @@ Return as JSON:
                 "specific_request": query
             }
 
-    def _gather_relevant_context(self, query: str, analysis: Dict[str, Any], 
+    def _gather_relevant_context(self, state: ConversationState, query: str, analysis: Dict[str, Any],
                                context_employees: List[str] = [], 
-                               employee_limits: Dict[str, int] = None) -> List[str]:
-        """Gather relevant context with intelligent employee limits and prioritization"""
+                               employee_limits: Dict[str, int] = None,
+                               prefetched: Dict[str, Any] = None) -> List[ContextChunk]:
+        """
+        Gather relevant context with intelligent employee limits and prioritization
+
+        Args:
+            prefetched: Optional data loaded ahead of time by process_complex_query
+                ("employees", "profiles", "search_chunks", "search_n_chunks")
+
+        Returns:
+            The context chunks selected for the prompt, in presentation order
+        """
         context_chunks = []
+        prefetched = prefetched or {}
+        profiles = prefetched.get("profiles")
+        employees = prefetched.get("employees")
+        if employees is None:
+            employees = self.employee_db.get_all_employees()
+        known_employee_ids = {emp['id'] for emp in employees}
+
+        # Employees whose context is already included, by id
+        included_ids = set()
+
+        def add_employee(employee_id: str, tier: str, relevance: float = 1.0,
+                         max_chunks: Optional[int] = None) -> bool:
+            """Add an employee's context unless already included; returns whether it was added."""
+            if employee_id in included_ids:
+                return False
+            employee_context = self._get_employee_context(employee_id, analysis, profiles, tier, relevance)
+            context_chunks.extend(employee_context[:max_chunks])
+            included_ids.add(employee_id)
+            return True
+
+        def search_employees(n_results: int) -> List[Dict[str, Any]]:
+            # Rank the same nearest chunks a search of this size would, from the speculative
+            # search when it fetched enough of them (or the whole collection)
+            chunks = prefetched.get("search_chunks")
+            n_chunks = n_results * SEARCH_CHUNKS_PER_RESULT
+            if chunks is not None and (n_chunks <= len(chunks) or len(chunks) < prefetched["search_n_chunks"]):
+                return self.vector_store.rank_employee_chunks(chunks[:n_chunks])
+            return self.vector_store.search_employees(query, n_results=n_results)
         
         # Set default limits if not provided
         if employee_limits is None:
@@ -510,40 +925,41 @@ Return as JSON:
         
         # Add interpretation guidelines if relevant
         if analysis.get("query_type") in ["individual_profile", "succession_planning", "risk_assessment"]:
-            context_chunks.extend(self.interpretation_docs[:2])  # Top 2 interpretation docs
+            for doc in self.interpretation_docs[:2]:  # Top 2 interpretation docs
+                context_chunks.append(ContextChunk(doc, self._count_tokens(doc), TIER_GUIDELINES))
+
+        # Population statistics for department and organization questions; they have a
+        # fixed size and are kept out of the packing budget so they are never dropped
+        statistics_chunks = self._get_workforce_statistics(query, analysis)
         
         # PRIORITY 1: Context employees from conversation (highest priority)
         employees_added = 0
         if context_employees:
             print(f"DEBUG: Using context employees: {context_employees}")
-            employees = self.employee_db.get_all_employees()
             for target_name in context_employees:
                 if employees_added >= priority_employees:
                     break
                 for emp in employees:
                     if target_name.lower() in emp['name'].lower() or emp['name'].lower() in target_name.lower():
-                        employee_context = self._get_employee_context(emp['id'], analysis)
-                        context_chunks.extend(employee_context)
-                        employees_added += 1
-                        print(f"DEBUG: Added priority context for {emp['name']}")
+                        if add_employee(emp['id'], TIER_QUERY):
+                            employees_added += 1
+                            print(f"DEBUG: Added priority context for {emp['name']}")
                         break
         
         # PRIORITY 2: High-relevance employees from conversation history
         if employees_added < priority_employees:
             high_relevance_employees = [
-                emp for emp in self.context_employees 
-                if isinstance(emp, dict) and emp.get("relevance_score", 0) > 0.7
+                emp for emp in state.context_employees.top()
+                if emp["relevance_score"] > 0.7
             ][:priority_employees - employees_added]
             
-            employees = self.employee_db.get_all_employees()
             for context_emp in high_relevance_employees:
                 emp_name = context_emp["name"]
                 for emp in employees:
                     if emp_name.lower() in emp['name'].lower() or emp['name'].lower() in emp_name.lower():
-                        employee_context = self._get_employee_context(emp['id'], analysis)
-                        context_chunks.extend(employee_context)
-                        employees_added += 1
-                        print(f"DEBUG: Added high-relevance context for {emp['name']}")
+                        if add_employee(emp['id'], TIER_CONVERSATION, context_emp["relevance_score"]):
+                            employees_added += 1
+                            print(f"DEBUG: Added high-relevance context for {emp['name']}")
                         break
         
         # PRIORITY 3: Semantic search for additional employees up to max limit
@@ -554,7 +970,6 @@ Return as JSON:
             if scope == "single_employee":
                 # Try to find specific employee mentioned
                 entities = analysis.get("key_entities", [])
-                employees = self.employee_db.get_all_employees()
                 
                 for entity in entities:
                     if employees_added >= max_employees:
@@ -563,222 +978,273 @@ Return as JSON:
                     for emp in employees:
                         if entity.lower() in emp['name'].lower():
                             # Skip if already added
-                            if not any(emp['name'] in chunk for chunk in context_chunks):
-                                employee_context = self._get_employee_context(emp['id'], analysis)
-                                context_chunks.extend(employee_context)
+                            if add_employee(emp['id'], TIER_QUERY):
                                 employees_added += 1
                                 break
                 
                 # If no specific employee found or need more, do semantic search
                 if employees_added < max_employees:
-                    search_results = self.vector_store.search_employees(query, n_results=remaining_slots + 5)
-                    for result in search_results:
+                    search_results = search_employees(remaining_slots + 5)
+                    for rank, result in enumerate(search_results):
                         if employees_added >= max_employees:
                             break
                         # Skip if already added
-                        emp_data = self.employee_db.get_employee(result['employee_id'])
-                        if emp_data and not any(emp_data['name'] in chunk for chunk in context_chunks):
-                            employee_context = self._get_employee_context(result['employee_id'], analysis)
-                            context_chunks.extend(employee_context)
+                        if result['employee_id'] in known_employee_ids and add_employee(
+                            result['employee_id'], TIER_SEARCH, 1.0 / (1 + SEARCH_RANK_DECAY * rank)
+                        ):
                             employees_added += 1
             
             elif scope in ["multiple_employees", "department", "team_analysis"]:
                 # Get broader context - search for relevant employees
-                search_results = self.vector_store.search_employees(query, n_results=remaining_slots + 10)
-                added_employees = set()
+                search_results = search_employees(remaining_slots + 10)
                 
-                for result in search_results:
+                for rank, result in enumerate(search_results):
                     if employees_added >= max_employees:
                         break
                     
-                    emp_data = self.employee_db.get_employee(result['employee_id'])
-                    if emp_data and emp_data['name'] not in added_employees:
-                        # Limit context per employee for broader analysis
-                        employee_context = self._get_employee_context(result['employee_id'], analysis)
-                        context_chunks.extend(employee_context[:2])  # Max 2 chunks per employee for broad analysis
+                    # Limit context per employee for broader analysis (max 2 chunks each)
+                    if result['employee_id'] in known_employee_ids and add_employee(
+                        result['employee_id'], TIER_SEARCH, 1.0 / (1 + SEARCH_RANK_DECAY * rank), max_chunks=2
+                    ):
                         employees_added += 1
-                        added_employees.add(emp_data['name'])
         
         # If no specific context found, do general semantic search
         if not context_chunks or len(context_chunks) < 3:
             general_chunks = self.vector_store.get_relevant_chunks(query, n_results=8)
-            context_chunks.extend(general_chunks)
-        
-        # Intelligent context limiting based on token constraints
-        total_context_tokens = sum(self._count_tokens(chunk) for chunk in context_chunks)
-        max_context_tokens = self.max_context_tokens - self._get_conversation_token_limit()
-        
-        if total_context_tokens > max_context_tokens:
-            # Prioritize chunks - keep first chunks (usually most relevant)
-            cumulative_tokens = 0
-            trimmed_chunks = []
-            for chunk in context_chunks:
-                chunk_tokens = self._count_tokens(chunk)
-                if cumulative_tokens + chunk_tokens <= max_context_tokens:
-                    trimmed_chunks.append(chunk)
-                    cumulative_tokens += chunk_tokens
-                else:
-                    break
-            context_chunks = trimmed_chunks
+            for chunk in general_chunks:
+                context_chunks.append(ContextChunk(chunk, self._count_tokens(chunk), TIER_GENERAL))
+
+        # Intelligent context limiting: keep the most valuable chunks that fit the token budget
+        total_context_tokens = sum(chunk.tokens for chunk in context_chunks)
+        statistics_tokens = sum(chunk.tokens for chunk in statistics_chunks)
+        max_context_tokens = self.max_context_tokens - self._get_conversation_token_limit(state) - statistics_tokens
+        packed_chunks = statistics_chunks + pack_context(context_chunks, max_context_tokens)
+
+        print(f"DEBUG: Final context - {employees_added} employees, ~{total_context_tokens} tokens gathered, "
+              f"packing: {summarize_packing(context_chunks, packed_chunks)}")
+        return packed_chunks
+
+    def _get_workforce_statistics(self, query: str, analysis: Dict[str, Any]) -> List[ContextChunk]:
+        """
+        Statistics over all employees for department and organization-wide scopes
+
+        The employee database keeps them up to date as profiles change, so this
+        costs the same whatever the number of employees.
         
-        print(f"DEBUG: Final context - {employees_added} employees, {len(context_chunks)} chunks, ~{total_context_tokens} tokens")
-        return context_chunks
+        Returns:
+            Statistics of the departments named in the query, plus the whole
+            organization for organization-wide questions or when no department
+            is named; [] for other questions
+        """
+        scope = analysis.get("scope")
+        if scope not in WORKFORCE_STATISTICS_SCOPES:
+            return []
+
+        departments = self.employee_db.find_departments(query)[:MAX_STATISTICS_DEPARTMENTS]
+        summaries = [self.employee_db.get_workforce_summary(department) for department in departments]
+        if scope == "organization-wide" or not departments:
+            summaries.insert(0, self.employee_db.get_workforce_summary())
 
-    def _get_employee_context(self, employee_id: str, analysis: Dict[str, Any]) -> List[str]:
-        """Get specific context for an employee based on what's needed"""
-        context = []
+        chunks = [
+            ContextChunk(summary, self._count_tokens(summary), TIER_STATISTICS, "statistics")
+            for summary in summaries if summary
+        ]
+        if chunks:
+            print(f"DEBUG: Added workforce statistics for {departments or 'the organization'} "
+                  f"({sum(chunk.tokens for chunk in chunks)} tokens)")
+        return chunks
+
+    def _get_employee_context(self, employee_id: str, analysis: Dict[str, Any],
+                              preloaded: Dict[str, Dict[str, Any]] = None,
+                              tier: str = TIER_SEARCH, relevance: float = 1.0) -> List[ContextChunk]:
+        """
+        Get specific context for an employee based on what's needed
         
-        # Get employee data
-        employee_data = self.employee_db.get_employee(employee_id)
-        if not employee_data:
-            return context
+        The text and token counts come precomputed from the employee database
+        (EmployeeDatabase.get_context_blocks), so this only selects sections.
         
-        # Parse profile to get relevant sections
-        try:
-            if isinstance(employee_data['profile'], str):
-                profile_data = json.loads(employee_data['profile'])
-            else:
-                profile_data = employee_data['profile']
-            
-            # Check if this is an enhanced profile
-            if isinstance(profile_data, dict) and 'traditional_sections' in profile_data:
-                # Enhanced profile structure
-                required_data = analysis.get("required_data", [])
-                
-                # Always include traditional sections
-                for section in profile_data.get('traditional_sections', []):
-                    section_text = f"{employee_data['name']} - {section.get('section', '')}: {section.get('content', '')}"
-                    context.append(section_text)
-                
-                # Add enhanced sections based on requirements
-                if "skills_assessment" in required_data and profile_data.get('skills_assessment'):
-                    skills_data = profile_data['skills_assessment']
-                    context.append(f"{employee_data['name']} - Skills Assessment: {json.dumps(skills_data)}")
-                
-                if "performance_data" in required_data and profile_data.get('performance_metrics'):
-                    perf_data = profile_data['performance_metrics']
-                    context.append(f"{employee_data['name']} - Performance Metrics: {json.dumps(perf_data)}")
-                    
-                if "team_dynamics" in required_data and profile_data.get('team_dynamics'):
-                    team_data = profile_data['team_dynamics']
-                    context.append(f"{employee_data['name']} - Team Dynamics: {json.dumps(team_data)}")
-                    
-            else:
-                # Traditional profile structure
-                for section in profile_data:
-                    section_text = f"{employee_data['name']} - {section.get('section', '')}: {section.get('content', '')}"
-                    context.append(section_text)
-            
-            # Add metadata context
-            metadata_text = f"{employee_data['name']} - Metadata: {json.dumps(employee_data['metadata'])}"
-            context.append(metadata_text)
-            
-        except Exception as e:
-            print(f"Error processing employee context for {employee_id}: {e}")
+        Args:
+            preloaded: Optional employee_id -> get_context_blocks result
+            tier: Priority tier the employee was selected by
+            relevance: Relevance of the employee to the query, 0..1
+
+        Returns:
+            Context chunks (profile sections, then enhanced sections, then metadata)
+        """
+        blocks = preloaded.get(employee_id) if preloaded else None
+        if blocks is None:
+            blocks = self.employee_db.get_context_blocks(employee_id)
+        if not blocks:
+            return []
+
+        def make_chunk(block: Dict[str, Any], section_type: str, section: str) -> ContextChunk:
+            return ContextChunk(block['text'], block['tokens'], tier, section_type, relevance, employee_id, section)
+
+        # Always include traditional sections
+        context = [make_chunk(block, "profile", block['key']) for block in blocks['profile']]
+
+        # Add enhanced sections based on requirements
+        required_data = analysis.get("required_data", [])
+        for data_name, section_key, _ in ENHANCED_CONTEXT_SECTIONS:
+            if data_name in required_data and section_key in blocks['enhanced']:
+                context.append(make_chunk(blocks['enhanced'][section_key], "enhanced", section_key))
+
+        # Add metadata context (raw profiles have none, as they give no context)
+        if blocks['metadata']:
+            context.append(make_chunk(blocks['metadata'], "metadata", "metadata"))
         
         return context
 
-    def _generate_intelligent_response(self, query: str, context_chunks: List[str], 
-                                     analysis: Dict[str, Any], original_query: str) -> str:
-        """Generate an intelligent response using the gathered context with token management"""
+    def _generate_intelligent_response(self, messages: List[Dict[str, str]],
+                                       token_usage: Optional[Dict[str, int]] = None) -> str:
+        """
+        Generate an intelligent response from the messages built by _build_response_messages
+
+        Args:
+            token_usage: Optional dictionary filled with the call's prompt token usage
+        """
+        response = self.client.chat.completions.create(
+            model="gpt-4.1-2025-04-14",
+            messages=messages,
+            temperature=0.4,
+            max_tokens=2000
+        )
+
+        self._record_prompt_usage(getattr(response, "usage", None), token_usage)
+        return response.choices[0].message.content
+
+    def _stream_intelligent_response(self, messages: List[Dict[str, str]],
+                                     token_usage: Optional[Dict[str, int]] = None) -> Iterator[str]:
+        """Streaming variant of _generate_intelligent_response, yielding text as it arrives"""
+        stream = self.client.chat.completions.create(
+            model="gpt-4.1-2025-04-14",
+            messages=messages,
+            temperature=0.4,
+            max_tokens=2000,
+            stream=True,
+            # Ask for a final chunk carrying the usage (stream_options is newer than the pinned client)
+            extra_body={"stream_options": {"include_usage": True}}
+        )
+
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            usage = getattr(chunk, "usage", None)
+            if usage:
+                self._record_prompt_usage(usage, token_usage)
+
+    def _record_prompt_usage(self, usage: Any, token_usage: Optional[Dict[str, int]] = None):
+        """
+        Account for the cached and uncached input tokens of a call.
+
+        The provider reuses the longest previously seen prompt prefix (in
+        blocks, from 1024 tokens on); usage.prompt_tokens_details.cached_tokens
+        reports how much of the prompt came from that cache.
+        """
+        if usage is None:
+            return
+        # An object on regular responses, a plain dict on the usage chunk of a stream
+        call_usage = usage_counts(usage)
+        prompt_tokens = call_usage["prompt_tokens"]
+        cached_tokens = call_usage["cached_tokens"]
+        with self._prompt_usage_lock:
+            self.prompt_usage["calls"] += 1
+            for key in ("prompt_tokens", "cached_tokens", "uncached_tokens"):
+                self.prompt_usage[key] += call_usage[key]
+        if token_usage is not None:
+            token_usage.update(call_usage)
+
+        print(f"DEBUG: Prompt tokens: {prompt_tokens} ({cached_tokens} cached, "
+              f"{call_usage['uncached_tokens']} uncached)")
+
+    def get_prompt_cache_stats(self) -> Dict[str, Any]:
+        """Cached vs. uncached input tokens over all response generations"""
+        with self._prompt_usage_lock:
+            stats = dict(self.prompt_usage)
+        stats["cached_share"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+        return stats
+
+    def _build_response_messages(self, state: ConversationState, query: str, context_chunks: List[ContextChunk],
+                                 analysis: Dict[str, Any], original_query: str) -> List[Dict[str, str]]:
+        """Build the chat messages for the response, with conversation-aware token management"""
+
+        # Interpretation guides go into the static prefix; workforce statistics lead the
+        # evidence, then employee chunks grouped by employee id (keeping each employee's
+        # section order), then other chunks
+        guideline_chunks = [chunk for chunk in context_chunks if chunk.tier == TIER_GUIDELINES]
+        evidence_chunks = sorted(
+            (chunk for chunk in context_chunks if chunk.tier != TIER_GUIDELINES),
+            key=lambda chunk: (chunk.tier != TIER_STATISTICS, chunk.employee_id is None, chunk.employee_id or "")
+        )
         
         # Combine context
-        context = "\n\n".join(context_chunks)
+        context = "\n\n".join(chunk.text for chunk in evidence_chunks)
         
-        # Build conversation history context with intelligent token management
+        # Build conversation history context with intelligent token management:
+        # rolling summary of evicted turns, then recent turns (the latest verbatim)
         conversation_context = ""
-        if self.conversation_history:
-            available_tokens = self._get_conversation_token_limit()
+        if state.conversation_history or state.summary or state.pending_summary:
+            available_tokens = self._get_conversation_token_limit(state)
             conversation_context = "\n\nCONVERSATION HISTORY:\n"
+            conversation_tokens = 0
+
+            if state.summary and state.summary_tokens <= available_tokens // 2:
+                conversation_context += f"Summary of earlier discussion:\n{state.summary}\n\n"
+                conversation_tokens += state.summary_tokens
             
             # Add conversation entries starting from most recent, within token limit
-            conversation_tokens = 0
             entries_to_include = []
-            
-            for entry in reversed(self.conversation_history):
-                entry_text = f"Q: {entry['original_query']}\nA: {entry['response'][:300]}...\n\n"
-                entry_tokens = self._count_tokens(entry_text)
+            for position, entry in enumerate(reversed(state.conversation_history)):
+                verbatim = position < RECENT_VERBATIM_TURNS
+                entry_tokens = entry["memory_tokens"] if verbatim else entry["prompt_tokens"]
+                if verbatim and conversation_tokens + entry_tokens > available_tokens:
+                    # Too long to quote in full; fall back to the shortened answer
+                    verbatim, entry_tokens = False, entry["prompt_tokens"]
                 
                 if conversation_tokens + entry_tokens <= available_tokens:
-                    entries_to_include.insert(0, entry)  # Insert at beginning to maintain order
+                    entries_to_include.append((entry, verbatim))
                     conversation_tokens += entry_tokens
                 else:
                     break
+            entries_to_include.reverse()  # Restore chronological order
+
+            # Turns evicted but not summarized yet are listed by question only
+            pending_questions = [entry['original_query'] for entry in state.pending_summary]
+            if pending_questions:
+                conversation_context += "Earlier questions: " + "; ".join(pending_questions[-5:]) + "\n\n"
             
             # Build the conversation context from selected entries
-            for i, entry in enumerate(entries_to_include, 1):
+            for i, (entry, verbatim) in enumerate(entries_to_include, 1):
                 conversation_context += f"Q{i}: {entry['original_query']}\n"
-                # Include response summary to save tokens
-                prev_response = entry['response'][:200] + "..." if len(entry['response']) > 200 else entry['response']
+                if verbatim:
+                    prev_response = entry['response']
+                else:
+                    # Include response summary to save tokens
+                    prev_response = entry['response'][:200] + "..." if len(entry['response']) > 200 else entry['response']
                 conversation_context += f"A{i}: {prev_response}\n\n"
             
             # Add context employees summary if available
-            if self.context_employees:
-                context_emp_names = [emp["name"] if isinstance(emp, dict) else emp 
-                                   for emp in self.context_employees[:5]]
+            if state.context_employees:
+                context_emp_names = state.context_employees.names(5)
                 conversation_context += f"Current context employees: {', '.join(context_emp_names)}\n\n"
         
-        # Create specialized prompt based on query type with dynamic analysis depth
+        # Analysis focus based on query type with dynamic analysis depth
         query_type = analysis.get("query_type", "general_guidance")
         analysis_depth = analysis.get("analysis_depth", "detailed_analysis")
-        
-        if query_type == "succession_planning":
-            specialized_prompt = """You are providing succession planning analysis. Focus on:
-- Leadership readiness and potential assessments
-- Development needs, timelines, and specific action plans
-- Risk factors, derailers, and comprehensive mitigation strategies
-- Detailed comparison of candidates with specific strengths/weaknesses
-- Strategic recommendations with clear rationale and implementation steps
-- Consideration of organizational culture and future needs"""
-            
-        elif query_type == "team_analysis":
-            specialized_prompt = """You are analyzing team dynamics and composition. Focus on:
-- Complementary strengths, skills, and working style compatibility
-- Potential conflict areas, communication gaps, and collaboration challenges
-- Team effectiveness patterns and performance optimization
-- Role optimization and talent deployment recommendations
-- Leadership dynamics and influence patterns within the team
-- Specific recommendations for team development and conflict resolution"""
-            
-        elif query_type == "risk_assessment":
-            specialized_prompt = """You are conducting comprehensive talent risk assessment. Focus on:
-- Flight risk indicators, retention strategies, and engagement factors
-- Performance concerns, improvement plans, and capability gaps
-- Leadership derailers, behavioral risks, and mitigation approaches
-- Succession vulnerabilities and critical role coverage
-- Market competitiveness and external threats to talent retention
-- Actionable risk mitigation with timelines and success metrics"""
-            
-        elif query_type == "cross_comparison":
-            specialized_prompt = """You are providing detailed employee comparison analysis. Focus on:
-- Side-by-side capability assessment across multiple dimensions
-- Strengths and development areas with specific examples
-- Cultural fit and values alignment comparison
-- Performance trajectory and potential analysis
-- Specific recommendations for role assignments or development
-- Objective scoring or ranking with clear criteria"""
-            
-        else:
-            specialized_prompt = """You are providing comprehensive talent management insights. Focus on:
-- Evidence-based analysis using available assessment and performance data
-- Practical recommendations with clear rationale and implementation guidance
-- Pattern identification across individuals, teams, or organizational levels
-- Strategic implications for talent development and organizational effectiveness
-- Data-driven insights that support decision-making"""
+        specialized_prompt = SPECIALIZED_PROMPTS.get(query_type, GENERAL_ANALYSIS_PROMPT)
+        depth_guidance = DEPTH_GUIDANCE.get(analysis_depth, SURFACE_DEPTH_GUIDANCE)
 
-        # Enhance prompt based on analysis depth
-        if analysis_depth == "strategic_recommendations":
-            depth_guidance = "\nProvide strategic-level insights with long-term implications and organizational impact."
-        elif analysis_depth == "detailed_analysis":
-            depth_guidance = "\nProvide detailed analysis with specific examples and actionable recommendations."
-        else:
-            depth_guidance = "\nProvide clear, concise insights that directly address the question."
+        # The system message holds everything that does not depend on the question, most
+        # stable first, so the provider can reuse it from its prompt cache:
+        # system prompt and instructions | interpretation guides | query type focus
+        system_message = f"{self.system_prompt}\n\n{RESPONSE_INSTRUCTIONS}"
+        if guideline_chunks:
+            system_message += "\n\nInterpretation Guidelines:\n" + "\n\n".join(chunk.text for chunk in guideline_chunks)
+        system_message += f"\n\n{specialized_prompt}\n{depth_guidance}"
 
-        prompt = f"""{specialized_prompt}{depth_guidance}
-
-IMPORTANT: You are having an ongoing conversation with intelligent context management. Reference previous discussions naturally when relevant.
-
-Employee Data and Assessment Context:
+        # Then employee blocks (ordered by employee, so the same employees give the same
+        # bytes), the conversation and finally the question itself
+        prompt = f"""Employee Data and Assessment Context:
 {context}{conversation_context}
 
 CURRENT USER QUESTION: {original_query}
@@ -787,80 +1253,94 @@ RESOLVED QUESTION (with context): {query}
 Analysis Context:
 - Query Type: {query_type}
 - Scope: {analysis.get("scope", "not specified")}
-- Required Data: {", ".join(analysis.get("required_data", ["general"]))}
+- Required Data: {", ".join(analysis.get("required_data", ["general"]))}"""
 
-Response Instructions:
-1. Directly address the current question with specific, actionable insights
-2. Reference conversation history naturally (e.g., "Building on our previous discussion about...")
-3. Cite specific evidence from profiles, assessments, and data (use format: Source - Employee Name)
-4. For comparisons, provide structured analysis with clear criteria
-5. Identify patterns, trends, or concerning signals in the data
-6. Offer practical recommendations with implementation guidance
-7. Note any data limitations or areas requiring additional information
-8. Maintain professional HR analytics perspective throughout
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ]
 
-Ensure your response is comprehensive yet focused, providing value that justifies the conversation context."""
+    def _invalidate_name_matcher(self, generation: int):
+        """Drop the employee-name matcher after the employee database changed"""
+        with self._name_matcher_lock:
+            self._name_matcher = None
+            self._name_matcher_invalidations += 1
 
-        response = self.client.chat.completions.create(
-            model="gpt-4.1-2025-04-14",
-            messages=[
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.4,
-            max_tokens=2000
-        )
+    def _get_name_matcher(self) -> KeywordMatcher:
+        """Get the employee-name matcher, building it once per database generation"""
+        # Picks up changes made by other processes (invalidating the matcher via the listener)
+        self.employee_db.refresh()
+        with self._name_matcher_lock:
+            if self._name_matcher is not None:
+                return self._name_matcher
+            invalidations = self._name_matcher_invalidations
+
+        # Built outside the lock: invalidation runs under the database lock, which
+        # get_all_employees takes. A matcher built from employees read before an
+        # invalidation is used for this call only, never installed.
+        matcher = self._build_name_matcher(self.employee_db.get_all_employees())
+        with self._name_matcher_lock:
+            if self._name_matcher_invalidations == invalidations:
+                self._name_matcher = matcher
+        return matcher
+
+    def _build_name_matcher(self, employees: List[Dict[str, Any]]) -> KeywordMatcher:
+        """
+        Compile full names and unambiguous name parts into one matcher.
         
-        return response.choices[0].message.content
+        Full names report themselves; a first name or surname reports every
+        employee carrying it, unless it is a common word or shared by more than
+        AMBIGUOUS_NAME_PART_LIMIT employees.
+        """
+        groups = {}
+        part_owners = {}
+        for emp in employees:
+            name = emp['name']
+            groups.setdefault(name, []).append(name)
+            for part in name.split():
+                if len(part) > 2 and part.lower() not in NAME_PART_STOPWORDS and part != name:
+                    owners = part_owners.setdefault(part, [])
+                    if name not in owners:
+                        owners.append(name)
+
+        for part, owners in part_owners.items():
+            if len(owners) <= AMBIGUOUS_NAME_PART_LIMIT:
+                for name in owners:
+                    groups[name].append(part)
+
+        print(f"DEBUG: Built employee name matcher for {len(employees)} employees")
+        return KeywordMatcher(groups, case_sensitive=True)
 
     def _extract_employee_names_from_response(self, response: str) -> List[str]:
         """Extract employee names mentioned in a response with intelligent scoring"""
-        import re
-        employee_names = []
-        
-        # Get all employee names from database
-        all_employees = self.employee_db.get_all_employees()
-        
-        # Look for employee names mentioned in the response
-        for emp in all_employees:
-            name = emp['name']
-            # Check for full name mentions (highest confidence)
-            if name in response:
-                if name not in employee_names:
-                    employee_names.append(name)
-            else:
-                # Check for first name or last name mentions (lower confidence)
-                parts = name.split()
-                for part in parts:
-                    if len(part) > 2 and part in response:  # Avoid matching short words
-                        # Additional validation - ensure it's not a common word
-                        common_words = {'the', 'and', 'for', 'are', 'but', 'not', 'you', 'all', 'can', 'her', 'was', 'one', 'our', 'out', 'day', 'get', 'use', 'man', 'new', 'now', 'way', 'may', 'say'}
-                        if part.lower() not in common_words:
-                            if name not in employee_names:
-                                employee_names.append(name)
-                                break
-        
-        # Limit to reasonable number and prioritize by frequency of mention
-        name_counts = {}
-        for name in employee_names:
-            name_counts[name] = response.count(name) + response.count(name.split()[0])
-        
-        # Sort by mention frequency and limit
-        sorted_names = sorted(employee_names, key=lambda x: name_counts.get(x, 0), reverse=True)
+        # One pass over the response; a full-name mention is matched as a whole,
+        # not again as its first name and surname
+        mention_counts = {}
+        for _, _, names in self._get_name_matcher().find_spans(response):
+            for name in names:
+                mention_counts[name] = mention_counts.get(name, 0) + 1
+
+        # Prioritize by frequency of mention (ties keep the order of first mention) and limit
+        sorted_names = sorted(mention_counts, key=mention_counts.get, reverse=True)
         return sorted_names[:8]  # Increased from 5 to 8 for better context tracking
 
-    def get_conversation_insights(self) -> Dict[str, Any]:
+    def get_conversation_insights(self, conversation_id: str = "default") -> Dict[str, Any]:
         """Get insights about the current conversation for UI display"""
-        if not self.conversation_history:
+        state = self.get_conversation(conversation_id)
+        with state.lock:
+            return self._get_conversation_insights(state)
+
+    def _get_conversation_insights(self, state: ConversationState) -> Dict[str, Any]:
+        if not state.conversation_history:
             return {"status": "no_conversation"}
         
         # Analyze conversation patterns
-        query_types = [entry.get("query_type", "general") for entry in self.conversation_history]
+        query_types = [entry.get("query_type", "general") for entry in state.conversation_history]
         most_common_type = max(set(query_types), key=query_types.count) if query_types else "general"
         
         # Get employee focus
         all_mentioned_employees = []
-        for entry in self.conversation_history:
+        for entry in state.conversation_history:
             all_mentioned_employees.extend(entry.get("context_employees", []))
         
         employee_frequency = {}
@@ -869,19 +1349,19 @@ Ensure your response is comprehensive yet focused, providing value that justifie
         
         top_employees = sorted(employee_frequency.items(), key=lambda x: x[1], reverse=True)[:5]
         
-        memory_status = self._get_memory_status()
+        memory_status = self._get_memory_status(state)
         
         return {
-            "conversation_length": len(self.conversation_history),
+            "conversation_length": len(state.conversation_history),
             "conversation_theme": most_common_type,
             "top_employees": top_employees,
             "memory_usage": memory_status["usage_percentage"],
-            "current_context_employees": len(self.context_employees),
-            "total_tokens_used": self.conversation_metadata["total_tokens_used"],
+            "current_context_employees": len(state.context_employees),
+            "total_tokens_used": state.conversation_metadata["total_tokens_used"],
             "settings_summary": {
-                "memory_mode": self.conversation_settings["max_conversation_memory"],
-                "focus_mode": self.conversation_settings["employee_focus_mode"],
-                "context_tracking": self.conversation_settings["enable_context_tracking"]
+                "memory_mode": state.conversation_settings["max_conversation_memory"],
+                "focus_mode": state.conversation_settings["employee_focus_mode"],
+                "context_tracking": state.conversation_settings["enable_context_tracking"]
             }
         }
 
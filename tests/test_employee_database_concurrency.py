@@ -0,0 +1,65 @@
+"""Stress test: parallel writers (threads and processes) on one employee database."""
+import json
+import multiprocessing
+import threading
+
+from employee_database import EmployeeDatabase
+
+PROCESSES = 4
+THREADS_PER_PROCESS = 3
+EMPLOYEES_PER_WRITER = 15
+
+def _profile(name: str, revision: int) -> str:
+    return json.dumps([
+        {"section": "Profile Summary", "content": f"{name} is analytical and strategic (revision {revision})"},
+        {"section": "Leadership Style", "content": "Coaching"}
+    ])
+
+def _write_employees(storage_dir: str, writer: str):
+    # Each writer has its own instance, like separate Streamlit sessions
+    db = EmployeeDatabase(storage_dir, fsync_policy="never", repair_on_start=False)
+    for i in range(EMPLOYEES_PER_WRITER):
+        name = f"{writer} employee {i}"
+        employee_id = db.add_employee(name, _profile(name, 0), {"department": "Sales"})
+        if i % 3 == 0:
+            assert db.update_employee_profile(employee_id, _profile(name, 1))
+        if i % 5 == 4:
+            assert db.delete_employee(employee_id)
+
+def _run_process(storage_dir: str, process_number: int):
+    threads = [
+        threading.Thread(target=_write_employees, args=(storage_dir, f"p{process_number}t{t}"))
+        for t in range(THREADS_PER_PROCESS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def test_parallel_writers_lose_no_entries(tmp_path):
+    storage_dir = str(tmp_path / "employee_data")
+    EmployeeDatabase(storage_dir)
+
+    processes = [multiprocessing.Process(target=_run_process, args=(storage_dir, p)) for p in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=120)
+        assert process.exitcode == 0
+
+    db = EmployeeDatabase(storage_dir, repair_on_start=False)
+    names = {employee["name"] for employee in db.get_all_employees()}
+    expected = {
+        f"p{p}t{t} employee {i}"
+        for p in range(PROCESSES) for t in range(THREADS_PER_PROCESS)
+        for i in range(EMPLOYEES_PER_WRITER) if i % 5 != 4
+    }
+    assert names == expected
+
+    # Updated profiles kept their latest revision
+    for employee in db.get_all_employees():
+        revision = 1 if int(employee["name"].rsplit(" ", 1)[1]) % 3 == 0 else 0
+        assert f"(revision {revision})" in db.get_employee(employee["id"])["profile"]
+
+    report = db.check_consistency(repair=False)
+    assert not any(report.values()), report
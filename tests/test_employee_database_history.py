@@ -0,0 +1,47 @@
+"""Version history must follow committed versions, whatever is left on disk by a crash."""
+import json
+
+from employee_database import EmployeeDatabase
+from profile_storage import write_profile
+
+def _profile(summary: str, style: str) -> str:
+    return json.dumps([
+        {"section": "Profile Summary", "content": summary},
+        {"section": "Leadership Style", "content": style}
+    ])
+
+def test_update_after_uncommitted_write_keeps_history_exact(tmp_path):
+    db = EmployeeDatabase(str(tmp_path), fsync_policy="never")
+    v1 = _profile("Calm", "Coaching")
+    employee_id = db.add_employee("Ada", v1)
+
+    # A write that crashed before its index and history commit
+    lost = _profile("Calm", "Directive")
+    write_profile(db.profile_index[employee_id]['file_path'], lost, fsync=False)
+
+    # The next update changes only the summary; the style is back to version 1's
+    v2 = _profile("Bold", "Coaching")
+    assert db.update_employee_profile(employee_id, v2)
+
+    assert json.loads(db.get_profile_version(employee_id, 1)) == json.loads(v1)
+    assert json.loads(db.get_profile_version(employee_id, 2)) == json.loads(v2)
+    assert db.get_changed_sections(employee_id, 1) == ["Profile Summary"]
+
+class _RecordingVectorStore:
+    def __init__(self):
+        self.calls = []
+
+    def update_employee_sections(self, employee_id, profile_sections, changed_sections, metadata=None):
+        self.calls.append((employee_id, profile_sections, changed_sections))
+
+def test_update_refreshes_changed_sections_in_vector_store(tmp_path):
+    db = EmployeeDatabase(str(tmp_path), fsync_policy="never")
+    sections = [{"section": "Notes", "content": "a"}, {"section": "Notes", "content": "b"}]
+    employee_id = db.add_employee("Ada", json.dumps(sections))
+
+    # Only the second of two sections with the same name changes
+    sections[1]["content"] = "c"
+    vector_store = _RecordingVectorStore()
+    assert db.update_employee_profile(employee_id, json.dumps(sections), vector_store=vector_store)
+
+    assert vector_store.calls == [(employee_id, sections, ["Notes (2)"])]
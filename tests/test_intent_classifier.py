@@ -0,0 +1,39 @@
+"""The local intent classifier may only answer when both its query type and scope are confident."""
+import pytest
+
+from intent_classifier import IntentClassifier, mentioned_names
+
+@pytest.fixture(scope="module")
+def classifier():
+    return IntentClassifier()
+
+def test_unsure_scope_is_left_to_the_llm(classifier):
+    classification = classifier.classify("Which leaders are at risk of burning out?")
+    assert classification["confidence"] >= classifier.confidence_threshold
+    assert not classifier.is_confident(classification)
+
+@pytest.mark.parametrize("query", [
+    "Who should succeed the head of engineering?",
+    "Who should succeed the CEO?",
+    "Who could replace the VP of marketing?"
+])
+def test_role_succession_is_not_a_department_question(classifier, query):
+    classification = classifier.classify(query)
+    assert classification["query_type"] == "succession_planning"
+    assert classification["scope"] == "single_employee"
+
+def test_department_questions_keep_department_scope(classifier):
+    classification = classifier.classify("What are the retention risks in engineering?")
+    assert classifier.is_confident(classification)
+    assert classification["scope"] == "department"
+
+def test_names_in_the_query_count_as_employees():
+    assert mentioned_names("Compare Sarah Johnson, Bob and Emily Chen") == ["Sarah Johnson", "Bob", "Emily Chen"]
+    assert mentioned_names("Describe Tom's results on the HPI") == ["Tom"]
+    assert mentioned_names("Who should succeed the CEO in Engineering?") == []
+
+def test_confident_classifications_cover_most_common_queries(classifier):
+    results = classifier.evaluate()
+    assert results["coverage"] >= 0.4
+    assert results["confident_accuracy"] >= 0.9
+    assert results["confident_scope_accuracy"] >= 0.95
@@ -0,0 +1,23 @@
+"""Reading token usage from chat completion responses and streams."""
+import json
+from types import SimpleNamespace
+
+from llm_json import usage_counts
+
+def test_usage_chunk_of_a_stream_is_a_plain_dict():
+    # Shape of the final chunk's usage with stream_options.include_usage on openai==1.14.3
+    chunk = json.loads('{"choices": [], "usage": {"prompt_tokens": 1500, "completion_tokens": 40, '
+                       '"total_tokens": 1540, "prompt_tokens_details": {"cached_tokens": 1024}}}')
+    assert usage_counts(chunk["usage"]) == {
+        "prompt_tokens": 1500, "cached_tokens": 1024, "uncached_tokens": 476, "completion_tokens": 40
+    }
+
+def test_usage_object_of_a_response():
+    usage = SimpleNamespace(prompt_tokens=1200, completion_tokens=10,
+                            prompt_tokens_details=SimpleNamespace(cached_tokens=0))
+    assert usage_counts(usage) == {
+        "prompt_tokens": 1200, "cached_tokens": 0, "uncached_tokens": 1200, "completion_tokens": 10
+    }
+
+def test_usage_without_cache_details():
+    assert usage_counts({"prompt_tokens": 10, "completion_tokens": 2})["uncached_tokens"] == 10
@@ -0,0 +1,40 @@
+"""Persisted QueryCache instances sharing one file (e.g. one per Streamlit session)."""
+import json
+import os
+
+from query_cache import QueryCache
+
+def test_sets_are_batched(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = QueryCache(path, save_interval_seconds=3600)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert not os.path.exists(path)
+
+    cache.save()
+    with open(path, encoding="utf-8") as f:
+        assert sorted(key for key, _ in json.load(f)) == ["a", "b"]
+
+def test_concurrent_instances_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / "cache.json")
+    first = QueryCache(path, save_interval_seconds=3600)
+    second = QueryCache(path, save_interval_seconds=3600)
+
+    first.set("from first", 1)
+    second.set("from second", 2)
+    first.save()
+    second.save()
+
+    reloaded = QueryCache(path)
+    assert reloaded.get("from first") == 1
+    assert reloaded.get("from second") == 2
+    # The later save also picked up the other instance's entries
+    assert second.get("from first") == 1
+
+def test_clear_replaces_the_file(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = QueryCache(path, save_interval_seconds=3600)
+    cache.set("a", 1)
+    cache.save()
+    cache.clear()
+    assert QueryCache(path).get("a") is None
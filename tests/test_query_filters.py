@@ -0,0 +1,48 @@
+"""Filter trees built from locally parsed queries, evaluated against chunk metadata."""
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("chromadb")
+
+from query_processor import QueryProcessor
+from vector_store import evaluate_filter
+
+@pytest.fixture
+def processor(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    return QueryProcessor(cache_dir=None)
+
+def _matches(processor, query, metadata):
+    parsed, _ = processor._parse_query_locally(query)
+    matched, _ = evaluate_filter(processor.convert_to_filters(parsed), metadata)
+    return matched
+
+def test_visionary_is_a_trait_or_a_leadership_style(processor):
+    query = "visionary engineers"
+    trait_only = {"traits": "visionary, analytical", "leadership_style": "coaching", "roles": "Senior Engineer"}
+    style_only = {"traits": "analytical", "leadership_style": "visionary", "roles": "Engineer"}
+    neither = {"traits": "analytical", "leadership_style": "coaching", "roles": "Engineer"}
+
+    assert _matches(processor, query, trait_only)
+    assert _matches(processor, query, style_only)
+    assert not _matches(processor, query, neither)
+
+def test_strategic_or_visionary_does_not_require_visionary_style(processor):
+    query = "strategic or visionary people in sales"
+    strategic_only = {"traits": "strategic", "leadership_style": "coaching", "department": "Sales"}
+    visionary_style = {"traits": "methodical", "leadership_style": "visionary", "department": "Sales"}
+    other_department = {"traits": "strategic", "leadership_style": "coaching", "department": "HR"}
+
+    assert _matches(processor, query, strategic_only)
+    assert _matches(processor, query, visionary_style)
+    assert not _matches(processor, query, other_department)
+
+@pytest.mark.parametrize("query", [
+    "analytical engineers who are not creative",
+    "non-technical product managers",
+    "engineers that aren't analytical",
+    "strategic people except in sales"
+])
+def test_negated_queries_are_left_to_the_llm(processor, query):
+    _, confidence = processor._parse_query_locally(query)
+    assert confidence < processor.local_parse_threshold
@@ -0,0 +1,67 @@
+"""Incremental re-embedding keeps every profile chunk id on the section it names."""
+import json
+
+import pytest
+
+pytest.importorskip("chromadb")
+
+from vector_store import VectorStore
+
+class _Collection:
+    """In-memory stand-in for a Chroma collection that records embedded documents."""
+
+    def __init__(self):
+        self.chunks = {}  # id -> (document, metadata)
+        self.embedded = []
+
+    def get(self, where=None, include=None):
+        ids = [chunk_id for chunk_id, (_, metadata) in self.chunks.items()
+               if all(metadata.get(key) == value for key, value in (where or {}).items())]
+        return {"ids": ids, "metadatas": [self.chunks[chunk_id][1] for chunk_id in ids]}
+
+    def delete(self, where=None):
+        for chunk_id in self.get(where)["ids"]:
+            del self.chunks[chunk_id]
+
+    def add(self, documents, metadatas, ids):
+        self.upsert(documents, metadatas, ids)
+
+    def upsert(self, documents, metadatas, ids):
+        self.embedded.extend(documents)
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            self.chunks[chunk_id] = (document, metadata)
+
+    def update(self, metadatas, ids):
+        for chunk_id, metadata in zip(ids, metadatas):
+            self.chunks[chunk_id] = (self.chunks[chunk_id][0], metadata)
+
+@pytest.fixture
+def store():
+    store = VectorStore.__new__(VectorStore)
+    store.employee_profiles_collection = _Collection()
+    return store
+
+def _sections(*names):
+    return [{"section": name, "content": f"About {name}"} for name in names]
+
+def test_reordered_sections_are_stored_again(store):
+    store.store_employee_profile("e1", _sections("Summary", "Strengths", "Risks"))
+
+    reordered = _sections("Risks", "Summary", "Strengths")
+    store.update_employee_sections("e1", reordered, changed_sections=[])
+
+    for i, section in enumerate(reordered):
+        document, metadata = store.employee_profiles_collection.chunks[f"e1_{i}"]
+        assert json.loads(document) == section
+        assert metadata["section_ref"] == section["section"]
+
+def test_only_changed_sections_are_embedded_again(store):
+    store.store_employee_profile("e1", _sections("Notes", "Notes", "Risks"))
+    store.employee_profiles_collection.embedded.clear()
+
+    updated = _sections("Notes", "Notes", "Risks")
+    updated[1]["content"] = "Revised"
+    store.update_employee_sections("e1", updated, changed_sections=["Notes (2)"])
+
+    assert store.employee_profiles_collection.embedded == [json.dumps(updated[1])]
+    assert json.loads(store.employee_profiles_collection.chunks["e1_1"][0]) == updated[1]
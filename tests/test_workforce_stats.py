@@ -0,0 +1,39 @@
+"""Workforce statistics group and find departments by their canonical names."""
+from employee_database import DEPARTMENT_MATCHER, canonical_department
+from workforce_stats import WorkforceAggregates
+
+def test_department_synonyms_are_counted_and_found_canonically():
+    aggregates = WorkforceAggregates(DEPARTMENT_MATCHER)
+    aggregates.add("1", {"department": "HR", "traits": ["empathetic"]})
+    aggregates.add("2", {"department": "Human Resources", "traits": ["organized"]})
+    aggregates.add("3", {"department": "Sales"})
+
+    assert aggregates.departments["HR"].count == 2
+    assert "Human Resources" not in aggregates.departments
+    assert aggregates.find_departments("How is human resources doing compared to sales?") == ["HR", "Sales"]
+
+def test_departments_outside_the_vocabulary_are_found_literally():
+    aggregates = WorkforceAggregates(DEPARTMENT_MATCHER)
+    aggregates.add("1", {"department": "Legal"})
+    aggregates.add("2", {"department": "Finance"})
+
+    assert aggregates.find_departments("Compare legal with the financial team") == ["Legal", "Finance"]
+    assert aggregates.find_departments("Who leads research?") == []
+
+def test_multi_word_departments_are_kept_distinct():
+    aggregates = WorkforceAggregates(DEPARTMENT_MATCHER)
+    aggregates.add("1", {"department": "Sales Engineering"})
+    aggregates.add("2", {"department": "Engineering Operations"})
+    aggregates.add("3", {"department": " engineering "})
+    aggregates.add("4", {"department": "Sales"})
+
+    assert aggregates.departments["Sales Engineering"].count == 1
+    assert aggregates.departments["Engineering Operations"].count == 1
+    assert aggregates.departments["Engineering"].count == 1
+    assert aggregates.find_departments("How does sales engineering compare to sales?") == ["Sales Engineering", "Sales"]
+
+def test_canonical_department_maps_whole_names_only():
+    assert canonical_department("Human  Resources") == "HR"
+    assert canonical_department(" ops ") == "Operations"
+    assert canonical_department("Sales Engineering") == "Sales Engineering"
+    assert canonical_department("Engineering Operations") == "Engineering Operations"
@@ -1,8 +1,131 @@
 import chromadb
 from chromadb.config import Settings
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import json
+import re
+from profile_storage import list_section_key, section_refs
+
+# Boolean operators of a filter tree and the optional per-node ranking weight
+FILTER_OPERATORS = ("$and", "$or")
+FILTER_WEIGHT_KEY = "$weight"
+
+# Profile chunks fetched per requested employee in search_employees (several
+# chunks of the same employee are common)
+SEARCH_CHUNKS_PER_RESULT = 2
+
+def _matches_condition(condition: Any, value: Any) -> bool:
+    """Evaluate one field condition (exact value, $eq, $ne, $in, $nin or $regex) against a metadata value."""
+    if not isinstance(condition, dict):
+        return str(value) == str(condition)
+
+    text = "" if value is None else str(value)
+    for operator, operand in condition.items():
+        if operator == "$regex":
+            try:
+                if not re.search(operand, text, re.IGNORECASE):
+                    return False
+            except re.error:
+                if operand.replace('.*', '').lower() not in text.lower():
+                    return False
+        elif operator == "$eq":
+            if text != str(operand):
+                return False
+        elif operator == "$ne":
+            if text == str(operand):
+                return False
+        elif operator == "$in":
+            if text not in [str(item) for item in operand]:
+                return False
+        elif operator == "$nin":
+            if text in [str(item) for item in operand]:
+                return False
+        elif operator != FILTER_WEIGHT_KEY:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+    return True
+
+def evaluate_filter(node: Dict[str, Any], metadata: Dict[str, Any]) -> Tuple[bool, float]:
+    """
+    Evaluate a filter tree against chunk metadata.
+
+    Fields listed side by side in one node must all match ("$and" semantics,
+    which keeps flat filter dictionaries working). The score sums the weights
+    of the matched conditions, so a chunk matching two OR-ed traits ranks
+    above one matching a single trait.
+
+    Args:
+        node: Filter tree node
+        metadata: Metadata of one chunk
+
+    Returns:
+        Tuple of (matched, score)
+    """
+    score = 0.0
+
+    for key, condition in node.items():
+        if key == FILTER_WEIGHT_KEY:
+            continue
+        if key == "$and":
+            for child in condition:
+                child_matched, child_score = evaluate_filter(child, metadata)
+                if not child_matched:
+                    return False, 0.0
+                score += child_score
+        elif key == "$or":
+            any_matched = False
+            for child in condition:
+                child_matched, child_score = evaluate_filter(child, metadata)
+                if child_matched:
+                    any_matched = True
+                    score += child_score
+            if not any_matched:
+                return False, 0.0
+        else:
+            if not _matches_condition(condition, metadata.get(key)):
+                return False, 0.0
+            weight = condition.get(FILTER_WEIGHT_KEY, 1.0) if isinstance(condition, dict) else 1.0
+            score += weight
+
+    return True, score * node.get(FILTER_WEIGHT_KEY, 1.0)
+
+def _section_refs_of(profile_sections) -> List[str]:
+    """Section refs of a profile's sections, as EmployeeDatabase names them in its history."""
+    return section_refs([list_section_key(section, i) for i, section in enumerate(profile_sections)])
+
+def native_where(node: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Extract the part of a filter tree that Chroma can evaluate in a `where` clause.
+
+    Only conditions that are required for every match (top level or nested
+    "$and") and that use exact values, "$eq", "$ne", "$in" or "$nin" are
+    pushed down; the result is a necessary, not sufficient, condition.
+
+    Returns:
+        Chroma where clause, or None if nothing can be pushed down
+    """
+    conditions = []
+
+    def collect(current: Dict[str, Any]):
+        for key, condition in current.items():
+            if key == "$and":
+                for child in condition:
+                    collect(child)
+            elif key == "$or" or key == FILTER_WEIGHT_KEY:
+                continue
+            elif isinstance(condition, dict):
+                # Chroma takes one operator per field condition
+                for operator, operand in condition.items():
+                    if operator in ("$eq", "$ne", "$in", "$nin"):
+                        conditions.append({key: {operator: operand}})
+            elif isinstance(condition, (str, int, float, bool)):
+                conditions.append({key: condition})
+
+    collect(node)
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
 
 class VectorStore:
     def __init__(self):
@@ -152,6 +275,7 @@ class VectorStore:
         documents = []
         metadatas = []
         ids = []
+        refs = _section_refs_of(profile_sections)
         
         for i, section in enumerate(profile_sections):
             # Convert section to JSON string if it's not already
@@ -166,7 +290,8 @@ class VectorStore:
             # Create metadata for this section
             section_metadata = {
                 "employee_id": employee_id,
-                "section_id": i
+                "section_id": i,
+                "section_ref": refs[i]
             }
             
             # Add employee metadata if provided
@@ -188,6 +313,91 @@ class VectorStore:
             ids=ids
         )
     
+    def update_employee_sections(self, employee_id: str, profile_sections: List[Dict[str, Any]],
+                                 changed_sections: List[str], metadata: Dict[str, Any] = None):
+        """
+        Re-embed only the profile sections that changed since the last store.
+
+        Unchanged sections just get their metadata refreshed, which does not
+        require new embeddings. Chunk ids are positional, so this falls back to
+        a full store unless the stored chunks hold the same sections in the
+        same order (e.g. after sections were added, removed or reordered), and
+        for profiles that are not a list of sections.
+
+        Args:
+            employee_id: Unique identifier for the employee
+            profile_sections: The employee's current list of profile section dictionaries
+            changed_sections: Section refs reported by EmployeeDatabase.get_changed_sections
+            metadata: Additional metadata about the employee
+        """
+        if not isinstance(profile_sections, list):
+            self.store_employee_profile(employee_id, profile_sections, metadata)
+            return
+
+        # Name sections the way the employee database does, so repeated names match
+        refs = _section_refs_of(profile_sections)
+
+        existing = self.employee_profiles_collection.get(where={"employee_id": employee_id}, include=["metadatas"])
+        stored_refs = {
+            chunk_id: (chunk_metadata or {}).get("section_ref")
+            for chunk_id, chunk_metadata in zip(existing.get('ids') or [], existing.get('metadatas') or [])
+        }
+        if stored_refs != {f"{employee_id}_{i}": ref for i, ref in enumerate(refs)}:
+            self.store_employee_profile(employee_id, profile_sections, metadata)
+            return
+
+        changed_sections = set(changed_sections)
+
+        changed_documents = []
+        changed_metadatas = []
+        changed_ids = []
+        unchanged_metadatas = []
+        unchanged_ids = []
+
+        for i, (section, ref) in enumerate(zip(profile_sections, refs)):
+            # Convert section to JSON string if it's not already
+            if isinstance(section, dict):
+                section_text = json.dumps(section)
+            else:
+                section_text = section
+
+            # Create metadata for this section
+            section_metadata = {
+                "employee_id": employee_id,
+                "section_id": i,
+                "section_ref": ref
+            }
+
+            # Add employee metadata if provided
+            if metadata:
+                for key, value in metadata.items():
+                    # Handle list values by concatenating them
+                    if isinstance(value, list):
+                        section_metadata[key] = ", ".join(str(item) for item in value)
+                    else:
+                        section_metadata[key] = value
+
+            if ref in changed_sections:
+                changed_documents.append(section_text)
+                changed_metadatas.append(section_metadata)
+                changed_ids.append(f"{employee_id}_{i}")
+            else:
+                unchanged_metadatas.append(section_metadata)
+                unchanged_ids.append(f"{employee_id}_{i}")
+
+        if changed_ids:
+            self.employee_profiles_collection.upsert(
+                documents=changed_documents,
+                metadatas=changed_metadatas,
+                ids=changed_ids
+            )
+
+        if unchanged_ids:
+            self.employee_profiles_collection.update(
+                metadatas=unchanged_metadatas,
+                ids=unchanged_ids
+            )
+
     def store_employee_documents(self, employee_id: str, documents: List[str], metadata: Dict[str, Any] = None):
         """
         Store an employee's raw document chunks for detailed citations.
@@ -245,6 +455,16 @@ class VectorStore:
             where={"employee_id": employee_id}
         )
     
+    def get_employee_ids(self) -> set:
+        """Get the IDs of all employees that have entries in the employee collections."""
+        employee_ids = set()
+        for collection in (self.employee_profiles_collection, self.employee_documents_collection):
+            entries = collection.get(include=["metadatas"])
+            for metadata in entries.get('metadatas') or []:
+                if metadata and metadata.get('employee_id'):
+                    employee_ids.add(metadata['employee_id'])
+        return employee_ids
+
     def batch_store_employee_profiles(self, employee_data_list: List[Dict[str, Any]]):
         """
         Store multiple employee profiles in batch for much better performance.
@@ -273,6 +493,7 @@ class VectorStore:
                 metadata = employee_data.get('metadata', {})
                 
                 # Process each profile section
+                refs = _section_refs_of(profile_data)
                 for section_idx, section in enumerate(profile_data):
                     # Convert section to JSON string if it's not already
                     if isinstance(section, dict):
@@ -283,7 +504,8 @@ class VectorStore:
                     # Create metadata for this section
                     section_metadata = {
                         "employee_id": employee_id,
-                        "section_id": section_idx
+                        "section_id": section_idx,
+                        "section_ref": refs[section_idx]
                     }
                     
                     # Add employee metadata if provided
@@ -321,113 +543,144 @@ class VectorStore:
         """
         Search for employees based on a natural language query and optional filters.
         
+        Filters are either a flat dictionary (every key must match) or a boolean
+        tree built from "$and"/"$or" nodes, as produced by
+        QueryProcessor.convert_to_filters. Conditions Chroma can evaluate
+        (exact values and "$in") are pushed into the vector query itself; the
+        rest ("$regex") are evaluated on the returned chunks.
+
         Args:
             query: Natural language query
-            filters: Dictionary of metadata filters
+            filters: Dictionary of metadata filters or filter tree
             n_results: Maximum number of results to return
             
         Returns:
-            List of results with employee_id and matched text
+            List of results with employee_id and matched text, best matches first
         """
         print(f"DEBUG: Searching with query: '{query}', filters: {filters}")
-        
+
+        chunks = self.search_employee_chunks(query, n_results * SEARCH_CHUNKS_PER_RESULT, filters)
+        if chunks is None:
+            return []
+        return self.rank_employee_chunks(chunks, filters)
+
+    def search_employee_chunks(self, query: str, n_chunks: int,
+                               filters: Dict[str, Any] = None) -> Optional[List[Tuple[str, Dict[str, Any]]]]:
+        """
+        Profile chunks nearest to a query, for search_employees.
+
+        The nearest n chunks are a prefix of the nearest m > n chunks, so one
+        large search can stand in for smaller ones: ranking its first
+        n_results * SEARCH_CHUNKS_PER_RESULT chunks with rank_employee_chunks
+        gives what search_employees(query, n_results=n_results) returns.
+
+        Args:
+            query: Natural language query
+            n_chunks: Number of chunks to fetch
+            filters: Dictionary of metadata filters or filter tree; only the
+                conditions Chroma supports natively are applied here
+
+        Returns:
+            List of (document, metadata) tuples, nearest first; fewer than
+            n_chunks only when the collection has fewer chunks (or matches).
+            None if the search failed
+        """
         try:
             # Check if employee collection exists and has data
-            collection_info = self.employee_profiles_collection.get()
-            print(f"DEBUG: Collection info - count: {len(collection_info.get('ids', []))}")
-            
-            # Execute search without filters first to get semantic matches
-            results = self.employee_profiles_collection.query(
-                query_texts=[query],
-                n_results=n_results * 2  # Get more results initially to filter later
-            )
-            
+            collection_count = self.employee_profiles_collection.count()
+            print(f"DEBUG: Collection info - count: {collection_count}")
+            if collection_count == 0:
+                return []
+
+            # Narrow the semantic search with the conditions Chroma supports natively
+            where = native_where(filters) if filters else None
+            query_args = {
+                "query_texts": [query],
+                "n_results": min(n_chunks, collection_count)
+            }
+            try:
+                results = self.employee_profiles_collection.query(**query_args, **({"where": where} if where else {}))
+            except Exception as e:
+                # Filtered HNSW queries can fail when few chunks match; the
+                # complete filter is applied by rank_employee_chunks either way
+                print(f"DEBUG: Native filter {where} failed ({str(e)}), searching unfiltered")
+                results = self.employee_profiles_collection.query(**query_args)
+
             print(f"DEBUG: Initial search results - docs found: {len(results.get('documents', [[]])[0])}")
-            
-            # If we have filters, apply them manually to the results
-            if filters and results['documents'] and len(results['documents'][0]) > 0:
-                print(f"DEBUG: Applying filters: {filters}")
-                # Filter the results based on the metadata
-                filtered_docs = []
-                filtered_metadata = []
-                filtered_ids = []
-                filtered_distances = []
-                
-                for i, doc in enumerate(results['documents'][0]):
-                    metadata = results['metadatas'][0][i]
-                    doc_id = results['ids'][0][i]
-                    distance = results['distances'][0][i] if 'distances' in results else 0
-                    
-                    print(f"DEBUG: Checking result {i}, metadata: {metadata}")
-                    
-                    # Check if this result matches all filters
-                    matches_all_filters = True
-                    
-                    for key, value in filters.items():
-                        # Handle regex pattern filters
-                        if isinstance(value, dict) and '$regex' in value:
-                            pattern = value['$regex'].replace('.*', '')  # Extract the core pattern
-                            metadata_value = str(metadata.get(key, ''))
-                            print(f"DEBUG: Regex check - key: {key}, pattern: {pattern}, value: {metadata_value}")
-                            if pattern.lower() not in metadata_value.lower():
-                                matches_all_filters = False
-                                print(f"DEBUG: Failed regex match for {key}")
-                                break
-                        # Handle exact match filters
-                        elif str(metadata.get(key, '')) != str(value):
-                            matches_all_filters = False
-                            print(f"DEBUG: Failed exact match for {key}")
-                            break
-                    
-                    if matches_all_filters:
-                        print(f"DEBUG: Result {i} matches all filters")
-                        filtered_docs.append(doc)
-                        filtered_metadata.append(metadata)
-                        filtered_ids.append(doc_id)
-                        if 'distances' in results:
-                            filtered_distances.append(distance)
-                
-                # Replace results with filtered results
-                filtered_results = {
-                    'documents': [filtered_docs],
-                    'metadatas': [filtered_metadata],
-                    'ids': [filtered_ids],
-                }
-                if 'distances' in results:
-                    filtered_results['distances'] = [filtered_distances]
-                
-                results = filtered_results
-                print(f"DEBUG: After filtering - docs found: {len(results.get('documents', [[]])[0])}")
-            
-            # Process results to group by employee
-            employee_results = {}
-            
-            if results['documents'] and len(results['documents'][0]) > 0:
-                for i, doc in enumerate(results['documents'][0]):
-                    metadata = results['metadatas'][0][i]
-                    employee_id = metadata.get('employee_id')
-                    
-                    if employee_id not in employee_results:
-                        employee_results[employee_id] = {
-                            'employee_id': employee_id,
-                            'match_count': 0,
-                            'matches': [],
-                            'metadata': metadata
-                        }
-                    
-                    # Add this match
-                    employee_results[employee_id]['matches'].append(doc)
-                    employee_results[employee_id]['match_count'] += 1
-            
-            # Convert to list and sort by match count
-            result_list = list(employee_results.values())
-            result_list.sort(key=lambda x: x['match_count'], reverse=True)
-            
-            print(f"DEBUG: Final result count: {len(result_list)}")
-            return result_list
-            
+
+            if not results['documents'] or not results['documents'][0]:
+                return []
+            return list(zip(results['documents'][0], results['metadatas'][0]))
+
         except Exception as e:
             print(f"DEBUG: Error in search_employees: {str(e)}")
             import traceback
             traceback.print_exc()
-            return [] 
\ No newline at end of file
+            return None
+
+    def rank_employee_chunks(self, chunks: List[Tuple[str, Dict[str, Any]]],
+                             filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        Group chunks from search_employee_chunks by employee, applying the full filter tree.
+
+        Returns:
+            List of results with employee_id and matched text, ranked by how
+            well the filters matched, then by match count
+        """
+        employee_results = {}
+
+        for doc, metadata in chunks:
+            filter_score = 0.0
+            if filters:
+                matched, filter_score = evaluate_filter(filters, metadata)
+                if not matched:
+                    continue
+
+            employee_id = metadata.get('employee_id')
+
+            if employee_id not in employee_results:
+                employee_results[employee_id] = {
+                    'employee_id': employee_id,
+                    'match_count': 0,
+                    'filter_score': filter_score,
+                    'matches': [],
+                    'metadata': metadata
+                }
+
+            # Add this match
+            employee_results[employee_id]['matches'].append(doc)
+            employee_results[employee_id]['match_count'] += 1
+
+        # Convert to list and sort by how well the filters matched, then by match count
+        result_list = list(employee_results.values())
+        result_list.sort(key=lambda x: (x['filter_score'], x['match_count']), reverse=True)
+
+        print(f"DEBUG: Final result count: {len(result_list)}")
+        return result_list
+
+    def filter_search_results(self, results: List[Dict[str, Any]],
+                              filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Apply filters to results of an earlier (e.g. unfiltered) search_employees call.
+
+        Every chunk of an employee carries the same employee metadata, so
+        filtering the grouped results matches filtering the chunks.
+
+        Args:
+            results: Results returned by search_employees
+            filters: Dictionary of metadata filters or filter tree
+
+        Returns:
+            Matching results ranked like search_employees would rank them
+        """
+        if not filters:
+            return list(results)
+
+        filtered = []
+        for result in results:
+            matched, filter_score = evaluate_filter(filters, result['metadata'])
+            if matched:
+                filtered.append(dict(result, filter_score=filter_score))
+
+        filtered.sort(key=lambda x: (x['filter_score'], x['match_count']), reverse=True)
+        return filtered
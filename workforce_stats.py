@@ -0,0 +1,230 @@
+import re
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+
+# Metadata list fields counted in the distributions, with their labels
+DISTRIBUTION_FIELDS = {
+    "traits": "Traits",
+    "leadership_style": "Leadership styles",
+    "roles": "Suggested roles"
+}
+
+# Department of employees whose metadata has none
+UNASSIGNED_DEPARTMENT = "Unassigned"
+
+# Cluster of employees without an identified leadership style
+NO_STYLE_CLUSTER = "No identified leadership style"
+
+# Bounds of the rendered summary, so it costs about the same number of tokens
+# for ten employees as for ten thousand
+SUMMARY_TOP_VALUES = 8  # Values per distribution
+SUMMARY_GROUP_VALUES = 3  # Values per distribution of a department or cluster
+SUMMARY_MAX_DEPARTMENTS = 12
+SUMMARY_MAX_CLUSTERS = 6
+SUMMARY_VALUE_CHARS = 60  # Roles are free text; longer values are shortened
+
+class _Rollup:
+    """Employee count and value distributions of a group of employees."""
+
+    def __init__(self):
+        self.count = 0
+        self.values = {field: Counter() for field in DISTRIBUTION_FIELDS}
+        self.departments = Counter()
+        self.clusters = Counter()
+
+    def apply(self, contribution: Dict[str, Any], sign: int):
+        self.count += sign
+        for field, values in contribution["values"].items():
+            _adjust(self.values[field], values, sign)
+        _adjust(self.departments, [contribution["department"]], sign)
+        _adjust(self.clusters, [contribution["cluster"]], sign)
+
+def _adjust(counter: Counter, keys, sign: int):
+    for key in keys:
+        counter[key] += sign
+        if counter[key] <= 0:
+            del counter[key]
+
+def _shorten(value: str) -> str:
+    return value if len(value) <= SUMMARY_VALUE_CHARS else value[:SUMMARY_VALUE_CHARS - 3].rstrip() + "..."
+
+def _format_counts(counter: Counter, total: int, limit: int) -> str:
+    if not counter:
+        return "none recorded"
+    return ", ".join(
+        f"{_shorten(str(value))} {count} ({count / total:.0%})" for value, count in counter.most_common(limit)
+    )
+
+class WorkforceAggregates:
+    """
+    Population statistics over employee metadata, kept up to date per change.
+
+    Each employee contributes its traits, leadership styles and suggested roles
+    to organisation-wide distributions, to a rollup of its department and to a
+    cluster of employees with the same combination of leadership styles. Adding,
+    updating or removing an employee only touches that employee's contribution,
+    so the statistics never need a scan over all profiles.
+
+    Not thread-safe; EmployeeDatabase updates and reads it under its lock.
+    """
+
+    def __init__(self, department_matcher=None):
+        """
+        Args:
+            department_matcher: KeywordMatcher from department names and synonyms
+                to canonical department names; departments are counted and
+                found under their canonical name when given
+        """
+        self.department_matcher = department_matcher
+        self._reset()
+
+    def _reset(self):
+        self._contributions: Dict[str, Dict[str, Any]] = {}
+        self.total = _Rollup()
+        self.departments: Dict[str, _Rollup] = {}
+        self.clusters: Dict[str, _Rollup] = {}
+        self._summary_cache: Dict[Optional[str], str] = {}
+
+    def __len__(self) -> int:
+        return self.total.count
+
+    def _canonical_department(self, department: str) -> str:
+        # Whole names only: "Sales Engineering" is not Sales or Engineering
+        if self.department_matcher is not None:
+            found = self.department_matcher.lookup(department)
+            if found:
+                return found[0]
+        return department
+
+    def _contribution(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        values = {}
+        for field in DISTRIBUTION_FIELDS:
+            raw_values = metadata.get(field) or []
+            if isinstance(raw_values, str):
+                raw_values = [raw_values]
+            values[field] = sorted({str(value).strip() for value in raw_values if str(value).strip()})
+
+        department = self._canonical_department(str(metadata.get("department") or "").strip() or UNASSIGNED_DEPARTMENT)
+        cluster = " + ".join(values["leadership_style"]) or NO_STYLE_CLUSTER
+        return {"values": values, "department": department, "cluster": cluster}
+
+    def _apply(self, contribution: Dict[str, Any], sign: int):
+        self.total.apply(contribution, sign)
+        for groups, key in ((self.departments, contribution["department"]),
+                            (self.clusters, contribution["cluster"])):
+            rollup = groups.setdefault(key, _Rollup())
+            rollup.apply(contribution, sign)
+            if rollup.count <= 0:
+                del groups[key]
+        self._summary_cache.clear()
+
+    def add(self, employee_id: str, metadata: Dict[str, Any]):
+        """Count an employee, replacing its previous contribution if any."""
+        self.remove(employee_id)
+        contribution = self._contribution(metadata)
+        self._contributions[employee_id] = contribution
+        self._apply(contribution, 1)
+
+    def remove(self, employee_id: str):
+        """Stop counting an employee."""
+        contribution = self._contributions.pop(employee_id, None)
+        if contribution is not None:
+            self._apply(contribution, -1)
+
+    def rebuild(self, profile_index: Dict[str, Dict[str, Any]]):
+        """Recount from an EmployeeDatabase index (employee_id -> entry with 'metadata')."""
+        self._reset()
+        for employee_id, entry in profile_index.items():
+            self.add(employee_id, entry.get("metadata") or {})
+
+    def find_departments(self, text: str) -> List[str]:
+        """
+        Departments named or referred to by a synonym in a text, in order of appearance.
+
+        A mention inside a longer department name ("Sales" in "Sales Engineering")
+        does not count as a mention of the shorter one.
+        """
+        spans = []  # (start, end, department)
+        if self.department_matcher is not None:
+            for start, end, labels in self.department_matcher.find_spans(text):
+                spans.extend((start, end, department) for department in labels if department in self.departments)
+        # Stored names, including those outside the matcher's vocabulary (whole words, any case)
+        for department in self.departments:
+            for match in re.finditer(r"\b" + re.escape(department) + r"\b", text, re.IGNORECASE):
+                spans.append((match.start(), match.end(), department))
+
+        found = {}
+        for start, end, department in sorted(spans):
+            if any(other_start <= start and end <= other_end and other_end - other_start > end - start
+                   for other_start, other_end, _ in spans):
+                continue
+            found.setdefault(department, start)
+        return sorted(found, key=lambda department: (found[department], department))
+
+    def format_summary(self, department: Optional[str] = None) -> str:
+        """
+        Render the statistics as compact prompt text.
+
+        Args:
+            department: Describe this department (with its share of the
+                organisation) instead of the whole organisation
+
+        Returns:
+            Summary text of bounded length, "" if there is nothing to describe
+        """
+        if department not in self._summary_cache:
+            self._summary_cache[department] = self._render(department)
+        return self._summary_cache[department]
+
+    def _render(self, department: Optional[str]) -> str:
+        total = self.total.count
+        if department is not None:
+            rollup = self.departments.get(department)
+            if rollup is None:
+                return ""
+            title = (f"DEPARTMENT STATISTICS - {department}: {rollup.count} of {total} employees "
+                     f"({rollup.count / total:.0%} of the organization)")
+        else:
+            rollup = self.total
+            if not total:
+                return ""
+            title = f"ORGANIZATION STATISTICS (all {total} employees in the database)"
+
+        lines = [title]
+        for field, label in DISTRIBUTION_FIELDS.items():
+            lines.append(f"{label}: {_format_counts(rollup.values[field], rollup.count, SUMMARY_TOP_VALUES)}")
+
+        if department is None:
+            lines.append("Departments:")
+            lines.extend(self._format_departments())
+
+        # Clusters within the department are counted by its rollup; describe the global ones
+        cluster_counts = rollup.clusters
+        clusters = {name: self.clusters[name] for name, _ in cluster_counts.most_common(SUMMARY_MAX_CLUSTERS)}
+        lines.append("Leadership profiles (employees sharing the same combination of leadership styles):")
+        for name, cluster in clusters.items():
+            lines.append(
+                f"- {name}: {cluster_counts[name]} employees"
+                + ("" if department is None else f" here, {cluster.count} organization-wide")
+                + f"; departments: {_format_counts(cluster.departments, cluster.count, SUMMARY_GROUP_VALUES)}"
+                + f"; traits: {_format_counts(cluster.values['traits'], cluster.count, SUMMARY_GROUP_VALUES)}"
+            )
+        if len(cluster_counts) > len(clusters):
+            others = sum(cluster_counts.values()) - sum(cluster_counts[name] for name in clusters)
+            lines.append(f"- ({len(cluster_counts) - len(clusters)} smaller profiles with {others} employees)")
+
+        return "\n".join(lines)
+
+    def _format_departments(self) -> List[str]:
+        ranked: List[Tuple[str, _Rollup]] = sorted(self.departments.items(),
+                                                   key=lambda item: (-item[1].count, item[0]))
+        lines = [
+            f"- {name}: {group.count} employees"
+            f"; traits: {_format_counts(group.values['traits'], group.count, SUMMARY_GROUP_VALUES)}"
+            f"; leadership styles: {_format_counts(group.values['leadership_style'], group.count, SUMMARY_GROUP_VALUES)}"
+            for name, group in ranked[:SUMMARY_MAX_DEPARTMENTS]
+        ]
+        if len(ranked) > SUMMARY_MAX_DEPARTMENTS:
+            others = sum(group.count for _, group in ranked[SUMMARY_MAX_DEPARTMENTS:])
+            lines.append(f"- ({len(ranked) - SUMMARY_MAX_DEPARTMENTS} smaller departments with {others} employees)")
+        return lines